@@ -1,2 +1,4 @@
 from . import models
-from . import wizzards
\ No newline at end of file
+from . import wizzards
+from . import controllers
+from .hooks import pre_init_hook, post_init_hook
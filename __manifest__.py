@@ -9,14 +9,23 @@
         # Seguridad
         'security/ir.model.access.csv',
         
+        # Datos
+        'data/ir_cron.xml',
+        'data/libro_dte_pattern_data.xml',
+
         # Acciones (wizards, menús, etc.) - ANTES de las vistas
         'wizzards/libro_rectify_wizard_views.xml',
         'actions/libro_compras_action.xml',
         'actions/libro_ventas_action.xml',
+        'wizzards/libro_batch_wizard_views.xml',
         
         # Vistas
         'views/libro_compras_views.xml',
         'views/libro_ventas_views.xml',
+        'views/account_tax_views.xml',
+        'views/libro_dte_pattern_views.xml',
+        'views/libro_generation_profile_views.xml',
+        'views/libro_classification_rule_views.xml',
 
         # Paperformats
         'reports/paperformat.xml',
@@ -25,6 +34,8 @@
         'reports/libro_compras_report.xml',
         'reports/libro_ventas_report.xml',
     ],
+    'pre_init_hook': 'pre_init_hook',
+    'post_init_hook': 'post_init_hook',
     'installable': True,
     'application': False,
     'license': 'LGPL-3',
@@ -0,0 +1,317 @@
+"""Benchmark de generación, exportación e impresión de los Libros de IVA.
+
+Genera un conjunto sintético (compañía, clientes/proveedores, impuestos y
+facturas válidas/anuladas, DTE e impresas) y mide cada etapa de los libros
+de compras y de ventas: tiempo, consultas SQL y memoria máxima. El resultado
+queda en un JSON para comparar versiones.
+
+Usar SIEMPRE en una base de datos desechable: el benchmark hace commit de
+los datos y de cada etapa (el PDF por tramos lee con cursores propios).
+
+Ejecución, desde ``odoo-bin shell``::
+
+    odoo-bin shell -d libros_bench --no-http <<'EOF'
+    from odoo.addons.libros_fiscales.benchmarks import libro_benchmark
+    libro_benchmark.run(env, documents=10000, output='bench_10k.json')
+    EOF
+
+El conjunto se crea una sola vez por tamaño (compañía "Libros Benchmark
+<N>") y se reutiliza en las siguientes corridas. Para comparar dos
+resultados no hace falta Odoo::
+
+    python benchmarks/libro_benchmark.py antes.json despues.json
+"""
+import json
+import logging
+import random
+import resource
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+
+_logger = logging.getLogger(__name__)
+
+
+class BenchmarkRecorder:
+    """Acumula las mediciones de cada etapa: tiempo, consultas y memoria."""
+
+    def __init__(self, env, trace_memory=False):
+        self.env = env
+        self.trace_memory = trace_memory
+        self.results = []
+
+    @contextmanager
+    def measure(self, book, stage, **extra):
+        cr = self.env.cr
+        queries = cr.sql_log_count
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.env.flush_all()
+            seconds = time.perf_counter() - start
+            result = dict(
+                extra,
+                book=book,
+                stage=stage,
+                seconds=round(seconds, 4),
+                queries=cr.sql_log_count - queries,
+                # Máximo del proceso (KB en Linux); crece, no se reinicia por etapa
+                peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            )
+            if self.trace_memory:
+                result['peak_python_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+                tracemalloc.stop()
+            self.results.append(result)
+            _logger.info("benchmark %s/%s: %.3fs, %s consultas", book, stage, seconds, result['queries'])
+
+
+# ----------------- DATOS SINTÉTICOS -----------------
+
+def _random_nit(rng):
+    return '%014d' % rng.randrange(10 ** 13, 10 ** 14)
+
+
+def _dte_values(rng, tipo, number):
+    codigo = str(uuid.UUID(int=rng.getrandbits(128))).upper()
+    return {
+        'tgr_l10n_sv_edi_codigo_generacion': codigo,
+        'tgr_l10n_sv_edi_numero_control': 'DTE-%s-M001P001-%015d' % (tipo, number),
+        'tgr_l10n_sv_edi_sello_recibido': '%04d%s' % (date.today().year, uuid.UUID(int=rng.getrandbits(128)).hex.upper()),
+    }
+
+
+def _get_or_create_company(env, documents):
+    name = 'Libros Benchmark %s' % documents
+    company = env['res.company'].search([('name', '=', name)], limit=1)
+    if company:
+        return company, False
+    company = env['res.company'].create({'name': name, 'country_id': env.ref('base.sv').id})
+    env['account.chart.template'].try_loading(env.company.chart_template or 'generic_coa', company, install_demo=False)
+    return company, True
+
+
+def _create_taxes(env, company):
+    Tax = env['account.tax'].with_company(company)
+    common = {'company_id': company.id, 'amount_type': 'percent'}
+    return {
+        'venta': Tax.create(dict(common, name='IVA 13% Ventas (bench)', type_tax_use='sale', amount=13)),
+        'venta_incluido': Tax.create(dict(common, name='IVA 13% Incluido (bench)', type_tax_use='sale', amount=13,
+                                          price_include_override='tax_included')),
+        'venta_exento': Tax.create(dict(common, name='Exento Ventas (bench)', type_tax_use='sale', amount=0,
+                                        libro_clasificacion='exento')),
+        'compra': Tax.create(dict(common, name='IVA 13% Compras (bench)', type_tax_use='purchase', amount=13)),
+        'compra_exento': Tax.create(dict(common, name='Exento Compras (bench)', type_tax_use='purchase', amount=0,
+                                         libro_clasificacion='exento')),
+    }
+
+
+def _create_partners(env, company, count, rng):
+    has_nrc = 'l10n_sv_nrc' in env['res.partner']._fields
+    vals_list = []
+    for index in range(count):
+        vals = {'name': 'Contacto Benchmark %05d' % index, 'vat': _random_nit(rng), 'company_id': company.id}
+        if has_nrc:
+            vals['l10n_sv_nrc'] = '%07d' % rng.randrange(10 ** 6, 10 ** 7)
+        vals_list.append(vals)
+    return env['res.partner'].create(vals_list)
+
+
+def generate_dataset(env, documents=1000, year=None, month=1, dte_ratio=0.8, cancelled_ratio=0.05,
+                     batch_size=1000, seed=0):
+    """Crear (o reutilizar) el conjunto sintético de ``documents`` facturas.
+
+    Mitad ventas (consumidor final y crédito fiscal) y mitad compras, todas
+    en el mes indicado. ``dte_ratio`` son documentos electrónicos; el resto,
+    impresos. ``cancelled_ratio`` de las ventas se anula tras publicarse.
+
+    :return: la compañía del conjunto
+    """
+    year = year or date.today().year - 1
+    company, created = _get_or_create_company(env, documents)
+    if not created:
+        _logger.info("benchmark: reutilizando %s", company.name)
+        return company
+
+    rng = random.Random(seed)
+    env = env(context=dict(env.context, tracking_disable=True, mail_create_nolog=True, mail_notrack=True))
+    taxes = _create_taxes(env, company)
+    partners = _create_partners(env, company, max(10, documents // 50), rng)
+    doc_types = {
+        doc_type.code: doc_type.id
+        for doc_type in env['l10n_latam.document.type'].search([('code', 'in', ['01', '03', '05'])])
+    }
+    Move = env['account.move'].with_company(company)
+    days = (date(year + month // 12, month % 12 + 1, 1) - date(year, month, 1)).days
+
+    def invoice_vals(number):
+        kind = ('consumidor', 'credito', 'compra', 'compra')[number % 4]
+        is_dte = rng.random() < dte_ratio
+        amount = round(rng.uniform(1, 5000), 2)
+        exento = rng.random() < 0.1
+        invoice_date = date(year, month, rng.randrange(1, days + 1))
+        if kind == 'compra':
+            tipo = '03'
+            tax = taxes['compra_exento' if exento else 'compra']
+            vals = {'move_type': 'in_invoice', 'ref': 'CCF-%08d' % number}
+        else:
+            tipo = '01' if kind == 'consumidor' else '03'
+            tax = taxes['venta_exento' if exento else ('venta_incluido' if kind == 'consumidor' else 'venta')]
+            vals = {'move_type': 'out_invoice'}
+            if tipo in doc_types:
+                vals['l10n_latam_document_type_id'] = doc_types[tipo]
+        if is_dte:
+            vals.update(_dte_values(rng, tipo, number))
+            if kind == 'compra':
+                vals['ref'] = vals['tgr_l10n_sv_edi_numero_control']
+        vals.update({
+            'partner_id': rng.choice(partners).id,
+            'invoice_date': invoice_date,
+            'date': invoice_date,
+            'invoice_line_ids': [(0, 0, {
+                'name': 'Línea benchmark',
+                'quantity': 1,
+                'price_unit': amount,
+                'tax_ids': [(6, 0, tax.ids)],
+            })],
+        })
+        return vals
+
+    start = time.perf_counter()
+    for offset in range(0, documents, batch_size):
+        numbers = range(offset, min(offset + batch_size, documents))
+        moves = Move.create([invoice_vals(number) for number in numbers])
+        moves.action_post()
+        to_cancel = moves.filtered(lambda m: m.move_type == 'out_invoice' and rng.random() < cancelled_ratio)
+        if to_cancel:
+            to_cancel.button_draft()
+            to_cancel.button_cancel()
+        env.cr.commit()
+        env.invalidate_all()
+        _logger.info("benchmark: %s/%s facturas creadas", offset + len(numbers), documents)
+    _logger.info("benchmark: conjunto de %s facturas en %.1fs", documents, time.perf_counter() - start)
+    return company
+
+
+# ----------------- ETAPAS -----------------
+
+def _measure_book(recorder, book, periodo):
+    """Medir las etapas de un libro y dejar cada una confirmada (commit)."""
+    env = periodo.env
+    line_model = env[periodo._libro_line_model]
+
+    def step(stage, method, *args):
+        with recorder.measure(book, stage):
+            method(*args)
+        env.cr.commit()
+        env.invalidate_all()
+
+    step('load', periodo.action_load_invoices)
+    rows = line_model.search_count([('periodo_id', '=', periodo.id)])
+    recorder.results[-1]['rows'] = rows
+    # Regeneración diferencial sin cambios en las facturas
+    step('reload', periodo.action_load_invoices)
+    step('validate', periodo._run_book_validation)
+    step('csv', _download, periodo, periodo.action_generate_csv, 'csv')
+    step('excel', _download, periodo, periodo.action_generate_excel, 'xlsx')
+    step('pdf', periodo.action_print_report)
+    step('mark_done', periodo.action_mark_done)
+    # Exportación desde la copia congelada: sin caché para medir la lectura
+    env['ir.attachment'].search([('res_model', '=', periodo._name), ('res_id', '=', periodo.id),
+                                 ('description', '=like', 'libro_export:%')]).unlink()
+    step('csv_snapshot', _download, periodo, periodo.action_generate_csv, 'csv')
+
+
+def _download(periodo, action, fmt):
+    """Botón de exportación más el envío del archivo (lo que hace el controlador)."""
+    result = action()
+    if result['url'].startswith('/libros_fiscales/export/'):
+        for _chunk in periodo._export_stream_chunks(fmt):
+            pass
+
+
+def _fresh_book(env, model, company, year, month, **extra):
+    """Libro nuevo del periodo (el de corridas anteriores se elimina)."""
+    Model = env[model].with_company(company)
+    base = {'company_id': company.id, 'year': year, 'month': '%02d' % month, **extra}
+    old = Model.search([(key, '=', value) for key, value in base.items()])
+    if old:
+        old.write({'state': 'draft'})
+        old.unlink()
+    return Model.create(base)
+
+
+def run(env, documents=1000, year=None, month=1, output=None, books=('compras', 'consumidor', 'credito'),
+        trace_memory=False, **dataset_options):
+    """Generar (o reutilizar) el conjunto y medir cada libro.
+
+    :param output: ruta del JSON de resultados; por defecto
+        ``libro_benchmark_<N>_<fecha>.json`` en el directorio actual
+    :param trace_memory: medir además el pico de memoria Python por etapa
+        (tracemalloc, hace más lentas las etapas)
+    :return: el diccionario escrito en el JSON
+    """
+    from odoo import release
+    from odoo.modules import get_manifest
+
+    year = year or date.today().year - 1
+    company = generate_dataset(env, documents, year=year, month=month, **dataset_options)
+    env.cr.commit()
+
+    recorder = BenchmarkRecorder(env, trace_memory=trace_memory)
+    for book in books:
+        if book == 'compras':
+            periodo = _fresh_book(env, 'libro.compras.periodo', company, year, month)
+        else:
+            periodo = _fresh_book(env, 'libro.ventas.periodo', company, year, month, tipo_libro=book)
+        env.cr.commit()
+        _measure_book(recorder, book, periodo)
+
+    result = {
+        'module_version': get_manifest('libros_fiscales')['version'],
+        'odoo_version': release.version,
+        'database': env.cr.dbname,
+        'documents': documents,
+        'period': '%s-%02d' % (year, month),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'results': recorder.results,
+    }
+    output = output or 'libro_benchmark_%s_%s.json' % (documents, datetime.now().strftime('%Y%m%d%H%M%S'))
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    _logger.info("benchmark: resultados en %s", output)
+    return result
+
+
+# ----------------- COMPARACIÓN -----------------
+
+def compare(before_path, after_path):
+    """Tabla de tiempos y consultas por etapa entre dos resultados."""
+    def load(path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return data, {(r['book'], r['stage']): r for r in data['results']}
+
+    before, before_rows = load(before_path)
+    after, after_rows = load(after_path)
+    lines = ['%-12s %-13s %10s %10s %8s %10s %10s' % (
+        'libro', 'etapa', before['module_version'], after['module_version'], 'cambio', 'consultas', 'después')]
+    for key, row in after_rows.items():
+        old = before_rows.get(key)
+        if not old:
+            continue
+        change = (row['seconds'] / old['seconds'] - 1) * 100 if old['seconds'] else 0.0
+        lines.append('%-12s %-13s %9.3fs %9.3fs %+7.1f%% %10s %10s' % (
+            key[0], key[1], old['seconds'], row['seconds'], change, old['queries'], row['queries']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('Uso: python libro_benchmark.py antes.json despues.json')
+    print(compare(sys.argv[1], sys.argv[2]))
@@ -0,0 +1,176 @@
+import re
+from datetime import datetime, timezone
+
+from odoo import http
+from odoo.http import request
+
+_PERIOD_RE = re.compile(r'^(\d{4})-(\d{2})$')
+_CURSOR_RE = re.compile(r'^(\d+)\.(\d+)$')
+
+
+class LibroLinesApiController(http.Controller):
+    """Lectura de las líneas de los libros para sistemas externos (BI, consolidación).
+
+    GET /libros_fiscales/api/<compras|ventas>/lines con los parámetros:
+
+    * ``fields``: columnas de la línea separadas por coma; ``partner_name``,
+      ``partner_vat`` y ``partner_l10n_sv_nrc`` traen los datos del
+      proveedor/cliente. Por defecto, todas las columnas de la línea.
+    * ``company_ids``: ids separados por coma (por defecto, las compañías del usuario).
+    * ``period_from`` / ``period_to``: ``AAAA-MM`` incluidos.
+    * ``tipo_libro``: ``consumidor`` o ``credito`` (solo ventas).
+    * ``updated_since``: fecha y hora ISO (UTC); líneas modificadas desde entonces.
+    * ``limit``: líneas por página (máximo ``_api_max_limit``).
+    * ``cursor``: el ``next_cursor`` de la respuesta anterior.
+
+    Responde ``{"lines": [...], "next_cursor": ...}``; ``next_cursor`` es
+    null en la última página.
+
+    GET /libros_fiscales/api/<compras|ventas>/removed informa las líneas
+    eliminadas (regeneración, borrado manual o del libro) con ``company_ids``,
+    ``since`` (fecha y hora ISO, UTC), ``limit`` y ``cursor``; responde
+    ``{"removed": [...], "next_cursor": ...}``.
+    """
+
+    _api_books = {
+        'compras': 'libro.compras.periodo',
+        'ventas': 'libro.ventas.periodo',
+    }
+    _api_partner_fields = ('name', 'vat', 'l10n_sv_nrc')
+    _api_default_limit = 1000
+    _api_max_limit = 10000
+
+    @http.route('/libros_fiscales/api/<string:book>/lines', type='http', auth='user', methods=['GET'])
+    def book_lines(self, book, **params):
+        if book not in self._api_books:
+            raise request.not_found()
+        try:
+            return request.make_json_response(self._read_lines(book, params))
+        except ValueError as e:
+            return request.make_json_response({'error': str(e)}, status=400)
+
+    @http.route('/libros_fiscales/api/<string:book>/removed', type='http', auth='user', methods=['GET'])
+    def book_removed_lines(self, book, **params):
+        if book not in self._api_books:
+            raise request.not_found()
+        try:
+            return request.make_json_response(self._read_removed(book, params))
+        except ValueError as e:
+            return request.make_json_response({'error': str(e)}, status=400)
+
+    def _read_lines(self, book, params):
+        Periodo = request.env[self._api_books[book]]
+        Line = request.env[Periodo._libro_line_model]
+        Line.check_access('read')
+
+        # Proyección
+        allowed = Line._api_fields()
+        requested = [name.strip() for name in (params.get('fields') or '').split(',') if name.strip()]
+        fnames, partner_fnames = [], []
+        for name in requested or allowed:
+            if name.startswith('partner_') and name[len('partner_'):] in self._api_partner_fields:
+                partner_fnames.append(name[len('partner_'):])
+            elif name in allowed:
+                fnames.append(name)
+            else:
+                raise ValueError("Campo desconocido: %s" % name)
+
+        # Filtros de libros
+        company_ids = self._company_ids(params)
+        domain = []
+        if params.get('tipo_libro'):
+            if 'tipo_libro' not in Periodo._fields:
+                raise ValueError("tipo_libro solo aplica al libro de ventas")
+            if params['tipo_libro'] not in dict(Periodo._fields['tipo_libro'].selection):
+                raise ValueError("tipo_libro inválido: %s" % params['tipo_libro'])
+            domain.append(('tipo_libro', '=', params['tipo_libro']))
+        periodo_ids = Periodo._api_search_periodo_ids(
+            company_ids,
+            self._parse_period(params.get('period_from')),
+            self._parse_period(params.get('period_to')),
+            domain,
+        )
+
+        limit = self._parse_limit(params.get('limit'))
+        rows, key = Line._api_read_page(
+            periodo_ids, fnames, partner_fnames,
+            updated_since=self._parse_datetime(params.get('updated_since')),
+            after=self._parse_cursor(params.get('cursor')),
+            limit=limit,
+        )
+        return {
+            'lines': rows,
+            'next_cursor': '%d.%d' % key if key and len(rows) == limit else None,
+        }
+
+    def _read_removed(self, book, params):
+        Line = request.env[request.env[self._api_books[book]]._libro_line_model]
+        Line.check_access('read')
+        company_ids = self._company_ids(params)
+        after = params.get('cursor')
+        if after and not after.isdigit():
+            raise ValueError("cursor inválido: %s" % after)
+        limit = self._parse_limit(params.get('limit'))
+        # Las compañías ya se validaron contra las del usuario
+        rows, key = request.env['libro.line.tombstone'].sudo()._api_read_page(
+            Line._name, company_ids,
+            since=self._parse_datetime(params.get('since'), 'since'),
+            after=int(after) if after else None,
+            limit=limit,
+        )
+        return {
+            'removed': rows,
+            'next_cursor': str(key) if key and len(rows) == limit else None,
+        }
+
+    def _company_ids(self, params):
+        user_company_ids = set(request.env.user.company_ids.ids)
+        company_ids = self._parse_ids(params.get('company_ids')) or user_company_ids
+        if not company_ids <= user_company_ids:
+            raise ValueError("Compañías no permitidas: %s" % sorted(company_ids - user_company_ids))
+        return company_ids
+
+    def _parse_ids(self, value):
+        try:
+            return {int(part) for part in (value or '').split(',') if part.strip()}
+        except ValueError:
+            raise ValueError("company_ids debe ser una lista de ids separados por coma")
+
+    def _parse_period(self, value):
+        if not value:
+            return None
+        match = _PERIOD_RE.match(value)
+        if not match or not 1 <= int(match.group(2)) <= 12:
+            raise ValueError("Periodo inválido (use AAAA-MM): %s" % value)
+        return int(match.group(1)), int(match.group(2))
+
+    def _parse_datetime(self, value, name='updated_since'):
+        if not value:
+            return None
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError("%s inválido (use fecha y hora ISO): %s" % (name, value))
+        # write_date se guarda en UTC sin zona horaria
+        if moment.tzinfo:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        return moment
+
+    def _parse_cursor(self, value):
+        if not value:
+            return None
+        match = _CURSOR_RE.match(value)
+        if not match:
+            raise ValueError("cursor inválido: %s" % value)
+        return tuple(int(part) for part in match.groups())
+
+    def _parse_limit(self, value):
+        if not value:
+            return self._api_default_limit
+        try:
+            limit = int(value)
+        except ValueError:
+            raise ValueError("limit debe ser un número entero")
+        if not 1 <= limit <= self._api_max_limit:
+            raise ValueError("limit debe estar entre 1 y %s" % self._api_max_limit)
+        return limit
@@ -0,0 +1,59 @@
+import logging
+
+from odoo import api, http
+from odoo.http import request, content_disposition
+
+_logger = logging.getLogger(__name__)
+
+
+class LibroExportController(http.Controller):
+
+    # Libros que se pueden descargar y formatos disponibles
+    _export_models = ('libro.compras.periodo', 'libro.ventas.periodo')
+    _export_formats = ('csv', 'xlsx')
+
+    @http.route('/libros_fiscales/export/<string:model>/<int:res_id>/<string:fmt>', type='http', auth='user')
+    def export_book(self, model, res_id, fmt, **kwargs):
+        """Enviar el CSV o Excel de un libro a medida que se genera (chunked).
+
+        El primer bloque se genera antes de devolver la respuesta: los errores
+        de ese tramo (sin líneas, sin permiso, openpyxl faltante y, en Excel,
+        cualquier fallo al armar el archivo) llegan como respuesta de error
+        normal. Si algo falla después de empezar a enviar, la transferencia se
+        corta sin el bloque final, así que el navegador marca la descarga como
+        fallida en vez de guardar un archivo truncado. El contenido se genera
+        con un cursor propio: el de la petición se cierra al devolver la
+        respuesta.
+        """
+        if model not in self._export_models or fmt not in self._export_formats:
+            raise request.not_found()
+        periodo = request.env[model].browse(res_id).exists()
+        if not periodo:
+            raise request.not_found()
+        periodo.check_access('read')
+        filename, mimetype = periodo._export_stream_info(fmt)
+
+        registry = request.env.registry
+        uid, context = request.env.uid, dict(request.env.context)
+
+        def generate():
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                yield from env[model].browse(res_id)._export_stream_chunks(fmt)
+
+        chunks = generate()
+        first = next(chunks, b'')
+
+        def stream():
+            yield first
+            try:
+                yield from chunks
+            except Exception:
+                _logger.exception("Exportación %s de %s(%s) interrumpida", fmt, model, res_id)
+                raise
+
+        return request.make_response(stream(), headers=[
+            ('Content-Type', mimetype),
+            ('Content-Disposition', content_disposition(filename)),
+            ('X-Content-Type-Options', 'nosniff'),
+        ])
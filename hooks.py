@@ -0,0 +1,16 @@
+from odoo.tools.sql import column_exists, create_column
+
+
+def pre_init_hook(env):
+    """Crear la columna del tipo de documento antes de cargar el modelo.
+
+    Así el ORM no calcula ``libro_tipo_documento`` factura por factura en
+    todo el historial; ``post_init_hook`` la llena con un solo UPDATE.
+    """
+    if not column_exists(env.cr, 'account_move', 'libro_tipo_documento'):
+        create_column(env.cr, 'account_move', 'libro_tipo_documento', 'varchar')
+
+
+def post_init_hook(env):
+    """Calcular el tipo de documento de todas las facturas de proveedor, ya con los patrones cargados."""
+    env['libro.dte.pattern']._backfill_tipo_documento()
@@ -1,6 +1,18 @@
+from . import account_move
+from . import account_tax
+from . import res_company
+from . import libro_dte_pattern
+from . import libro_classification_rule
+from . import libro_validation_finding
+from . import libro_generation_profile
+from . import libro_line_mixin
+from . import libro_line_tombstone
+from . import libro_periodo_mixin
 from . import libro_compras
 from . import libro_compras_line
 from . import libro_ventas_periodo
 from . import libro_ventas_line
+from . import libro_ventas_resumen_diario
+from . import libro_report
 
 __all__ = ['libro_compras', 'libro_compras_line', 'libro_ventas']
\ No newline at end of file
@@ -0,0 +1,35 @@
+from odoo import models, fields, api
+from odoo.tools.sql import create_index
+
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+
+    # Facturas que entran al Libro de Compras
+    _libro_supplier_move_types = ('in_invoice', 'in_refund')
+
+    libro_tipo_documento = fields.Char(
+        string='Tipo de Documento (Hacienda)',
+        compute='_compute_libro_tipo_documento',
+        store=True,
+        index=True,
+        help='Tipo de DTE detectado en la referencia de la factura de proveedor '
+             '(ver Libros de IVA > Configuración > Patrones de Tipo DTE).'
+    )
+
+    def init(self):
+        super().init()
+        # Búsqueda de los libros: compañía, tipo, estado y rango de fechas
+        create_index(
+            self.env.cr, 'account_move_libro_company_type_state_date_index', self._table,
+            ['company_id', 'move_type', 'state', 'invoice_date'],
+        )
+
+    @api.depends('move_type', 'ref', 'name')
+    def _compute_libro_tipo_documento(self):
+        Pattern = self.env['libro.dte.pattern']
+        for move in self:
+            if move.move_type in self._libro_supplier_move_types:
+                move.libro_tipo_documento = Pattern._detect_tipo_documento(move.ref, move.name)
+            else:
+                move.libro_tipo_documento = False
@@ -0,0 +1,61 @@
+from odoo import models, fields, api, tools
+
+
+class AccountTax(models.Model):
+    _inherit = 'account.tax'
+
+    # Campos que cambian el mapa de clasificación (ver _libro_tax_classification);
+    # editar otros campos del impuesto no invalida la caché
+    _libro_classification_fields = {
+        'libro_clasificacion', 'price_include', 'price_include_override', 'amount', 'amount_type',
+        'tax_group_id', 'type_tax_use', 'active', 'company_id',
+    }
+
+    libro_clasificacion = fields.Selection([
+        ('exento', 'Exento'),
+        ('gravado', 'Gravado'),
+        ('incluido', 'Gravado (IVA incluido en precio)'),
+        ('exportacion', 'Exportación (tasa cero)'),
+        ('no_sujeto', 'No Sujeto'),
+    ], string='Clasificación en Libros de IVA',
+        help='Cómo se reportan en el Libro de Ventas las facturas con este impuesto. '
+             'Si se deja vacío: "IVA incluido" cuando el impuesto está incluido en el '
+             'precio y "Gravado" en los demás casos.')
+
+    def _libro_classify(self):
+        """Clasificación de un impuesto para el Libro de Ventas."""
+        self.ensure_one()
+        if self.libro_clasificacion:
+            return self.libro_clasificacion
+        return 'incluido' if self.price_include else 'gravado'
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _libro_tax_classification(self, company_id):
+        """Mapa {tax_id: clasificación} de los impuestos de la compañía (y de
+        sus compañías padre, cuyos impuestos usan las sucursales), incluidos
+        los archivados que siguen en facturas ya publicadas.
+
+        Se calcula una vez por compañía y se invalida al crear o borrar un
+        impuesto, o al cambiar uno de ``_libro_classification_fields``. No
+        modificar el dict devuelto.
+        """
+        taxes = self.sudo().with_context(active_test=False).search([('company_id', 'parent_of', company_id)])
+        return tools.frozendict({tax.id: tax._libro_classify() for tax in taxes})
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        taxes = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return taxes
+
+    def write(self, vals):
+        res = super().write(vals)
+        if self._libro_classification_fields.intersection(vals):
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
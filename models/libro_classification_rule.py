@@ -0,0 +1,172 @@
+from odoo import models, fields, api, tools
+from odoo.tools import frozendict, split_every
+
+
+def _line_selection(fname):
+    """Mismas opciones que el campo ``fname`` de la línea de compras."""
+    return lambda self: self.env['libro.compras.line']._fields[fname].selection
+
+
+class LibroClassificationRule(models.Model):
+    _name = 'libro.classification.rule'
+    _description = 'Regla de Clasificación de Compras'
+    _order = 'sequence, id'
+
+    # Campos de la línea de compras que asignan las reglas (columnas Q-T)
+    _classification_fields = ['tipo_operacion', 'clasificacion', 'sector', 'tipo_costo_gasto']
+
+    # Campos que no intervienen en _get_compiled_rules: editarlos no invalida la caché
+    _cache_ignored_fields = {'name'}
+
+    # Facturas por consulta al reunir cuentas, categorías y cuentas analíticas
+    _classify_batch_size = 5000
+
+    sequence = fields.Integer(string='Secuencia', default=10)
+    active = fields.Boolean(default=True)
+    name = fields.Char(string='Descripción')
+    company_id = fields.Many2one(
+        'res.company', string='Compañía', default=lambda self: self.env.company,
+        help='Vacío: la regla aplica a todas las compañías. Las sucursales también usan '
+             'las reglas de su compañía padre, después de las propias.'
+    )
+
+    # Condiciones (vacías = cualquiera); todas las indicadas deben cumplirse
+    partner_id = fields.Many2one(
+        'res.partner', string='Proveedor',
+        help='Se compara con la empresa del proveedor de la factura.'
+    )
+    account_id = fields.Many2one(
+        'account.account', string='Cuenta de Gasto',
+        help='Alguna línea de la factura debe usar esta cuenta.'
+    )
+    product_categ_id = fields.Many2one(
+        'product.category', string='Categoría de Producto',
+        help='Algún producto de la factura debe ser de esta categoría.'
+    )
+    analytic_account_id = fields.Many2one(
+        'account.analytic.account', string='Cuenta Analítica',
+        help='Alguna línea de la factura debe distribuirse a esta cuenta analítica.'
+    )
+
+    # Resultado (vacío = lo decide la siguiente regla que coincida)
+    tipo_operacion = fields.Selection(selection=_line_selection('tipo_operacion'), string='Tipo de Operación')
+    clasificacion = fields.Selection(selection=_line_selection('clasificacion'), string='Clasificación')
+    sector = fields.Selection(selection=_line_selection('sector'), string='Sector Económico')
+    tipo_costo_gasto = fields.Selection(selection=_line_selection('tipo_costo_gasto'), string='Tipo Costo/Gasto')
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_compiled_rules(self, company_id):
+        """Reglas activas de la compañía, indexadas por proveedor.
+
+        Una sucursal usa primero sus propias reglas, luego las de su compañía
+        padre (y así hasta la casa matriz) y al final las de todas las
+        compañías; dentro de cada nivel, en orden de secuencia.
+
+        :return: (dict {partner_id: reglas}, reglas sin proveedor); cada regla
+            es una tupla (account_id, categ_id, analytic_id, valores) y cada
+            lista ya mezcla las reglas del proveedor con las generales en
+            orden de prioridad.
+        """
+        company = self.env['res.company'].sudo().browse(company_id)
+        # Compañía y sus padres, de la más cercana a la casa matriz
+        chain = [int(cid) for cid in reversed((company.parent_path or f'{company_id}/').split('/')) if cid]
+        rank = {cid: level for level, cid in enumerate(chain)}
+        rules = self.sudo().search([('company_id', 'in', chain + [False])]).sorted(
+            lambda rule: rank.get(rule.company_id.id, len(chain)))
+        compiled = []
+        for rule in rules:
+            values = frozendict({
+                fname: rule[fname] for fname in self._classification_fields if rule[fname]
+            })
+            if values:
+                compiled.append((
+                    rule.partner_id.commercial_partner_id.id,
+                    (rule.account_id.id, rule.product_categ_id.id, rule.analytic_account_id.id, values),
+                ))
+        generic = tuple(condition for partner_id, condition in compiled if not partner_id)
+        by_partner = {
+            partner_id: tuple(c for p, c in compiled if not p or p == partner_id)
+            for partner_id in {p for p, c in compiled if p}
+        }
+        return frozendict(by_partner), generic
+
+    @api.model
+    def _get_move_criteria(self, move_ids):
+        """Compañía, proveedor, cuentas, categorías y cuentas analíticas de cada factura, en una consulta.
+
+        :return: dict {move_id: (company_id, partner_id, {cuentas}, {categorías}, {analíticas})}
+        """
+        self.env['account.move'].flush_model(['company_id', 'commercial_partner_id'])
+        self.env['account.move.line'].flush_model(['move_id', 'account_id', 'product_id', 'analytic_distribution', 'display_type'])
+        self.env['product.product'].flush_model(['product_tmpl_id'])
+        self.env['product.template'].flush_model(['categ_id'])
+        self.env.cr.execute("""
+            SELECT am.id,
+                   am.company_id,
+                   am.commercial_partner_id,
+                   array_agg(DISTINCT aml.account_id) FILTER (WHERE aml.account_id IS NOT NULL),
+                   array_agg(DISTINCT pt.categ_id) FILTER (WHERE pt.categ_id IS NOT NULL),
+                   array_agg(DISTINCT analytic.id::int) FILTER (WHERE analytic.id IS NOT NULL)
+              FROM account_move am
+              JOIN account_move_line aml ON aml.move_id = am.id AND aml.display_type = 'product'
+         LEFT JOIN product_product pp ON pp.id = aml.product_id
+         LEFT JOIN product_template pt ON pt.id = pp.product_tmpl_id
+              -- Las claves de la distribución pueden combinar cuentas: "1,2"
+         LEFT JOIN LATERAL (
+                   SELECT unnest(string_to_array(key, ',')) AS id
+                     FROM jsonb_object_keys(aml.analytic_distribution) AS key
+                   ) analytic ON TRUE
+             WHERE am.id = ANY(%s)
+          GROUP BY am.id, am.company_id, am.commercial_partner_id
+        """, [list(move_ids)])
+        return {
+            move_id: (company_id, partner_id, set(accounts or ()), set(categs or ()), set(analytics or ()))
+            for move_id, company_id, partner_id, accounts, categs, analytics in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _classify_moves(self, move_ids):
+        """Clasificación de cada factura según las reglas de su compañía.
+
+        En los libros consolidados cada factura usa las reglas de la sucursal
+        que la registró, con las de sus compañías padre como respaldo (ver
+        ``_get_compiled_rules``). Por cada campo gana la primera regla que
+        coincide y lo define. Las facturas sin reglas aplicables no aparecen.
+
+        :return: dict {move_id: {campo: valor}}
+        """
+        wanted = len(self._classification_fields)
+        result = {}
+        for batch in split_every(self._classify_batch_size, move_ids):
+            for move_id, (company_id, partner_id, accounts, categs, analytics) in self._get_move_criteria(batch).items():
+                by_partner, generic = self._get_compiled_rules(company_id)
+                values = {}
+                for account_id, categ_id, analytic_id, rule_values in by_partner.get(partner_id, generic):
+                    if ((not account_id or account_id in accounts)
+                            and (not categ_id or categ_id in categs)
+                            and (not analytic_id or analytic_id in analytics)):
+                        for fname, value in rule_values.items():
+                            values.setdefault(fname, value)
+                        if len(values) == wanted:
+                            break
+                if values:
+                    result[move_id] = values
+        return result
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        rules = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return rules
+
+    def write(self, vals):
+        res = super().write(vals)
+        if set(vals) - self._cache_ignored_fields:
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
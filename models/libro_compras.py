@@ -5,12 +5,34 @@ from dateutil.relativedelta import relativedelta
 import io
 import csv
 import base64
+import logging
+
+from .libro_generation_profile import libro_profiled
+from .libro_validation_finding import libro_check_dui, libro_check_nit, libro_check_nrc
+
+_logger = logging.getLogger(__name__)
 
 
 class LibroComprasPeriodo(models.Model):
     _name = 'libro.compras.periodo'
     _description = 'Periodo del Libro de Compras'
     _rec_name = 'periodo'  # Para que el título muestre el periodo
+    _libro_line_model = 'libro.compras.line'
+    _libro_generation_cron = 'libros_fiscales.ir_cron_libro_compras_generation'
+    _libro_total_fields = ['total_internas_exentas', 'total_internas_gravadas', 'total_credito_fiscal']
+    _report_line_fields = ['sequence', 'invoice_date', 'numero_documento']
+    # Según manual oficial, para compras son válidos: 03, 05, 06, 11, 12, 13
+    _valid_doc_types = ['03', '05', '06', '11', '12', '13']
+    _report_amount_fields = ['compras_internas_exentas', 'compras_internas_gravadas', 'credito_fiscal', 'amount_total']
+    # Columnas G-N del CSV (deben sumar el total O) y J-M (base del crédito fiscal)
+    _validation_fields = [
+        'tipo_documento', 'clase_documento', 'codigo_generacion', 'dui_proveedor',
+        'compras_internas_exentas', 'internaciones_exentas', 'importaciones_exentas',
+        'compras_internas_gravadas', 'internaciones_gravadas_bienes',
+        'importaciones_gravadas_bienes', 'importaciones_gravadas_servicios',
+        'credito_fiscal', 'amount_total',
+    ]
+    _validation_partner_fields = ('vat', 'l10n_sv_nrc')
 
     company_id = fields.Many2one(
         'res.company',
@@ -25,6 +47,13 @@ class LibroComprasPeriodo(models.Model):
         help='Si está marcado, incluirá facturas de todas las sucursales de la empresa'
     )
 
+    duplicados_dte = fields.Selection([
+        ('marcar', 'Marcar y no seleccionar'),
+        ('omitir', 'Omitir del libro'),
+    ], string='DTE Duplicados', default='marcar', required=True,
+        help='Qué hacer con facturas cuyo DTE (código de generación o sello) ya está '
+             'en este libro o en un libro validado de la compañía.')
+
     # Para parecerse al "Asistente" del módulo antiguo
     assistant_id = fields.Many2one(
         'res.users',
@@ -73,22 +102,25 @@ class LibroComprasPeriodo(models.Model):
         store=True,
     )
 
-    # campos calculados
+    # campos calculados (almacenados, ver _compute_totales)
     total_internas_exentas = fields.Monetary(
         string="Total Internas Exentas",
         compute="_compute_totales",
+        store=True,
         currency_field="company_currency_id",
     )
 
     total_internas_gravadas = fields.Monetary(
         string="Total Internas Gravadas",
         compute="_compute_totales",
+        store=True,
         currency_field="company_currency_id",
     )
 
     total_credito_fiscal = fields.Monetary(
         string="Total Crédito Fiscal",
         compute="_compute_totales",
+        store=True,
         currency_field="company_currency_id",
     )
 
@@ -119,14 +151,37 @@ class LibroComprasPeriodo(models.Model):
 
     def action_select_all(self):
         """Seleccionar todas las líneas."""
+        self._check_generation_not_running()
         for rec in self:
             rec.invoice_line_ids.write({'select': True})
 
     def action_unselect_all(self):
         """Deseleccionar todas las líneas."""
+        self._check_generation_not_running()
         for rec in self:
             rec.invoice_line_ids.write({'select': False})
 
+    # ----------------- CLASIFICACIÓN -----------------
+
+    def action_apply_classification_rules(self):
+        """Reclasificar todas las líneas del libro con las reglas de clasificación.
+
+        Sobrescribe la clasificación de las líneas a las que aplica alguna
+        regla, incluso la ajustada a mano; las demás quedan igual.
+        """
+        self.ensure_one()
+        self._check_generation_not_running()
+        if self.state != 'draft':
+            raise UserError("Solo puedes modificar libros en estado Borrador.")
+        Line = self.env['libro.compras.line']
+        Line.flush_model(['periodo_id', 'move_id'])
+        self.env.cr.execute('SELECT id, move_id FROM libro_compras_line WHERE periodo_id = %s', [self.id])
+        line_by_move = {move_id: line_id for line_id, move_id in self.env.cr.fetchall()}
+        classification = self.env['libro.classification.rule']._classify_moves(list(line_by_move))
+        Line._bulk_update({line_by_move[move_id]: vals for move_id, vals in classification.items()})
+        self.invalidate_recordset(['invoice_line_ids'])
+        self.message_post(body=f"Reglas de clasificación aplicadas a {len(classification)} de {len(line_by_move)} línea(s).")
+
     # ----------------- RESTRICCIONES -----------------
 
     def write(self, vals):
@@ -138,7 +193,7 @@ class LibroComprasPeriodo(models.Model):
 
     # ----------------- ACCIONES DE ESTADO -----------------
 
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'libro.periodo.mixin']
 
     state = fields.Selection([
         ('draft', 'Borrador'),
@@ -167,8 +222,8 @@ class LibroComprasPeriodo(models.Model):
 
     def action_mark_done(self):
         """Equivalente a 'Validar'."""
-        for rec in self:
-            rec.state = 'validated'
+        # Congelar lo que se valida (exportaciones y reimpresiones salen de aquí)
+        self._validate_with_snapshot()
 
     def action_reset_to_draft(self):
         """Equivalente a 'Cancelar' / volver a borrador."""
@@ -180,16 +235,71 @@ class LibroComprasPeriodo(models.Model):
                  "invoice_line_ids.compras_internas_gravadas",
                  "invoice_line_ids.credito_fiscal")
     def _compute_totales(self):
+        """Totales con un solo SUM en la base de datos, sin cargar las líneas."""
+        totals = {
+            periodo.id: (exentas, gravadas, credito)
+            for periodo, exentas, gravadas, credito in self.env['libro.compras.line']._read_group(
+                [('periodo_id', 'in', [pid for pid in self._origin.ids if pid])],
+                ['periodo_id'],
+                ['compras_internas_exentas:sum', 'compras_internas_gravadas:sum', 'credito_fiscal:sum'],
+            )
+        }
         for rec in self:
-            rec.total_internas_exentas = sum(rec.invoice_line_ids.mapped("compras_internas_exentas"))
-            rec.total_internas_gravadas = sum(rec.invoice_line_ids.mapped("compras_internas_gravadas"))
-            rec.total_credito_fiscal = sum(rec.invoice_line_ids.mapped("credito_fiscal"))
+            exentas, gravadas, credito = totals.get(rec._origin.id, (0.0, 0.0, 0.0))
+            rec.total_internas_exentas = exentas
+            rec.total_internas_gravadas = gravadas
+            rec.total_credito_fiscal = credito
 
     # ----------------- LÓGICA DE LIBRO -----------------
 
+    @libro_profiled('load')
     def action_load_invoices(self):
         """Generar Detalle: carga facturas del mes seleccionado."""
         self.ensure_one()
+        self._check_generation_not_running()
+
+        with self._profile_stage('search'):
+            invoices = self._get_book_moves()
+        counters = {}
+        with self._profile_stage('classification'):
+            lines_values = self._prepare_book_lines(invoices, counters)
+        self._profile_count(rows_read=len(invoices))
+        valid_count = counters.get('valid', 0)  # Contador de facturas válidas
+        skipped_count = self._count_skipped_moves()  # Facturas con tipo inválido
+
+        # Regeneración diferencial por factura: inserta nuevas, actualiza las
+        # que cambiaron y elimina las que salieron del periodo. Conserva la
+        # clasificación fiscal que el usuario ya ajustó.
+        self.env['libro.compras.line']._sync_period_lines(self, lines_values)
+        
+        # Mensaje informativo
+        if valid_count == 0 and skipped_count > 0:
+            raise UserError(f"No se encontraron facturas válidas para el Libro de Compras.\n"
+                          f"Se omitieron {skipped_count} documento(s) con tipo inválido (ej: Sujeto Excluido).\n"
+                          f"Tipos válidos para compras: 03, 05, 06, 11, 12, 13")
+        
+        self._finish_book_generation(counters)
+        
+        # Forzar recalculo de totales
+        self.invalidate_recordset(['invoice_line_ids'])
+        
+        # No retornar nada para que Odoo refresque la vista automáticamente
+
+    def _get_book_moves(self, extra_domain=None):
+        """Facturas de proveedor del periodo con tipo de documento válido, en el orden del libro."""
+        return self.env['account.move'].search(self._get_book_moves_domain() + [
+            ('libro_tipo_documento', 'in', self._valid_doc_types),
+        ] + (extra_domain or []))
+
+    def _count_skipped_moves(self):
+        """Facturas del periodo omitidas por tipo de documento inválido (ej. Sujeto Excluido)."""
+        return self.env['account.move'].search_count(self._get_book_moves_domain() + [
+            ('libro_tipo_documento', 'not in', self._valid_doc_types),
+        ])
+
+    def _get_book_moves_domain(self):
+        """Dominio de las facturas de proveedor del periodo."""
+        self.ensure_one()
 
         if not self.year or not self.month:
             raise UserError("Debe especificar Año y Mes.")
@@ -199,95 +309,67 @@ class LibroComprasPeriodo(models.Model):
         # Último día del mes
         date_to = (date_from + relativedelta(months=1, days=-1))
 
-        # Determinar las compañías a incluir
-        if self.incluir_sucursales:
-            # Incluir empresa actual + todas sus sucursales
-            company_ids = [self.company_id.id] + self.company_id.child_ids.ids
-        else:
-            # Solo la empresa actual
-            company_ids = [self.company_id.id]
+        # Determinar las compañías a incluir (con sucursales de todos los niveles)
+        company_ids = self._get_book_company_ids()
 
-        invoices = self.env['account.move'].search([
+        return [
             ('move_type', 'in', ['in_invoice', 'in_refund']),  # Incluir facturas Y notas de crédito
             ('state', '=', 'posted'),
             ('invoice_date', '>=', date_from),
             ('invoice_date', '<=', date_to),
             ('company_id', 'in', company_ids),
-        ])
+        ]
 
-        self.invoice_line_ids.unlink()  # limpiar anteriores
-        
-        valid_count = 0  # Contador de facturas válidas
-        skipped_count = 0  # Contador de facturas saltadas
-        
-        for index, inv in enumerate(invoices, start=1):
+    def _prepare_book_lines(self, invoices, counters):
+        """Valores de línea para ``invoices``.
+
+        ``counters`` lleva las facturas válidas ('valid', que también da la
+        numeración); se actualiza en sitio para poder continuar entre lotes.
+        """
+        # Montos exentos/gravados de todas las facturas en una sola consulta
+        amounts_by_move = self._get_amounts_by_move(invoices.ids)
+        # Clasificación fiscal (columnas Q-T) según las reglas de la compañía de
+        # cada factura. Solo llega a las líneas nuevas: en las existentes manda el usuario.
+        classification = self.env['libro.classification.rule']._classify_moves(invoices.ids)
+
+        # DTE ya registrados: una consulta para el lote y un dict para los
+        # repetidos dentro del mismo lote
+        Line = self.env['libro.compras.line']
+        dte_keys = {
+            inv.id: Line._dte_key(inv.tgr_l10n_sv_edi_codigo_generacion, inv.tgr_l10n_sv_edi_sello_recibido)
+            for inv in invoices
+        }
+        # En la generación por lotes, las facturas de lotes anteriores ya
+        # quedaron registradas en este libro; las de lotes siguientes todavía no
+        processed_ids = []
+        if self.generation_state == 'running':
+            processed_ids = (self.generation_move_ids or [])[:self.generation_processed]
+        registered = self._get_registered_dte_keys({key for key in dte_keys.values() if key}, processed_ids)
+
+        lines_values = []
+        for inv in invoices:
             # Extraer información de la factura
             # Buscar código MH en campos personalizados o usar referencia
             codigo_mh = '' # Si tienes campo para esto
             
-            # Tipo de documento (puede variar según tu configuración)
-            numero_documento = inv.name or ''
-            
             # Campos DTE
             numero_control = inv.tgr_l10n_sv_edi_numero_control or ''
             codigo_generacion = inv.tgr_l10n_sv_edi_codigo_generacion or ''
             sello_digital = inv.tgr_l10n_sv_edi_sello_recibido or ''
             
-            # EXTRAER TIPO DE DOCUMENTO del nombre/referencia de la factura
-            # En facturas de proveedor no existe l10n_latam_document_type_id
-            tipo_documento = ''
-            ref = inv.ref or inv.name or ''
-            
-            # Detectar tipo según prefijo en la referencia
-            if 'DTE-14' in ref or 'DTE-14' in numero_documento:
-                tipo_documento = '14'  # Sujeto Excluido
-            elif 'DTE-03' in ref or 'CCF' in ref or 'CCF' in numero_documento:
-                tipo_documento = '03'  # Crédito Fiscal
-            elif 'DTE-05' in ref or 'NC' in ref:
-                tipo_documento = '05'  # Nota de Crédito
-            elif 'DTE-06' in ref or 'ND' in ref:
-                tipo_documento = '06'  # Nota de Débito
-            elif 'DTE-11' in ref:
-                tipo_documento = '11'  # Factura Exportación
-            elif codigo_generacion:
-                # Si tiene código de generación pero no detectamos el tipo, asumir CCF
-                tipo_documento = '03'
-            else:
-                # Por defecto, asumir CCF si no podemos determinar
-                tipo_documento = '03'
-            
+            # Tipo de documento detectado al registrar la factura (ver libro.dte.pattern).
+            # _get_book_moves ya filtra los tipos válidos para Hacienda.
+            tipo_documento = inv.libro_tipo_documento
+
             # DCL (solo para importaciones)
             dcl = ''
 
-            # VALIDAR TIPO DE DOCUMENTO (solo tipos válidos para Hacienda)
-            # Según manual oficial, para compras son válidos: 03, 05, 06, 11, 12, 13
-            valid_doc_types = ['03', '05', '06', '11', '12', '13']
-            if tipo_documento not in valid_doc_types:
-                # Saltar documentos con tipo inválido (ej: 14 = Sujeto Excluido)
-                skipped_count += 1
-                continue
-
-            # Montos: desglosar según tipo de impuesto
-            compras_internas_exentas = 0.0
-            compras_internas_gravadas = 0.0
-            credito_fiscal = 0.0
-            
+            # Montos: desglosados por impuesto en _get_amounts_by_move
             # IMPORTANTE: Según manual de Hacienda, las notas de crédito (tipo 05)
             # deben reportarse con montos POSITIVOS. El sistema de Hacienda se encarga
             # de restarlas del total automáticamente.
             # No aplicar signo negativo para refunds.
-
-            # Iterar líneas de la factura para calcular montos
-            for line in inv.invoice_line_ids:
-                amount_line = abs(line.price_subtotal)  # Siempre positivo
-
-                # Determinar si es exento o gravado según impuesto
-                if line.tax_ids:
-                    # Si tiene impuesto, es gravado
-                    compras_internas_gravadas += amount_line
-                else:
-                    # Si no tiene impuesto, es exento
-                    compras_internas_exentas += amount_line
+            compras_internas_exentas, compras_internas_gravadas = amounts_by_move.get(inv.id, (0.0, 0.0))
 
             # IMPORTANTE: Calcular crédito fiscal como exactamente 13% de compras gravadas
             # Esto asegura que cumpla con la validación de Hacienda
@@ -300,12 +382,22 @@ class LibroComprasPeriodo(models.Model):
             # Total siempre positivo (Hacienda maneja el signo según tipo de documento)
             amount_total = abs(inv.amount_total)
             
+            # DTE duplicado: se marca (sin seleccionar) o se omite según el libro
+            dte_key = dte_keys[inv.id]
+            duplicado_en = registered.get(dte_key) if dte_key else False
+            if duplicado_en:
+                counters['duplicated'] = counters.get('duplicated', 0) + 1
+                if self.duplicados_dte == 'omitir':
+                    continue
+            elif dte_key:
+                registered[dte_key] = self.periodo
+
             # Usar contador válido para sequence
-            valid_count += 1
+            counters['valid'] = counters.get('valid', 0) + 1
 
-            self.env['libro.compras.line'].create({
+            lines_values.append({
                 'periodo_id': self.id,
-                'sequence': valid_count,  # Usar contador de válidas
+                'sequence': counters['valid'],  # Usar contador de válidas
                 'move_id': inv.id,
                 'partner_id': inv.partner_id.id,
                 'invoice_date': inv.invoice_date,
@@ -321,28 +413,89 @@ class LibroComprasPeriodo(models.Model):
                 'compras_internas_gravadas': compras_internas_gravadas,
                 'credito_fiscal': credito_fiscal,
                 'amount_total': amount_total,
+                'dte_duplicado': bool(duplicado_en),
+                'dte_duplicado_info': duplicado_en or False,
+                'select': not duplicado_en,  # Auto-seleccionar al cargar (salvo duplicados)
+                **classification.get(inv.id, {}),
             })
-        
-        # Mensaje informativo
-        if valid_count == 0 and skipped_count > 0:
-            raise UserError(f"No se encontraron facturas válidas para el Libro de Compras.\n"
-                          f"Se omitieron {skipped_count} documento(s) con tipo inválido (ej: Sujeto Excluido).\n"
-                          f"Tipos válidos para compras: 03, 05, 06, 11, 12, 13")
-        
-        # Log informativo si hubo documentos omitidos
+        return lines_values
+
+    def _finish_book_generation(self, counters):
+        """Log informativo si hubo documentos omitidos."""
+        skipped_count = self._count_skipped_moves()
+        self._profile_skip('tipo_documento', skipped_count)
         if skipped_count > 0:
-            import logging
-            _logger = logging.getLogger(__name__)
-            _logger.warning(f"Libro de Compras: Se cargaron {valid_count} facturas válidas. "
+            _logger.warning(f"Libro de Compras: Se cargaron {counters.get('valid', 0)} facturas válidas. "
                           f"Se omitieron {skipped_count} documentos con tipo inválido.")
-        
-        # Forzar recalculo de totales
-        self.invalidate_recordset(['invoice_line_ids'])
-        
-        # Seleccionar automáticamente todas las líneas cargadas
-        self.invoice_line_ids.write({'select': True})
-        
-        # No retornar nada para que Odoo refresque la vista automáticamente
+        duplicated = counters.get('duplicated', 0)
+        if duplicated:
+            if self.duplicados_dte == 'omitir':
+                self._profile_skip('dte_duplicado', duplicated)
+            accion = 'omitidos' if self.duplicados_dte == 'omitir' else 'marcados y sin seleccionar'
+            self.message_post(body=f"Se encontraron {duplicated} DTE duplicado(s) ({accion}).")
+
+    def _get_registered_dte_keys(self, keys, processed_move_ids=()):
+        """DTE de ``keys`` ya registrados en libros validados de la compañía o,
+        en este libro, por las facturas ``processed_move_ids`` (ya regeneradas
+        en lotes anteriores).
+
+        El resto de las líneas de este libro no cuenta: se están regenerando
+        o van a eliminarse, y contarlas marcaría a los dos DTE de un par
+        repetido. Usa el índice hash sobre ``dte_key``, así el costo no crece
+        con el historial.
+
+        :return: dict {dte_key: periodo donde ya está registrado}
+        """
+        self.ensure_one()
+        if not keys:
+            return {}
+        self.env['libro.compras.line'].flush_model(['dte_key', 'periodo_id', 'move_id'])
+        self.flush_model(['state', 'company_id', 'periodo'])
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (l.dte_key) l.dte_key, p.periodo
+              FROM libro_compras_line l
+              JOIN libro_compras_periodo p ON p.id = l.periodo_id
+             WHERE l.dte_key = ANY(%s)
+               AND p.company_id = %s
+               AND ((p.id != %s AND p.state = 'validated')
+                    OR (p.id = %s AND l.move_id = ANY(%s)))
+          ORDER BY l.dte_key, p.year, p.id
+        """, [list(keys), self.company_id.id, self.id, self.id, list(processed_move_ids)])
+        return dict(self.env.cr.fetchall())
+
+    def _get_amounts_by_move(self, move_ids):
+        """Sumar exentas y gravadas de las líneas de factura, agrupado por factura.
+
+        Reemplaza el recorrido de ``invoice_line_ids``/``tax_ids`` por factura.
+        Una línea es gravada si tiene al menos un impuesto, incluidos los
+        archivados (``tax_ids`` se lee con ``active_test=False``), y exenta en
+        caso contrario. Los montos siempre se toman en positivo.
+
+        :return: dict {move_id: (exentas, gravadas)}
+        """
+        if not move_ids:
+            return {}
+        self.env['account.move.line'].flush_model(['move_id', 'display_type', 'price_subtotal', 'tax_ids'])
+        self.env.cr.execute("""
+            SELECT aml.move_id,
+                   COALESCE(SUM(ABS(COALESCE(aml.price_subtotal, 0))) FILTER (WHERE NOT taxed.has_tax), 0),
+                   COALESCE(SUM(ABS(COALESCE(aml.price_subtotal, 0))) FILTER (WHERE taxed.has_tax), 0)
+              FROM account_move_line aml
+              CROSS JOIN LATERAL (
+                    SELECT EXISTS (
+                        SELECT 1
+                          FROM account_move_line_account_tax_rel rel
+                         WHERE rel.account_move_line_id = aml.id
+                    ) AS has_tax
+              ) taxed
+             WHERE aml.move_id = ANY(%s)
+               AND aml.display_type IN ('product', 'line_section', 'line_note')
+          GROUP BY aml.move_id
+        """, [list(move_ids)])
+        return {
+            move_id: (float(exentas), float(gravadas))
+            for move_id, exentas, gravadas in self.env.cr.fetchall()
+        }
 
     def _get_document_type(self, invoice):
         """
@@ -395,158 +548,154 @@ class LibroComprasPeriodo(models.Model):
 
     def action_generate_excel(self):
         """Generar archivo Excel (.xlsx) con las facturas seleccionadas."""
-        selected = self.invoice_line_ids.filtered(lambda l: l.select)
-        if not selected:
-            raise UserError("Debe seleccionar al menos una factura.")
-
-        try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, Alignment, PatternFill
-        except ImportError:
-            raise UserError("La librería 'openpyxl' no está instalada. Instálela con: pip install openpyxl")
-
-        # Crear workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Libro de Compras"
-
-        # Estilos
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        
-        # Encabezados
-        headers = [
-            'No', 'Fecha Emisión', 'Código MH', 'Tipo de Documento', 'DCL',
-            'Referencia de Factura', 'Número de Control', 'Código de Generación',
-            'Sello Digital', 'Proveedor', 'Internas Exentas', 'Internas Gravadas',
-            'Crédito Fiscal', 'Total'
+        return self._export_action('xlsx')
+
+    def _iter_excel_rows(self, domain):
+        """Filas del Excel de control interno, leyendo las líneas por lotes."""
+        fnames = [
+            'sequence', 'invoice_date', 'codigo_mh', 'tipo_documento', 'dcl',
+            'numero_documento', 'numero_control', 'codigo_generacion', 'sello_digital',
+            'compras_internas_exentas', 'compras_internas_gravadas', 'credito_fiscal', 'amount_total',
         ]
-        
-        for col, header in enumerate(headers, start=1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal='center')
-
-        # Datos
-        for row, line in enumerate(selected, start=2):
-            ws.cell(row=row, column=1, value=line.sequence or '')
-            ws.cell(row=row, column=2, value=str(line.invoice_date) if line.invoice_date else '')
-            ws.cell(row=row, column=3, value=line.codigo_mh or '')
-            ws.cell(row=row, column=4, value=line.tipo_documento or '')
-            ws.cell(row=row, column=5, value=line.dcl or '')
-            ws.cell(row=row, column=6, value=line.numero_documento or '')
-            ws.cell(row=row, column=7, value=line.numero_control or '')
-            ws.cell(row=row, column=8, value=line.codigo_generacion or '')
-            ws.cell(row=row, column=9, value=line.sello_digital or '')
-            ws.cell(row=row, column=10, value=line.partner_id.name or '')
-            ws.cell(row=row, column=11, value=line.compras_internas_exentas or 0)
-            ws.cell(row=row, column=12, value=line.compras_internas_gravadas or 0)
-            ws.cell(row=row, column=13, value=line.credito_fiscal or 0)
-            ws.cell(row=row, column=14, value=line.amount_total or 0)
-
-        # Guardar en memoria
-        output = io.BytesIO()
-        wb.save(output)
-        excel_data = base64.b64encode(output.getvalue())
-        output.close()
-
-        attachment = self.env['ir.attachment'].create({
-            'name': f'Libro_Compras_{self.periodo or ""}.xlsx',
-            'type': 'binary',
-            'datas': excel_data,
-            'res_model': self._name,
-            'res_id': self.id,
-            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        })
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
-        }
+        for line in self._read_book_rows(domain, fnames):
+            yield [
+                line['sequence'] or '',
+                str(line['invoice_date']) if line['invoice_date'] else '',
+                line['codigo_mh'] or '',
+                line['tipo_documento'] or '',
+                line['dcl'] or '',
+                line['numero_documento'] or '',
+                line['numero_control'] or '',
+                line['codigo_generacion'] or '',
+                line['sello_digital'] or '',
+                line['partner_name'] or '',
+                line['compras_internas_exentas'] or 0,
+                line['compras_internas_gravadas'] or 0,
+                line['credito_fiscal'] or 0,
+                line['amount_total'] or 0,
+            ]
 
     def action_generate_csv(self):
         """Generar CSV formato oficial Hacienda (21 columnas, sin encabezados)."""
-        selected = self.invoice_line_ids.filtered(lambda l: l.select)
-        if not selected:
+        action = self._export_action('csv')
+        # Dejar a la vista las inconsistencias de lo que se va a presentar
+        self._run_book_validation()
+        return action
+
+    def _get_export_spec(self, fmt):
+        if fmt not in self._export_mimetypes:
+            return super()._get_export_spec(fmt)
+        domain = self._get_export_domain()
+        if not self._book_has_rows(domain):
             raise UserError("Debe seleccionar al menos una factura.")
+        if fmt == 'csv':
+            # SIN ENCABEZADOS según manual oficial
+            return {
+                'kind': 'csv',
+                'domain': domain,
+                'filename': f'Libro_Compras_Hacienda_{self.periodo or ""}.csv',
+                'rows': self._iter_csv_rows(domain),
+            }
+        return {
+            'kind': 'xlsx',
+            'domain': domain,
+            'filename': f'Libro_Compras_{self.periodo or ""}.xlsx',
+            'sheet_title': "Libro de Compras",
+            'headers': [
+                'No', 'Fecha Emisión', 'Código MH', 'Tipo de Documento', 'DCL',
+                'Referencia de Factura', 'Número de Control', 'Código de Generación',
+                'Sello Digital', 'Proveedor', 'Internas Exentas', 'Internas Gravadas',
+                'Crédito Fiscal', 'Total'
+            ],
+            'rows': self._iter_excel_rows(domain),
+        }
 
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=';')  # Separador punto y coma
-        
-        # SIN ENCABEZADOS según manual oficial
-        
+    def _get_export_domain(self):
+        """Líneas seleccionadas del libro."""
+        self.ensure_one()
+        return [('periodo_id', '=', self.id), ('select', '=', True)]
+
+    def _iter_csv_rows(self, domain):
+        """Filas del CSV de Hacienda (21 columnas), leyendo las líneas por lotes."""
+        fnames = [
+            'invoice_date', 'clase_documento', 'tipo_documento', 'codigo_generacion',
+            'numero_control', 'numero_documento', 'compras_internas_exentas',
+            'internaciones_exentas', 'importaciones_exentas', 'compras_internas_gravadas',
+            'internaciones_gravadas_bienes', 'importaciones_gravadas_bienes',
+            'importaciones_gravadas_servicios', 'credito_fiscal', 'amount_total',
+            'dui_proveedor', 'tipo_operacion', 'clasificacion', 'sector', 'tipo_costo_gasto',
+        ]
         # Filas de datos (21 columnas)
-        for line in selected:
+        for line in self._read_book_rows(domain, fnames):
             # A - Fecha Emisión (DD/MM/YYYY)
-            fecha_str = line.invoice_date.strftime('%d/%m/%Y') if line.invoice_date else ''
+            fecha_str = line['invoice_date'].strftime('%d/%m/%Y') if line['invoice_date'] else ''
             
             # B - Clase de Documento (1-4)
-            clase_doc = line.clase_documento or '4'
+            clase_doc = line['clase_documento'] or '4'
             
             # C - Tipo de Documento (2 caracteres)
-            tipo_doc = line.tipo_documento or '03'
+            tipo_doc = line['tipo_documento'] or '03'
             
             # D - Número de Documento (Código Generación sin guiones para DTE, o Referencia de Factura)
-            if line.codigo_generacion:
-                numero_doc = line.codigo_generacion.replace('-', '')
-            elif line.numero_control:
-                numero_doc = line.numero_control.replace('-', '')
+            if line['codigo_generacion']:
+                numero_doc = line['codigo_generacion'].replace('-', '')
+            elif line['numero_control']:
+                numero_doc = line['numero_control'].replace('-', '')
             else:
-                numero_doc = line.numero_documento or ''  # Contiene la referencia de factura (ref)
+                numero_doc = line['numero_documento'] or ''  # Contiene la referencia de factura (ref)
             
             # E - NIT o NRC del Proveedor (sin guiones)
-            nit_nrc = (line.partner_nit or '').replace('-', '')
+            nit_nrc = (line['partner_vat'] or '').replace('-', '')
             
             # F - Nombre del Proveedor
-            nombre_prov = line.partner_id.name or ''
+            nombre_prov = line['partner_name'] or ''
             
             # G - Compras Internas Exentas
-            g_compras_exentas = f"{line.compras_internas_exentas:.2f}"
+            g_compras_exentas = f"{line['compras_internas_exentas']:.2f}"
             
             # H - Internaciones Exentas
-            h_intern_exentas = f"{line.internaciones_exentas:.2f}"
+            h_intern_exentas = f"{line['internaciones_exentas']:.2f}"
             
             # I - Importaciones Exentas
-            i_import_exentas = f"{line.importaciones_exentas:.2f}"
+            i_import_exentas = f"{line['importaciones_exentas']:.2f}"
             
             # J - Compras Internas Gravadas
-            j_compras_gravadas = f"{line.compras_internas_gravadas:.2f}"
+            j_compras_gravadas = f"{line['compras_internas_gravadas']:.2f}"
             
             # K - Internaciones Gravadas de Bienes
-            k_intern_gravadas = f"{line.internaciones_gravadas_bienes:.2f}"
+            k_intern_gravadas = f"{line['internaciones_gravadas_bienes']:.2f}"
             
             # L - Importaciones Gravadas de Bienes
-            l_import_gravadas_bienes = f"{line.importaciones_gravadas_bienes:.2f}"
+            l_import_gravadas_bienes = f"{line['importaciones_gravadas_bienes']:.2f}"
             
             # M - Importaciones Gravadas de Servicios
-            m_import_gravadas_serv = f"{line.importaciones_gravadas_servicios:.2f}"
+            m_import_gravadas_serv = f"{line['importaciones_gravadas_servicios']:.2f}"
             
             # N - Crédito Fiscal
-            n_credito_fiscal = f"{line.credito_fiscal:.2f}"
+            n_credito_fiscal = f"{line['credito_fiscal']:.2f}"
             
             # O - Total de Compras
-            o_total = f"{line.amount_total:.2f}"
+            o_total = f"{line['amount_total']:.2f}"
             
             # P - DUI del Proveedor (9 dígitos, opcional)
-            p_dui = (line.dui_proveedor or '').replace('-', '')
+            p_dui = (line['dui_proveedor'] or '').replace('-', '')
             
             # Q - Tipo de Operación
-            q_tipo_op = line.tipo_operacion or '1'
+            q_tipo_op = line['tipo_operacion'] or '1'
             
             # R - Clasificación
-            r_clasif = line.clasificacion or '2'
+            r_clasif = line['clasificacion'] or '2'
             
             # S - Sector
-            s_sector = line.sector or '4'
+            s_sector = line['sector'] or '4'
             
             # T - Tipo Costo/Gasto
-            t_tipo_costo = line.tipo_costo_gasto or '5'
+            t_tipo_costo = line['tipo_costo_gasto'] or '5'
             
             # U - Número de Anexo (siempre 3 para compras)
             u_anexo = '3'
             
-            writer.writerow([
+            yield [
                 fecha_str,           # A
                 clase_doc,           # B
                 tipo_doc,            # C
@@ -568,25 +717,64 @@ class LibroComprasPeriodo(models.Model):
                 s_sector,            # S
                 t_tipo_costo,        # T
                 u_anexo,             # U
-            ])
-
-        data = base64.b64encode(output.getvalue().encode('utf-8'))
-        output.close()
-
-        attachment = self.env['ir.attachment'].create({
-            'name': f'Libro_Compras_Hacienda_{self.periodo or ""}.csv',
-            'type': 'binary',
-            'datas': data,
-            'res_model': self._name,
-            'res_id': self.id,
-            'mimetype': 'text/csv'
-        })
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
-        }
+            ]
+
+    def _check_book_columns(self, columns):
+        """Reglas del Anexo de Compras sobre las columnas del libro."""
+        issues = []
+        add = issues.append
+        differ = self._amounts_differ
+        valid_types = set(self._valid_doc_types)
+        # Sin la localización el partner no tiene NRC: no se exige
+        check_nrc_present = 'l10n_sv_nrc' in self.env['res.partner']._fields
+
+        exentas = [g + h + i for g, h, i in zip(
+            columns['compras_internas_exentas'], columns['internaciones_exentas'],
+            columns['importaciones_exentas'])]
+        gravadas = [j + k + l + m for j, k, l, m in zip(
+            columns['compras_internas_gravadas'], columns['internaciones_gravadas_bienes'],
+            columns['importaciones_gravadas_bienes'], columns['importaciones_gravadas_servicios'])]
+
+        for index, (vat, nrc, dui, tipo, clase, codigo, exenta, gravada, credito, total) in enumerate(zip(
+                columns['partner_vat'], columns['partner_l10n_sv_nrc'], columns['dui_proveedor'],
+                columns['tipo_documento'], columns['clase_documento'], columns['codigo_generacion'],
+                exentas, gravadas, columns['credito_fiscal'], columns['amount_total'])):
+            # E / P - NIT o NRC del proveedor, DUI para personas naturales
+            if not vat and not dui:
+                add((index, 'documento_identidad', 'error', "Proveedor sin NIT/NRC ni DUI"))
+            elif vat and not (libro_check_nit(vat) or libro_check_nrc(vat)):
+                add((index, 'documento_identidad', 'error', f"NIT/NRC del proveedor mal formado: {vat}"))
+            if dui and not libro_check_dui(dui):
+                add((index, 'documento_identidad', 'error', f"DUI del proveedor mal formado: {dui}"))
+            if check_nrc_present and tipo in ('03', '05', '06'):
+                if not nrc:
+                    add((index, 'documento_identidad', 'warning', "Proveedor de crédito fiscal sin NRC"))
+                elif not libro_check_nrc(nrc):
+                    add((index, 'documento_identidad', 'error', f"NRC del proveedor mal formado: {nrc}"))
+
+            # N - Crédito fiscal = 13% de las compras gravadas (J+K+L+M)
+            if differ(credito, round(gravada * 0.13, 2)):
+                add((index, 'credito_fiscal', 'error',
+                     f"Crédito fiscal {credito:.2f} distinto del 13% de las gravadas ({gravada * 0.13:.2f})"))
+
+            # O - Total = exentas + gravadas + crédito fiscal (G..N)
+            if differ(total, exenta + gravada + credito):
+                add((index, 'totales', 'warning',
+                     f"Total {total:.2f} no cuadra con la suma de columnas ({exenta + gravada + credito:.2f})"))
+
+            # B / C - Tipo y clase de documento
+            if tipo not in valid_types:
+                add((index, 'tipo_documento', 'error', f"Tipo de documento no válido para compras: {tipo or '-'}"))
+            elif (clase == '3') != (tipo in ('12', '13')):
+                add((index, 'tipo_documento', 'error',
+                     f"Clase {clase or '-'} no corresponde al tipo de documento {tipo}"))
+            if clase == '4' and not codigo:
+                add((index, 'tipo_documento', 'error', "Clase 4 (DTE) sin código de generación"))
+            elif codigo and clase in ('1', '2'):
+                add((index, 'tipo_documento', 'warning',
+                     f"Documento con código de generación registrado como clase {clase}"))
+        return issues
 
     def action_print_report(self):
         """Imprimir: genera el PDF del libro."""
-        return self.env.ref('libros_fiscales.report_libro_compras').report_action(self)
+        return self._print_book_report('libros_fiscales.report_libro_compras')
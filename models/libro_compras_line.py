@@ -1,10 +1,20 @@
+import re
+
 from odoo import models, fields, api
+from odoo.tools.sql import create_index
 
 class LibroComprasLine(models.Model):
     _name = 'libro.compras.line'
+    _inherit = ['libro.line.mixin']
     _description = 'Línea de Libro de Compras'
     _order = 'sequence, id'
 
+    # Clasificación fiscal y ajustes manuales: se conservan al regenerar
+    _libro_user_fields = [
+        'select', 'tipo_operacion', 'clasificacion', 'sector',
+        'tipo_costo_gasto', 'dui_proveedor',
+    ]
+
     periodo_id = fields.Many2one(
         'libro.compras.periodo',
         string='Periodo',
@@ -14,7 +24,7 @@ class LibroComprasLine(models.Model):
     sequence = fields.Integer(string='No')
 
     # Campos de referencia
-    move_id = fields.Many2one('account.move', string='Factura')
+    move_id = fields.Many2one('account.move', string='Factura', index=True)
     partner_id = fields.Many2one('res.partner', string='Proveedor')
 
     invoice_date = fields.Date(string='Fecha Emisión')
@@ -35,10 +45,15 @@ class LibroComprasLine(models.Model):
             rec.tipo_documento_nombre = doc_types.get(rec.tipo_documento, rec.tipo_documento)
     dcl = fields.Char(string='DCL')
     numero_documento = fields.Char(string='Número de Documento')
-    numero_control = fields.Char(string='Número de Control')
-    codigo_generacion = fields.Char(string='Código Generación')
+    numero_control = fields.Char(string='Número de Control', index='btree_not_null')
+    codigo_generacion = fields.Char(string='Código Generación', index='btree_not_null')
     sello_digital = fields.Char(string='Sello Digital')
 
+    # Detección de DTE duplicados (ver libro.compras.periodo._get_registered_dte_keys)
+    dte_key = fields.Char(string='Clave DTE', compute='_compute_dte_key', store=True)
+    dte_duplicado = fields.Boolean(string='DTE Duplicado', readonly=True)
+    dte_duplicado_info = fields.Char(string='Ya Registrado En', readonly=True)
+
     # Moneda de la compañía (para el footer)
     currency_id = fields.Many2one(
         'res.currency',
@@ -192,3 +207,53 @@ class LibroComprasLine(models.Model):
 
     # Campo de selección (existente)
     select = fields.Boolean(string='Seleccionar')
+
+    def init(self):
+        super().init()
+        # Búsqueda de duplicados por igualdad sobre todo el historial
+        create_index(
+            self.env.cr, 'libro_compras_line_dte_key_index', self._table,
+            ['dte_key'], method='hash', where='dte_key IS NOT NULL',
+        )
+
+    @api.model
+    def _dte_key(self, codigo_generacion, sello_digital):
+        """Clave normalizada del DTE: código de generación o, si no hay, sello digital.
+
+        Se ignoran mayúsculas, guiones y espacios, para que el mismo documento
+        digitado de distintas formas dé la misma clave.
+        """
+        codigo = re.sub(r'[^0-9A-Z]', '', (codigo_generacion or '').upper())
+        if codigo:
+            return 'CG:' + codigo
+        sello = re.sub(r'[^0-9A-Z]', '', (sello_digital or '').upper())
+        return 'SD:' + sello if sello else False
+
+    @api.depends('codigo_generacion', 'sello_digital')
+    def _compute_dte_key(self):
+        for rec in self:
+            rec.dte_key = self._dte_key(rec.codigo_generacion, rec.sello_digital)
+
+    @api.model
+    def _bulk_compute_values(self, vals):
+        """Calcular dte_key en la misma pasada de la carga masiva."""
+        vals = super()._bulk_compute_values(vals)
+        vals['dte_key'] = self._dte_key(vals.get('codigo_generacion'), vals.get('sello_digital'))
+        return vals
+
+    @api.model
+    def _sync_changed_values(self, old, new, currency):
+        """Un DTE que pasa a ser duplicado se deselecciona aunque ``select`` sea del usuario.
+
+        Si deja de ser duplicado (ej. se anuló la otra factura) y la línea
+        sigue sin seleccionar, se vuelve a seleccionar: fue el cargador quien
+        la sacó del libro. Una línea que el usuario ya había seleccionado
+        queda igual.
+        """
+        changed = super()._sync_changed_values(old, new, currency)
+        if new.get('dte_duplicado') and old.get('select'):
+            changed['select'] = False
+        elif old.get('dte_duplicado') and 'dte_duplicado' in new and not new['dte_duplicado'] \
+                and not old.get('select'):
+            changed['select'] = True
+        return changed
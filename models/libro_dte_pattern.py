@@ -0,0 +1,137 @@
+from odoo import models, fields, api, tools
+
+
+class LibroDtePattern(models.Model):
+    _name = 'libro.dte.pattern'
+    _description = 'Patrón de Tipo de Documento DTE'
+    _order = 'sequence, id'
+
+    # Tipo asignado cuando ningún patrón coincide (Crédito Fiscal)
+    _default_tipo_documento = '03'
+
+    sequence = fields.Integer(string='Secuencia', default=10)
+    active = fields.Boolean(default=True)
+    patron = fields.Char(
+        string='Texto a Buscar', required=True,
+        help='Texto que identifica el tipo de documento, ej. "DTE-03" o "CCF".'
+    )
+    buscar_en = fields.Selection([
+        ('referencia', 'Referencia (o número si no tiene referencia)'),
+        ('referencia_numero', 'Referencia o Número'),
+    ], string='Buscar En', required=True, default='referencia')
+    tipo_documento = fields.Selection([
+        ('03', '03 - Comprobante de Crédito Fiscal'),
+        ('05', '05 - Nota de Crédito'),
+        ('06', '06 - Nota de Débito'),
+        ('11', '11 - Factura de Exportación'),
+        ('12', '12 - Declaración de Mercancías'),
+        ('13', '13 - Mandamiento de Ingreso'),
+        ('14', '14 - Sujeto Excluido'),
+    ], string='Tipo de Documento', required=True)
+
+    @api.model
+    @tools.ormcache()
+    def _get_patterns(self):
+        """Patrones activos en orden de prioridad: tupla de (patron, buscar_en, tipo)."""
+        return self._read_patterns()
+
+    @api.model
+    def _read_patterns(self):
+        """Lo mismo que ``_get_patterns``, leído de la base sin pasar por la caché."""
+        return tuple(
+            (p.patron, p.buscar_en, p.tipo_documento)
+            for p in self.sudo().search([])
+        )
+
+    @api.model
+    def _detect_tipo_documento(self, ref, name):
+        """Tipo de documento de Hacienda según la referencia/número de la factura.
+
+        Gana el primer patrón (por secuencia) que coincida.
+        """
+        name = name or ''
+        ref = ref or name
+        for patron, buscar_en, tipo_documento in self._get_patterns():
+            if patron in ref or (buscar_en == 'referencia_numero' and patron in name):
+                return tipo_documento
+        return self._default_tipo_documento
+
+    def _patterns_changed(self):
+        """Limpiar la caché y recalcular el tipo en las facturas de proveedor abiertas.
+
+        Durante la instalación del módulo no se recalcula nada: el tipo de
+        todas las facturas se calcula una sola vez en ``post_init_hook``.
+        """
+        self.env.registry.clear_cache()
+        if self.env.registry.ready:
+            self._backfill_tipo_documento(open_only=True)
+
+    @api.model
+    def _backfill_tipo_documento(self, open_only=False):
+        """Recalcular ``libro_tipo_documento`` de las facturas de proveedor con un solo UPDATE.
+
+        Solo se escriben las facturas cuyo tipo cambia. Repite en SQL la lógica de ``_detect_tipo_documento`` con los patrones
+        activos, sin cargar las facturas en el ORM.
+
+        :param open_only: omitir las facturas de meses con un Libro de Compras
+            validado (de su compañía o consolidado de su casa matriz); ese
+            libro ya no cambia y conserva el tipo con el que se presentó.
+        :return: cantidad de facturas actualizadas
+        """
+        Move = self.env['account.move']
+        Move.flush_model(['move_type', 'ref', 'name', 'invoice_date', 'company_id', 'libro_tipo_documento'])
+        cases, params = [], []
+        for patron, buscar_en, tipo_documento in self._read_patterns():
+            condition = "strpos(COALESCE(NULLIF(m.ref, ''), m.name, ''), %s) > 0"
+            params.append(patron)
+            if buscar_en == 'referencia_numero':
+                condition += " OR strpos(COALESCE(m.name, ''), %s) > 0"
+                params.append(patron)
+            cases.append(f"WHEN {condition} THEN %s")
+            params.append(tipo_documento)
+        params += [self._default_tipo_documento, list(Move._libro_supplier_move_types)]
+        where = "m.move_type = ANY(%s)"
+        if open_only:
+            self.env['libro.compras.periodo'].flush_model(['state', 'company_id', 'incluir_sucursales', 'year', 'month'])
+            where += """
+               AND NOT EXISTS (
+                   SELECT 1
+                     FROM libro_compras_periodo p
+                     JOIN res_company pc ON pc.id = p.company_id
+                     JOIN res_company mc ON mc.id = m.company_id
+                    WHERE p.state = 'validated'
+                      AND p.year = EXTRACT(YEAR FROM m.invoice_date)
+                      AND p.month = to_char(m.invoice_date, 'MM')
+                      AND (p.company_id = m.company_id
+                           OR (p.incluir_sucursales AND mc.parent_path LIKE pc.parent_path || '%%')))"""
+        self.env.cr.execute(f"""
+            UPDATE account_move target
+               SET libro_tipo_documento = t.tipo
+              FROM (SELECT m.id, CASE {' '.join(cases)} ELSE %s END AS tipo
+                      FROM account_move m
+                     WHERE {where}) t
+             WHERE target.id = t.id
+               AND target.libro_tipo_documento IS DISTINCT FROM t.tipo
+        """, params)
+        updated = self.env.cr.rowcount
+        Move.invalidate_model(['libro_tipo_documento'])
+        return updated
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        patterns = super().create(vals_list)
+        patterns._patterns_changed()
+        return patterns
+
+    def write(self, vals):
+        before = self._get_patterns()
+        res = super().write(vals)
+        # Solo si cambió la lista efectiva (no, ej., al editar un patrón archivado)
+        if self._read_patterns() != before:
+            self._patterns_changed()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self._patterns_changed()
+        return res
@@ -0,0 +1,127 @@
+import functools
+import resource
+import threading
+import time
+
+from odoo import models, fields, api
+
+# Perfil activo del hilo (ver LibroRunProfiler y libro.periodo.mixin._profile_run)
+_active = threading.local()
+
+
+class LibroRunProfiler:
+    """Mediciones de una ejecución: etapas, consultas, filas y memoria.
+
+    Las consultas se cuentan con los contadores que el cursor de Odoo
+    mantiene por hilo (``query_count``/``query_time``).
+    """
+
+    def __init__(self):
+        thread = threading.current_thread()
+        if not hasattr(thread, 'query_count'):
+            thread.query_count = 0
+            thread.query_time = 0.0
+        self.thread = thread
+        self.start = time.perf_counter()
+        self.query_count = thread.query_count
+        self.query_time = thread.query_time
+        self.rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stages = {}
+        self.counts = {'rows_read': 0, 'rows_written': 0}
+        self.skipped = {}
+
+    @staticmethod
+    def current():
+        return getattr(_active, 'profiler', None)
+
+    @classmethod
+    def start_run(cls):
+        _active.profiler = profiler = cls()
+        return profiler
+
+    @staticmethod
+    def end_run():
+        _active.profiler = None
+
+    def stop(self):
+        """Cerrar la medición y devolver los valores del perfil."""
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {
+            'duration': time.perf_counter() - self.start,
+            'query_count': self.thread.query_count - self.query_count,
+            'query_time': self.thread.query_time - self.query_time,
+            'rows_read': self.counts['rows_read'],
+            'rows_written': self.counts['rows_written'],
+            'skipped': self.skipped,
+            'skipped_total': sum(self.skipped.values()),
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'peak_memory_kb': rss,
+            'memory_growth_kb': rss - self.rss_start,
+        }
+
+
+def libro_profiled(operation):
+    """Registrar un ``libro.generation.profile`` por cada llamada al método."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self._profile_run(operation):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LibroGenerationProfile(models.Model):
+    _name = 'libro.generation.profile'
+    _description = 'Perfil de ejecución de un Libro de IVA'
+    _order = 'date desc, id desc'
+
+    # Etapas con columna propia (el resto queda en ``stages``)
+    _stage_columns = {
+        'search': 'duration_search',
+        'classification': 'duration_classification',
+        'insert': 'duration_insert',
+        'totals': 'duration_totals',
+        'validation': 'duration_validation',
+        'write': 'duration_write',
+    }
+
+    res_model = fields.Char(string='Modelo del Libro', required=True, index=True, readonly=True)
+    res_id = fields.Many2oneReference(string='Libro', model_field='res_model', required=True, index=True, readonly=True)
+    periodo = fields.Char(string='Periodo', readonly=True)
+    operation = fields.Selection([
+        ('load', 'Generar Detalle'),
+        ('load_chunk', 'Lote en Segundo Plano'),
+        ('csv', 'CSV'),
+        ('excel', 'Excel'),
+        ('pdf', 'PDF'),
+    ], string='Operación', required=True, readonly=True)
+    date = fields.Datetime(string='Fecha', default=fields.Datetime.now, readonly=True)
+    user_id = fields.Many2one('res.users', string='Usuario', default=lambda self: self.env.user, readonly=True)
+
+    duration = fields.Float(string='Duración (s)', digits=(16, 3), readonly=True)
+    duration_search = fields.Float(string='Búsqueda (s)', digits=(16, 3), readonly=True)
+    duration_classification = fields.Float(string='Clasificación (s)', digits=(16, 3), readonly=True)
+    duration_insert = fields.Float(string='Escritura de Líneas (s)', digits=(16, 3), readonly=True)
+    duration_totals = fields.Float(string='Totales (s)', digits=(16, 3), readonly=True)
+    duration_validation = fields.Float(string='Validación (s)', digits=(16, 3), readonly=True)
+    duration_write = fields.Float(string='Escritura del Archivo (s)', digits=(16, 3), readonly=True)
+    stages = fields.Json(string='Etapas (s)', readonly=True)
+
+    query_count = fields.Integer(string='Consultas SQL', readonly=True)
+    query_time = fields.Float(string='Tiempo en SQL (s)', digits=(16, 3), readonly=True)
+    rows_read = fields.Integer(string='Filas Leídas', readonly=True)
+    rows_written = fields.Integer(string='Filas Escritas', readonly=True)
+    skipped = fields.Json(string='Omitidos por Motivo', readonly=True)
+    skipped_total = fields.Integer(string='Omitidos', readonly=True)
+    peak_memory_kb = fields.Integer(string='Memoria Máxima (KB)', readonly=True)
+    memory_growth_kb = fields.Integer(string='Aumento de Memoria (KB)', readonly=True)
+
+    @api.model
+    def _record(self, periodo, operation, values):
+        """Guardar el perfil de ``periodo`` con los valores de ``LibroRunProfiler.stop``."""
+        vals = dict(values, res_model=periodo._name, res_id=periodo.id,
+                    periodo=periodo.display_name, operation=operation)
+        for stage, column in self._stage_columns.items():
+            vals[column] = values['stages'].get(stage, 0.0)
+        return self.sudo().create(vals)
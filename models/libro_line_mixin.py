@@ -0,0 +1,438 @@
+import logging
+
+from odoo import models, api
+from odoo.tools import split_every
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+
+class LibroLineMixin(models.AbstractModel):
+    _name = 'libro.line.mixin'
+    _description = 'Utilidades comunes para líneas de Libros de IVA'
+
+    # Filas por sentencia INSERT/UPDATE. Con ~30 columnas queda muy por
+    # debajo del límite de parámetros de PostgreSQL (65535).
+    _bulk_batch_size = 1000
+
+    # Líneas leídas por consulta al exportar
+    _export_batch_size = 5000
+
+    # Campos que el usuario ajusta a mano sobre la línea. La regeneración
+    # diferencial nunca los sobrescribe en líneas existentes.
+    _libro_user_fields = ['select']
+    # Campos que el cargador escribe solo en algunas filas (ej. montos de
+    # facturas válidas que una anulada no trae). Si una fila no los trae
+    # vuelven a su valor por defecto; las demás columnas que el cargador no
+    # envía (ej. completadas a mano) no se tocan al regenerar.
+    _libro_loader_optional_fields = []
+
+    # Una línea por factura en cada libro (la regeneración diferencial se apoya en esto)
+    _sql_constraints = [
+        ('periodo_move_uniq', 'unique(periodo_id, move_id)', 'La factura ya está incluida en este libro.'),
+    ]
+
+    def init(self):
+        super().init()
+        if self._abstract:
+            return
+        # Exportaciones y reporte: líneas del periodo (seleccionadas) en el orden del libro
+        create_index(
+            self.env.cr, '%s_periodo_select_sequence_index' % self._table, self._table,
+            ['periodo_id', '"select"', 'sequence', 'id'],
+        )
+        # API de líneas: paginación por llave (periodo_id, id)
+        create_index(
+            self.env.cr, '%s_api_periodo_id_index' % self._table, self._table,
+            ['periodo_id', 'id'],
+        )
+
+    # ----------------- BLOQUEO -----------------
+
+    def _check_periodo_not_generating(self, periodo_ids=()):
+        """Impedir cambios en las líneas de libros que se generan en segundo plano.
+
+        El cron escribe las líneas por SQL; una edición a la vez se perdería.
+        Las escrituras del propio proceso van con el contexto ``libro_generation``.
+        """
+        if self.env.context.get('libro_generation'):
+            return
+        Periodo = self.env[self._fields['periodo_id'].comodel_name]
+        (self.periodo_id | Periodo.browse(periodo_ids))._check_generation_not_running()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self._check_periodo_not_generating({vals['periodo_id'] for vals in vals_list if vals.get('periodo_id')})
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self._check_periodo_not_generating([vals['periodo_id']] if vals.get('periodo_id') else ())
+        return super().write(vals)
+
+    def unlink(self):
+        self._check_periodo_not_generating()
+        # La API de líneas informa las eliminadas (ver libro.line.tombstone)
+        self.env['libro.line.tombstone'].sudo()._record_deleted(self._name, line_ids=self.ids)
+        return super().unlink()
+
+    # ----------------- CARGA MASIVA -----------------
+
+    @api.model
+    def _bulk_stored_fields(self):
+        """Campos con columna propia en la tabla, por nombre."""
+        return {
+            name: field for name, field in self._fields.items()
+            if field.store and field.column_type and name != 'id'
+        }
+
+    @api.model
+    def _bulk_round_monetary(self, vals, currency):
+        """Mismo redondeo que aplica el ORM a los campos Monetary."""
+        for name, value in vals.items():
+            if value and self._fields[name].type == 'monetary':
+                vals[name] = currency.round(value)
+        return vals
+
+    @api.model
+    def _bulk_compute_values(self, vals):
+        """Hook para llenar campos calculados almacenados antes de insertar.
+
+        Se ejecuta por cada fila; cada modelo sobrescribe lo que necesite.
+        """
+        return vals
+
+    @api.model
+    def _bulk_insert(self, vals_list):
+        """Insertar líneas con INSERT multi-fila, sin pasar por create().
+
+        Llena en la misma pasada los valores por defecto, los campos de
+        auditoría, el related almacenado ``currency_id`` y los calculados
+        almacenados del hook ``_bulk_compute_values``. Devuelve las líneas
+        creadas.
+        """
+        if not vals_list:
+            return self.browse()
+
+        self.flush_model()
+
+        # Moneda de cada periodo (related store=True hacia company_currency_id)
+        Periodo = self.env[self._fields['periodo_id'].comodel_name]
+        periodos = Periodo.browse({vals['periodo_id'] for vals in vals_list})
+        currency_by_periodo = {p.id: p.company_currency_id for p in periodos}
+
+        stored = self._bulk_stored_fields()
+        defaults = self.default_get(list(stored))
+        now = self.env.cr.now()
+
+        rows = []
+        for vals in vals_list:
+            row = dict(defaults, **vals)
+            currency = currency_by_periodo[row['periodo_id']]
+            row['currency_id'] = currency.id
+            self._bulk_round_monetary(row, currency)
+            row.update(create_uid=self.env.uid, create_date=now,
+                       write_uid=self.env.uid, write_date=now)
+            rows.append(self._bulk_compute_values(row))
+
+        columns = sorted({name for row in rows for name in row if name in stored})
+        row_sql = '(%s)' % ', '.join(['%s'] * len(columns))
+        columns_sql = ', '.join('"%s"' % name for name in columns)
+
+        ids = []
+        for batch in split_every(self._bulk_batch_size, rows):
+            query = 'INSERT INTO "%s" (%s) VALUES %s RETURNING id' % (
+                self._table, columns_sql, ', '.join([row_sql] * len(batch)),
+            )
+            params = [row.get(name) for row in batch for name in columns]
+            self.env.cr.execute(query, params)
+            ids.extend(row[0] for row in self.env.cr.fetchall())
+
+        # El ORM no se enteró de las filas nuevas: limpiar caché
+        self.invalidate_model()
+        periodos.invalidate_recordset()
+        return self.browse(ids)
+
+    @api.model
+    def _bulk_update(self, values_by_id):
+        """Actualizar líneas con UPDATE ... FROM (VALUES ...) en lotes.
+
+        :param values_by_id: dict {line_id: vals}; las filas se agrupan por
+            el conjunto de columnas que cambian.
+        """
+        if not values_by_id:
+            return
+        self.flush_model()
+        stored = self._bulk_stored_fields()
+        now = self.env.cr.now()
+
+        by_columns = {}
+        for line_id, vals in values_by_id.items():
+            columns = tuple(sorted(name for name in vals if name in stored))
+            by_columns.setdefault(columns, []).append((line_id, vals))
+
+        for columns, rows in by_columns.items():
+            if not columns:
+                continue
+            # Casts explícitos: VALUES no infiere tipos cuando hay NULLs
+            row_sql = '(%s)' % ', '.join(
+                ['%s::int4'] + ['%%s::%s' % stored[name].column_type[1] for name in columns]
+            )
+            set_sql = ', '.join('"%s" = v."%s"' % (name, name) for name in columns)
+            alias_sql = ', '.join(['id'] + ['"%s"' % name for name in columns])
+            for batch in split_every(self._bulk_batch_size, rows):
+                query = (
+                    'UPDATE "%s" AS t SET %s, write_uid = %%s, write_date = %%s '
+                    'FROM (VALUES %s) AS v(%s) WHERE t.id = v.id'
+                ) % (self._table, set_sql, ', '.join([row_sql] * len(batch)), alias_sql)
+                params = [self.env.uid, now]
+                for line_id, vals in batch:
+                    params.append(line_id)
+                    params.extend(vals[name] for name in columns)
+                self.env.cr.execute(query, params)
+
+        self.invalidate_model()
+
+    # ----------------- REGENERACIÓN DIFERENCIAL -----------------
+
+    @api.model
+    def _sync_changed_values(self, old, new, currency):
+        """Valores de ``new`` que difieren de la fila existente ``old``.
+
+        Solo se comparan los campos que escribe el cargador; los de
+        ``_libro_user_fields`` quedan fuera.
+        """
+        changed = {}
+        for name, value in new.items():
+            if name in self._libro_user_fields or name == 'periodo_id':
+                continue
+            field = self._fields[name]
+            current = old.get(name)
+            if field.type in ('monetary', 'float'):
+                # numeric llega como Decimal desde el cursor
+                if currency.compare_amounts(float(current or 0.0), value or 0.0):
+                    changed[name] = value
+            elif (current or False) != (value or False):
+                changed[name] = value
+        return changed
+
+    @api.model
+    def _sync_optional_defaults(self):
+        """Valores por defecto de ``_libro_loader_optional_fields`` (montos en 0)."""
+        fnames = self._libro_loader_optional_fields
+        defaults = self.default_get(fnames)
+        return {
+            name: defaults.get(name, 0.0 if self._fields[name].type in ('monetary', 'float') else None)
+            for name in fnames
+        }
+
+    @api.model
+    def _sync_period_lines(self, periodo, vals_list, move_ids=None):
+        """Regenerar las líneas de un periodo de forma diferencial por ``move_id``.
+
+        - inserta líneas para facturas nuevas
+        - actualiza solo los campos de origen que cambiaron
+        - elimina líneas cuyas facturas ya no pertenecen al periodo
+
+        Las líneas sin cambios y las clasificaciones del usuario no se tocan.
+
+        :param move_ids: si se indica, solo se consideran las líneas de esas
+            facturas (procesamiento por lotes); el resto del periodo queda igual.
+        :return: dict con los contadores created/updated/deleted/unchanged
+        """
+        self.flush_model()
+        currency = periodo.company_currency_id
+        # Solo se comparan y escriben las columnas del cargador. Las opcionales
+        # que una fila no trae (ej. factura que pasó de válida a anulada)
+        # vuelven a su valor por defecto.
+        optional = self._sync_optional_defaults()
+        new_by_move = {}
+        for vals in vals_list:
+            vals = self._bulk_round_monetary(dict(optional, **vals), currency)
+            new_by_move[vals['move_id']] = self._bulk_compute_values(vals)
+
+        # Los campos del usuario también se leen: ``_sync_changed_values``
+        # decide si alguno se debe forzar (ej. DTE duplicado)
+        compare_fields = sorted({
+            name for vals in new_by_move.values() for name in vals if name != 'periodo_id'
+        } | {'move_id'})
+        query = 'SELECT id, %s FROM "%s" WHERE periodo_id = %%s' % (
+            ', '.join('"%s"' % name for name in compare_fields), self._table,
+        )
+        params = [periodo.id]
+        if move_ids is not None:
+            query += ' AND move_id = ANY(%s)'
+            params.append(list(move_ids))
+        self.env.cr.execute(query + ' ORDER BY id', params)
+        existing_by_move = {}
+        to_delete = []
+        for row in self.env.cr.dictfetchall():
+            if row['move_id'] in new_by_move and row['move_id'] not in existing_by_move:
+                existing_by_move[row['move_id']] = row
+            else:
+                # Factura fuera del periodo (o línea repetida de la misma factura)
+                to_delete.append(row['id'])
+
+        to_create = []
+        to_update = {}
+        for move_id, vals in new_by_move.items():
+            old = existing_by_move.get(move_id)
+            if old is None:
+                to_create.append(vals)
+                continue
+            changed = self._sync_changed_values(old, vals, currency)
+            if changed:
+                to_update[old['id']] = changed
+
+        with periodo._profile_stage('insert'):
+            if to_delete:
+                # El libro completa lo derivado de sus líneas al terminar la generación
+                self.browse(to_delete).with_context(libro_generation=True).unlink()
+            self._bulk_update(to_update)
+            self._bulk_insert(to_create)
+        periodo.invalidate_recordset()
+        # Las escrituras por SQL no disparan el recálculo de los totales
+        with periodo._profile_stage('totals'):
+            periodo._recompute_totales()
+        periodo._profile_count(rows_written=len(to_delete) + len(to_update) + len(to_create))
+
+        stats = {
+            'created': len(to_create),
+            'updated': len(to_update),
+            'deleted': len(to_delete),
+            'unchanged': len(existing_by_move) - len(to_update),
+        }
+        _logger.info("%s %s: regeneración diferencial %s", periodo._name, periodo.id, stats)
+        return stats
+
+    # ----------------- LECTURA PARA EXPORTACIÓN -----------------
+
+    @api.model
+    def _export_read_rows(self, domain, fnames, partner_fnames=('name', 'vat')):
+        """Leer líneas por lotes como diccionarios, sin cargarlas en el ORM.
+
+        Cada fila trae los campos ``fnames`` (almacenados) más los campos
+        ``partner_fnames`` del proveedor/cliente con prefijo ``partner_``
+        (por defecto ``partner_name`` y ``partner_vat``). Solo los ids del
+        dominio se mantienen completos en memoria; las filas se leen de a
+        ``_export_batch_size``.
+        """
+        ids = self.search(domain, order=self._order).ids
+        return self._export_read_rows_by_ids(ids, fnames, partner_fnames)
+
+    @api.model
+    def _export_read_rows_by_ids(self, ids, fnames, partner_fnames=('name', 'vat')):
+        """Igual que ``_export_read_rows`` para ids ya ordenados."""
+        self.flush_model()
+        Partner = self.env['res.partner']
+        # Campos del partner sin columna (ej. localización no instalada) quedan en False
+        partner_columns = [name for name in partner_fnames if name in Partner._fields and Partner._fields[name].store]
+        Partner.flush_model(partner_columns)
+        numeric = [name for name in fnames if self._fields[name].type in ('monetary', 'float')]
+        query = """
+            SELECT %s
+              FROM "%s" l
+              LEFT JOIN res_partner p ON p.id = l.partner_id
+             WHERE l.id = ANY(%%s)
+          ORDER BY l.sequence, l.id
+        """ % (
+            ', '.join(['l."%s"' % name for name in fnames]
+                      + ['p."%s" AS "partner_%s"' % (name, name) for name in partner_columns]),
+            self._table,
+        )
+        for batch in split_every(self._export_batch_size, ids):
+            self.env.cr.execute(query, [list(batch)])
+            for row in self.env.cr.dictfetchall():
+                # Igual que el ORM: numeric como float y NULL como 0.0
+                for name in numeric:
+                    row[name] = float(row[name] or 0.0)
+                for name in partner_fnames:
+                    row.setdefault('partner_%s' % name, False)
+                yield row
+
+    @api.model
+    def _report_page_totals(self, ids, fnames, per_page):
+        """Subtotales de ``fnames`` por página para ids ya ordenados, en una consulta.
+
+        :return: lista de dicts {campo: subtotal}, uno por página
+        """
+        if not ids:
+            return []
+        self.flush_model(fnames)
+        self.env.cr.execute("""
+            SELECT (o.ord - 1) / %%s AS page, %s
+              FROM unnest(%%s::int[]) WITH ORDINALITY AS o(id, ord)
+              JOIN "%s" l ON l.id = o.id
+          GROUP BY 1
+          ORDER BY 1
+        """ % (', '.join('COALESCE(SUM(l."%s"), 0) AS "%s"' % (name, name) for name in fnames), self._table),
+            [per_page, list(ids)],
+        )
+        return [
+            {name: float(row[name]) for name in fnames}
+            for row in self.env.cr.dictfetchall()
+        ]
+
+    # ----------------- LECTURA PARA LA API -----------------
+
+    @api.model
+    def _api_fields(self):
+        """Columnas de la línea que se pueden pedir a la API de líneas."""
+        return [
+            name for name, field in self._fields.items()
+            if field.store and field.column_type and field.type != 'binary' and not field.translate
+        ]
+
+    @api.model
+    def _api_read_page(self, periodo_ids, fnames, partner_fnames=(), updated_since=None, after=None, limit=1000):
+        """Una página de líneas de ``periodo_ids`` en orden (periodo_id, id).
+
+        Se lee con una consulta plana (sin campos relacionados del ORM). La
+        página empieza después de la llave ``after`` (periodo_id, id) de la
+        última fila de la página anterior, así el costo no depende de cuántas
+        páginas se hayan leído. La llave no usa ``sequence``: la regeneración
+        renumera las líneas y una página podría saltarse o repetir filas. Los
+        permisos sobre los libros se resuelven antes, al elegir ``periodo_ids``.
+
+        :return: (filas, llave de la última fila o None)
+        """
+        self.flush_model()
+        Partner = self.env['res.partner']
+        partner_columns = [name for name in partner_fnames if name in Partner._fields and Partner._fields[name].store]
+        Partner.flush_model(partner_columns)
+        numeric = [name for name in fnames if self._fields[name].type in ('monetary', 'float')]
+
+        conditions = ['l.periodo_id = ANY(%(periodo_ids)s)']
+        if updated_since:
+            conditions.append('l.write_date >= %(updated_since)s')
+        if after:
+            conditions.append('(l.periodo_id, l.id) > %(after)s')
+        query = """
+            SELECT %s, l.periodo_id AS "__periodo_id", l.id AS "__id"
+              FROM "%s" l
+              %s
+             WHERE %s
+          ORDER BY l.periodo_id, l.id
+             LIMIT %%(limit)s
+        """ % (
+            ', '.join(['l."%s"' % name for name in fnames]
+                      + ['p."%s" AS "partner_%s"' % (name, name) for name in partner_columns]),
+            self._table,
+            'LEFT JOIN res_partner p ON p.id = l.partner_id' if partner_columns else '',
+            ' AND '.join(conditions),
+        )
+        self.env.cr.execute(query, {
+            'periodo_ids': list(periodo_ids),
+            'updated_since': updated_since,
+            'after': tuple(after) if after else None,
+            'limit': limit,
+        })
+        rows = self.env.cr.dictfetchall()
+        key = None
+        for row in rows:
+            key = (row.pop('__periodo_id'), row.pop('__id'))
+            # Igual que el ORM: numeric como float y NULL como 0.0
+            for name in numeric:
+                row[name] = float(row[name] or 0.0)
+            for name in partner_fnames:
+                row.setdefault('partner_%s' % name, False)
+        return rows, key
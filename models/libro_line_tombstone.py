@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.tools import split_every
+from odoo.tools.sql import create_index
+
+
+class LibroLineTombstone(models.Model):
+    """Registro de las líneas eliminadas, para la API de líneas.
+
+    La regeneración diferencial borra líneas de facturas que salieron del
+    periodo; sin este registro un sistema externo que sincroniza con
+    ``updated_since`` nunca se entera y conserva esas filas.
+    """
+    _name = 'libro.line.tombstone'
+    _description = 'Línea eliminada de un Libro de IVA'
+    _order = 'id'
+
+    # Días que se conservan los registros (parámetro de sistema
+    # ``libros_fiscales.api_eliminadas_dias``)
+    _retention_days = 90
+
+    line_model = fields.Char(string='Modelo de la Línea', required=True, readonly=True)
+    line_id = fields.Integer(string='ID de Línea', required=True, readonly=True)
+    periodo_id = fields.Integer(string='ID del Libro', readonly=True)
+    move_id = fields.Integer(string='ID de Factura', readonly=True)
+    company_id = fields.Many2one('res.company', string='Compañía', ondelete='cascade', readonly=True)
+
+    def init(self):
+        super().init()
+        # API de eliminadas: recorrido por modelo e id
+        create_index(self.env.cr, 'libro_line_tombstone_model_id_index', self._table, ['line_model', 'id'])
+
+    @api.model
+    def _record_deleted(self, line_model, line_ids=None, periodo_ids=None):
+        """Registrar las líneas ``line_ids`` (o todas las de ``periodo_ids``) antes de borrarlas.
+
+        Se copia con un INSERT ... SELECT por lote, sin leer las líneas en el ORM.
+        """
+        Line = self.env[line_model]
+        Periodo = self.env[Line._fields['periodo_id'].comodel_name]
+        if line_ids is not None:
+            column, ids = 'id', list(line_ids)
+        else:
+            column, ids = 'periodo_id', list(periodo_ids or ())
+        if not ids:
+            return
+        Line.flush_model(['periodo_id', 'move_id'])
+        self.flush_model()
+        now = self.env.cr.now()
+        query = """
+            INSERT INTO libro_line_tombstone
+                   (line_model, line_id, periodo_id, move_id, company_id,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT %%s, l.id, l.periodo_id, l.move_id, p.company_id, %%s, %%s, %%s, %%s
+              FROM "%s" l
+              LEFT JOIN "%s" p ON p.id = l.periodo_id
+             WHERE l."%s" = ANY(%%s)
+        """ % (Line._table, Periodo._table, column)
+        for batch in split_every(Line._bulk_batch_size, ids):
+            self.env.cr.execute(query, [line_model, self.env.uid, now, self.env.uid, now, list(batch)])
+
+    @api.model
+    def _api_read_page(self, line_model, company_ids, since=None, after=None, limit=1000):
+        """Una página de líneas eliminadas de ``line_model`` en orden de id.
+
+        :return: (filas, id del último registro o None)
+        """
+        self.flush_model()
+        conditions = ['line_model = %(line_model)s', 'company_id = ANY(%(company_ids)s)']
+        if since:
+            conditions.append('create_date >= %(since)s')
+        if after:
+            conditions.append('id > %(after)s')
+        self.env.cr.execute("""
+            SELECT id, line_id, periodo_id, move_id, company_id, create_date
+              FROM libro_line_tombstone
+             WHERE %s
+          ORDER BY id
+             LIMIT %%(limit)s
+        """ % ' AND '.join(conditions), {
+            'line_model': line_model,
+            'company_ids': list(company_ids),
+            'since': since,
+            'after': after,
+            'limit': limit,
+        })
+        rows = []
+        for row in self.env.cr.dictfetchall():
+            rows.append({
+                'id': row['line_id'],
+                'periodo_id': row['periodo_id'],
+                'move_id': row['move_id'],
+                'company_id': row['company_id'],
+                'deleted_at': fields.Datetime.to_string(row['create_date']),
+            })
+            after = row['id']
+        return rows, (after if rows else None)
+
+    @api.autovacuum
+    def _gc_tombstones(self):
+        """Borrar los registros más antiguos que el plazo de conservación."""
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'libros_fiscales.api_eliminadas_dias', self._retention_days))
+        self.env.cr.execute(
+            'DELETE FROM libro_line_tombstone WHERE create_date < %s',
+            [self.env.cr.now() - timedelta(days=days)],
+        )
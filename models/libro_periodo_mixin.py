@@ -0,0 +1,1006 @@
+import base64
+import csv
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.modules import get_manifest
+from odoo.tools import pdf
+from odoo.tools.safe_eval import safe_eval
+
+from .libro_generation_profile import LibroRunProfiler, libro_profiled
+
+_logger = logging.getLogger(__name__)
+
+
+class LibroPeriodoMixin(models.AbstractModel):
+    _name = 'libro.periodo.mixin'
+    _description = 'Utilidades comunes para periodos de Libros de IVA'
+
+    # Cada libro define su modelo de líneas, su cron y sus totales almacenados
+    _libro_line_model = None
+    _libro_generation_cron = None
+    _libro_total_fields = []
+
+    # Facturas por lote y tiempo máximo (segundos) por ejecución del cron,
+    # por debajo del limit_time_real_cron habitual
+    _generation_chunk_size = 2000
+    _generation_time_budget = 120
+    # Libros que el cron genera a la vez, cada uno en su hilo y cursor
+    # (parámetro de sistema ``libros_fiscales.generacion_procesos``)
+    _generation_workers = 4
+
+    # Bytes que un archivo exportado puede ocupar en memoria antes de pasar a disco
+    _export_spool_size = 4 * 1024 * 1024
+    # Bytes por bloque al enviar una exportación al navegador
+    _export_chunk_size = 64 * 1024
+    _export_mimetypes = {
+        'csv': 'text/csv',
+        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    }
+    # Filas por hoja de Excel (límite del formato .xlsx, incluye el encabezado)
+    _excel_max_rows = 1048576
+
+    # PDF: campos de cada línea, montos (con subtotales por página) y líneas por página
+    _report_line_fields = []
+    _report_amount_fields = []
+    _report_lines_per_page = 40
+    # Libros de más páginas se renderizan por tramos y se unen; los tramos van
+    # en paralelo solo si se configura ``libros_fiscales.pdf_procesos`` > 1
+    _report_pages_per_chunk = 25
+    _report_workers = 1
+
+    # Campos del proveedor/cliente que se congelan con las líneas al validar
+    _snapshot_partner_fields = ('name', 'vat', 'l10n_sv_nrc')
+    # Campos de dominio que se resuelven con columnas propias de la copia
+    _snapshot_domain_columns = {'move_id.state': 'move_state'}
+
+    # Columnas de línea y del proveedor/cliente que revisa la validación previa
+    # a la exportación (ver _check_book_columns)
+    _validation_fields = []
+    _validation_partner_fields = ('vat',)
+    # Diferencia máxima aceptada entre montos (redondeo por línea)
+    _validation_tolerance = 0.01
+
+    generation_state = fields.Selection([
+        ('none', 'Sin generación'),
+        ('queued', 'En cola'),
+        ('running', 'Generando'),
+        ('done', 'Terminada'),
+        ('failed', 'Con error'),
+    ], string='Generación en Segundo Plano', default='none', readonly=True, copy=False)
+
+    # Facturas a procesar, en el orden del libro (fijado al encolar)
+    generation_move_ids = fields.Json(string='Facturas a Procesar', readonly=True, copy=False)
+    # Numeración acumulada entre lotes (ver _prepare_book_lines)
+    generation_counters = fields.Json(string='Contadores de Generación', readonly=True, copy=False)
+    generation_total = fields.Integer(string='Total de Documentos', readonly=True, copy=False)
+    generation_processed = fields.Integer(string='Documentos Procesados', readonly=True, copy=False)
+    generation_started = fields.Datetime(string='Inicio de Generación', readonly=True, copy=False)
+    generation_error = fields.Text(string='Error de Generación', readonly=True, copy=False)
+
+    # Copia congelada de las líneas al validar (ver _prepare_snapshot_values)
+    snapshot = fields.Binary(string='Copia Congelada', attachment=True, readonly=True, copy=False)
+    snapshot_date = fields.Datetime(string='Fecha de Congelamiento', readonly=True, copy=False)
+    snapshot_checksum = fields.Char(string='Huella de la Copia', readonly=True, copy=False)
+
+    # Inconsistencias de la última validación (ver action_validate_book)
+    validation_finding_ids = fields.One2many(
+        'libro.validation.finding', 'res_id', string='Inconsistencias',
+        domain=lambda self: [('res_model', '=', self._name)], readonly=True, copy=False,
+    )
+    validation_error_count = fields.Integer(string='Errores', compute='_compute_validation_counts')
+    validation_warning_count = fields.Integer(string='Advertencias', compute='_compute_validation_counts')
+
+    generation_progress = fields.Float(string='Progreso', compute='_compute_generation_progress')
+    generation_eta = fields.Datetime(string='Fin Estimado', compute='_compute_generation_progress')
+
+    @api.depends('generation_state', 'generation_total', 'generation_processed', 'generation_started')
+    def _compute_generation_progress(self):
+        now = fields.Datetime.now()
+        for rec in self:
+            if rec.generation_total:
+                rec.generation_progress = 100.0 * rec.generation_processed / rec.generation_total
+            else:
+                rec.generation_progress = 100.0 if rec.generation_state == 'done' else 0.0
+            rec.generation_eta = False
+            if rec.generation_state == 'running' and rec.generation_started and rec.generation_processed:
+                elapsed = (now - rec.generation_started).total_seconds()
+                remaining = rec.generation_total - rec.generation_processed
+                rec.generation_eta = now + timedelta(seconds=elapsed / rec.generation_processed * remaining)
+
+    def _compute_validation_counts(self):
+        counts = {
+            (res_id, severity): count
+            for res_id, severity, count in self.env['libro.validation.finding']._read_group(
+                [('res_model', '=', self._name), ('res_id', 'in', self.ids)],
+                ['res_id', 'severity'], ['__count'],
+            )
+        }
+        for rec in self:
+            rec.validation_error_count = counts.get((rec.id, 'error'), 0)
+            rec.validation_warning_count = counts.get((rec.id, 'warning'), 0)
+
+    def _recompute_totales(self):
+        """Recalcular los totales almacenados tras escribir líneas por SQL."""
+        for fname in self._libro_total_fields:
+            self.env.add_to_compute(self._fields[fname], self)
+        self.flush_recordset(self._libro_total_fields)
+
+    # ----------------- COMPAÑÍAS -----------------
+
+    def _get_book_company_ids(self):
+        """Compañías cuyas facturas entran al libro: la del libro y, si se
+        incluyen sucursales, todas sus descendientes."""
+        self.ensure_one()
+        if self.incluir_sucursales:
+            return list(self.env['res.company']._libro_get_branch_ids(self.company_id.id))
+        return [self.company_id.id]
+
+    def _get_report_company(self):
+        """Compañía del encabezado: la casa matriz en libros consolidados."""
+        self.ensure_one()
+        if self.incluir_sucursales:
+            return self.env['res.company'].browse(self.env['res.company']._libro_get_root_id(self.company_id.id))
+        return self.company_id
+
+    # ----------------- PERFILES DE EJECUCIÓN -----------------
+
+    @contextmanager
+    def _profile_run(self, operation):
+        """Medir una generación o exportación y guardar su perfil.
+
+        Una ejecución dentro de otra suma al perfil en curso. Si la ejecución
+        falla (o se corta la descarga) no se guarda nada: la transacción se
+        revierte.
+        """
+        self.ensure_one()
+        profiler = LibroRunProfiler.current()
+        if profiler:
+            yield profiler
+            return
+        profiler = LibroRunProfiler.start_run()
+        try:
+            yield profiler
+        finally:
+            LibroRunProfiler.end_run()
+        values = profiler.stop()
+        self.env['libro.generation.profile']._record(self, operation, values)
+        _logger.info("%s %s: %s en %.2fs, %s consultas (%.2fs), etapas %s",
+                     self._name, self.id, operation, values['duration'],
+                     values['query_count'], values['query_time'], values['stages'])
+
+    @contextmanager
+    def _profile_stage(self, name):
+        """Sumar el tiempo del bloque a la etapa ``name`` del perfil en curso."""
+        profiler = LibroRunProfiler.current()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.stages[name] = profiler.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def _profile_count(self, rows_read=0, rows_written=0):
+        profiler = LibroRunProfiler.current()
+        if profiler:
+            profiler.counts['rows_read'] += rows_read
+            profiler.counts['rows_written'] += rows_written
+
+    def _profile_skip(self, reason, count):
+        """Documentos omitidos por ``reason`` en la ejecución en curso."""
+        profiler = LibroRunProfiler.current()
+        if profiler and count:
+            profiler.skipped[reason] = profiler.skipped.get(reason, 0) + count
+
+    def action_view_profiles(self):
+        """Perfiles de ejecución del libro (lista exportable)."""
+        self.ensure_one()
+        return {
+            'name': 'Perfiles de Ejecución',
+            'type': 'ir.actions.act_window',
+            'res_model': 'libro.generation.profile',
+            'view_mode': 'list,form',
+            'domain': [('res_model', '=', self._name), ('res_id', '=', self.id)],
+        }
+
+    # ----------------- BLOQUEO -----------------
+
+    def _generation_fields(self):
+        return [name for name in self._fields if name.startswith('generation_')]
+
+    def _check_generation_not_running(self):
+        """Impedir cambios mientras el libro se genera en segundo plano."""
+        if any(rec.generation_state in ('queued', 'running') for rec in self):
+            raise UserError("El libro se está generando en segundo plano. "
+                            "Espere a que termine para modificarlo.")
+
+    def write(self, vals):
+        """Bloquea edición mientras corre la generación, salvo el progreso del propio proceso."""
+        if not set(vals) <= set(self._generation_fields()):
+            self._check_generation_not_running()
+        return super().write(vals)
+
+    # ----------------- GENERACIÓN EN SEGUNDO PLANO -----------------
+
+    def action_load_invoices_background(self):
+        """Generar Detalle en segundo plano, por lotes y con progreso."""
+        self.ensure_one()
+        self._check_generation_not_running()
+        if self.state != 'draft':
+            raise UserError("Solo puedes modificar libros en estado Borrador.")
+
+        moves = self._get_book_moves()
+        self.write({
+            'generation_state': 'queued',
+            'generation_move_ids': moves.ids,
+            'generation_counters': {},
+            'generation_total': len(moves),
+            'generation_processed': 0,
+            'generation_started': False,
+            'generation_error': False,
+        })
+        self.env.ref(self._libro_generation_cron)._trigger()
+
+    def _finish_book_generation(self, counters):
+        """Hook al terminar la carga del libro (sincrónica o por lotes)."""
+        return
+
+    @api.model
+    def _cron_process_generation(self):
+        """Procesar lotes de los libros en cola hasta agotar el tiempo asignado.
+
+        Los libros se generan en paralelo, cada uno en su propio hilo y
+        cursor, hasta ``libros_fiscales.generacion_procesos`` a la vez (0 o 1
+        = uno tras otro con el cursor del cron). Cada lote se confirma por
+        separado: si el proceso muere, la siguiente ejecución continúa desde
+        el último lote guardado.
+        """
+        deadline = time.monotonic() + self._generation_time_budget
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+
+        periodo_ids = self.search([('generation_state', 'in', ('queued', 'running'))]).ids
+        workers = min(self._get_int_param('libros_fiscales.generacion_procesos', self._generation_workers),
+                      len(periodo_ids))
+        if workers <= 1 or not auto_commit:
+            for periodo in self.browse(periodo_ids):
+                periodo._run_generation(deadline, auto_commit)
+                if time.monotonic() >= deadline:
+                    break
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(lambda periodo_id: self._run_generation_worker(periodo_id, deadline), periodo_ids))
+            # Terminar la transacción del cron para ver lo que confirmaron los hilos
+            self.env.cr.commit()
+            self.env.invalidate_all()
+
+        if self.search_count([('generation_state', 'in', ('queued', 'running'))], limit=1):
+            self.env.ref(self._libro_generation_cron)._trigger()
+
+    @api.model
+    def _run_generation_worker(self, periodo_id, deadline):
+        """Generar un libro con un cursor propio (en un hilo del cron)."""
+        threading.current_thread().dbname = self.env.cr.dbname
+        if time.monotonic() >= deadline:
+            return
+        with self.env.registry.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            env[self._name].browse(periodo_id)._run_generation(deadline, auto_commit=True)
+
+    def _run_generation(self, deadline, auto_commit):
+        """Procesar lotes del libro hasta terminarlo o agotar ``deadline``.
+
+        Un error marca el libro como fallido con el mensaje, que se ve en el
+        libro y en los resultados del asistente por lotes.
+        """
+        self.ensure_one()
+        while self.generation_state in ('queued', 'running') and time.monotonic() < deadline:
+            if not self._lock_for_generation():
+                # Otro proceso ya está trabajando en este libro
+                break
+            try:
+                self._process_generation_chunk()
+            except Exception as e:
+                if not auto_commit:
+                    raise
+                self.env.cr.rollback()
+                _logger.exception("%s %s: error en la generación en segundo plano", self._name, self.id)
+                self.write({'generation_state': 'failed', 'generation_error': str(e)})
+            if auto_commit:
+                self.env.cr.commit()
+
+    def _lock_for_generation(self):
+        """Bloquear la fila del libro; False si otro proceso la tiene."""
+        self.ensure_one()
+        self.env.cr.execute(
+            'SELECT id FROM "%s" WHERE id = %%s FOR UPDATE SKIP LOCKED' % self._table,
+            [self.id],
+        )
+        return bool(self.env.cr.fetchone())
+
+    @libro_profiled('load_chunk')
+    def _process_generation_chunk(self):
+        """Procesar el siguiente lote de facturas del libro."""
+        self.ensure_one()
+        Line = self.env[self._libro_line_model]
+        if self.generation_state == 'queued':
+            self.write({'generation_state': 'running', 'generation_started': fields.Datetime.now()})
+
+        move_ids = self.generation_move_ids or []
+        start = self.generation_processed
+        chunk_ids = move_ids[start:start + self._generation_chunk_size]
+        counters = dict(self.generation_counters or {})
+
+        if chunk_ids:
+            # Volver a aplicar el filtro del libro: la factura pudo cambiar
+            # desde que se encoló (ej. pasó a borrador)
+            with self._profile_stage('search'):
+                moves = self._get_book_moves(extra_domain=[('id', 'in', chunk_ids)])
+            with self._profile_stage('classification'):
+                lines_values = self._prepare_book_lines(moves, counters)
+            self._profile_count(rows_read=len(moves))
+            Line._sync_period_lines(self, lines_values, move_ids=chunk_ids)
+
+        processed = start + len(chunk_ids)
+        vals = {'generation_processed': processed, 'generation_counters': counters}
+        if processed >= len(move_ids):
+            # Líneas de facturas que salieron del periodo desde la última generación
+            Line.search([('periodo_id', '=', self.id), ('move_id', 'not in', move_ids)]).with_context(
+                libro_generation=True).unlink()
+            self._finish_book_generation(counters)
+            vals.update(generation_state='done', generation_move_ids=False)
+            _logger.info("%s %s: generación en segundo plano terminada (%s documentos)",
+                         self._name, self.id, processed)
+        self.write(vals)
+
+    # ----------------- COPIA CONGELADA -----------------
+
+    def _validate_with_snapshot(self):
+        """Validar los libros congelando sus líneas en la misma escritura.
+
+        Con el libro ya validado ``write`` no acepta otros campos, así que el
+        estado y la copia se guardan juntos.
+        """
+        for rec in self:
+            rec.write(dict(rec._prepare_snapshot_values(), state='validated'))
+
+    def _prepare_snapshot_values(self):
+        """Congelar las líneas del libro, con los datos del proveedor/cliente y
+        los totales, como columnas JSON comprimidas.
+
+        Mientras el libro siga validado, las exportaciones y el PDF se sirven
+        desde esta copia: cambios posteriores en facturas o contactos no
+        alteran lo que se presentó.
+
+        :return: valores de ``snapshot``, ``snapshot_date`` y ``snapshot_checksum``
+        """
+        self.ensure_one()
+        Line = self.env[self._libro_line_model]
+        fnames = [
+            name for name in Line._bulk_stored_fields()
+            if name not in ('create_uid', 'create_date', 'write_uid', 'write_date')
+        ]
+        rows = list(Line._export_read_rows(
+            [('periodo_id', '=', self.id)], ['id'] + fnames, self._snapshot_partner_fields,
+        ))
+        self.env.cr.execute("""
+            SELECT l.id, m.state
+              FROM "%s" l
+              JOIN account_move m ON m.id = l.move_id
+             WHERE l.periodo_id = %%s
+        """ % Line._table, [self.id])
+        move_state = dict(self.env.cr.fetchall())
+
+        columns = {
+            name: [row[name] for row in rows]
+            for name in ['id'] + fnames + ['partner_%s' % p for p in self._snapshot_partner_fields]
+        }
+        columns['move_state'] = [move_state.get(row['id']) for row in rows]
+        data = zlib.compress(json.dumps({
+            'version': 1,
+            'count': len(rows),
+            'columns': columns,
+            'totals': {name: self[name] for name in self._libro_total_fields},
+        }, default=str, separators=(',', ':')).encode(), 9)
+        return {
+            'snapshot': base64.b64encode(data),
+            'snapshot_date': fields.Datetime.now(),
+            'snapshot_checksum': hashlib.sha1(data).hexdigest(),
+        }
+
+    def _has_snapshot(self):
+        self.ensure_one()
+        return self.state == 'validated' and bool(self.snapshot_checksum)
+
+    def _load_snapshot(self):
+        """Copia congelada descomprimida (una vez por transacción)."""
+        self.ensure_one()
+        cache = self.env.cr.cache.setdefault('libro_snapshots', {})
+        key = (self._name, self.id, self.snapshot_checksum)
+        if key not in cache:
+            raw = self.with_context(bin_size=False).snapshot
+            data = json.loads(zlib.decompress(base64.b64decode(raw)))
+            Line = self.env[self._libro_line_model]
+            for name, values in data['columns'].items():
+                field = Line._fields.get(name)
+                if field is not None and field.type == 'date':
+                    data['columns'][name] = [fields.Date.to_date(value) for value in values]
+            cache[key] = data
+        return cache[key]
+
+    def _snapshot_rows(self, domain):
+        """Filas de la copia congelada que cumplen ``domain``, en el orden del libro.
+
+        Solo se admiten condiciones ``campo = valor``; con cualquier otra, o si
+        el libro no tiene copia, devuelve None y se lee de las tablas.
+        """
+        self.ensure_one()
+        if not self._has_snapshot():
+            return None
+        data = self._load_snapshot()
+        columns = data['columns']
+        checks = []
+        for leaf in domain:
+            name, operator, value = leaf
+            column = self._snapshot_domain_columns.get(name, name)
+            if operator != '=' or column not in columns:
+                return None
+            if column == 'periodo_id':
+                # Todas las filas son de este libro
+                if value != self.id:
+                    return []
+                continue
+            checks.append((columns[column], value))
+        names = list(columns)
+        return [
+            {name: columns[name][index] for name in names}
+            for index in range(data['count'])
+            if all(column[index] == value for column, value in checks)
+        ]
+
+    def _book_has_rows(self, domain):
+        """Si hay líneas del libro que cumplen ``domain``."""
+        rows = self._snapshot_rows(domain)
+        if rows is not None:
+            return bool(rows)
+        return bool(self.env[self._libro_line_model].search_count(domain, limit=1))
+
+    def _read_book_rows(self, domain, fnames, partner_fnames=('name', 'vat')):
+        """Líneas del libro como diccionarios: de la copia congelada si el libro
+        está validado, o de las tablas (ver ``_export_read_rows``)."""
+        rows = self._snapshot_rows(domain)
+        if rows is not None:
+            return iter(rows)
+        return self.env[self._libro_line_model]._export_read_rows(domain, fnames, partner_fnames)
+
+    # ----------------- VALIDACIÓN PREVIA A LA EXPORTACIÓN -----------------
+
+    def _get_validation_domain(self):
+        """Líneas que se revisan: las que van al archivo de Hacienda."""
+        return self._get_export_domain()
+
+    def _read_validation_columns(self):
+        """Líneas a revisar como columnas: {campo: [valor de cada línea]}.
+
+        Se leen en una pasada con ``_read_book_rows`` (copia congelada o
+        tablas), sin cargar las líneas en el ORM.
+        """
+        fnames = ['id', 'sequence', 'numero_documento'] + list(self._validation_fields)
+        partner_fnames = tuple(self._validation_partner_fields)
+        columns = {name: [] for name in fnames}
+        columns.update({'partner_%s' % name: [] for name in partner_fnames})
+        appenders = [(name, column.append) for name, column in columns.items()]
+        for row in self._read_book_rows(self._get_validation_domain(), fnames, partner_fnames):
+            for name, append in appenders:
+                append(row.get(name))
+        return columns
+
+    def _check_book_columns(self, columns):
+        """Reglas del libro sobre las columnas de ``_read_validation_columns``.
+
+        Cada libro la sobrescribe y devuelve tuplas
+        ``(índice de la línea, regla, severidad, mensaje)``.
+        """
+        return []
+
+    def _amounts_differ(self, left, right):
+        return abs(left - right) > self._validation_tolerance + 1e-9
+
+    def _validate_book(self):
+        """Revisar todas las líneas del libro en una sola pasada por columnas.
+
+        :return: lista de valores de ``libro.validation.finding``
+        """
+        self.ensure_one()
+        start = time.monotonic()
+        columns = self._read_validation_columns()
+        findings = [{
+            'res_model': self._name,
+            'res_id': self.id,
+            'line_id': columns['id'][index],
+            'sequence': columns['sequence'][index],
+            'numero_documento': columns['numero_documento'][index],
+            'rule': rule,
+            'severity': severity,
+            'message': message,
+        } for index, rule, severity, message in self._check_book_columns(columns)]
+        _logger.info("%s %s: %s líneas validadas en %.3fs, %s inconsistencias",
+                     self._name, self.id, len(columns['id']), time.monotonic() - start, len(findings))
+        return findings
+
+    def _run_book_validation(self):
+        """Validar el libro y guardar las inconsistencias encontradas."""
+        self.ensure_one()
+        with self._profile_stage('validation'):
+            return self.env['libro.validation.finding']._replace_findings(self, self._validate_book())
+
+    def action_validate_book(self):
+        """Botón "Revisar Inconsistencias": validar y dejar el resumen en el chatter."""
+        for rec in self:
+            findings = rec._run_book_validation()
+            errors = len(findings.filtered(lambda f: f.severity == 'error'))
+            rec.message_post(
+                body=f"Revisión previa a la exportación: {errors} error(es) y "
+                     f"{len(findings) - errors} advertencia(s).",
+                subtype_xmlid="mail.mt_note",
+            )
+        return True
+
+    def unlink(self):
+        self._check_generation_not_running()
+        for model in ('libro.validation.finding', 'libro.generation.profile'):
+            self.env[model].sudo().search([('res_model', '=', self._name), ('res_id', 'in', self.ids)]).unlink()
+        # Las líneas se borran en cascada desde la base de datos
+        self.env['libro.line.tombstone'].sudo()._record_deleted(self._libro_line_model, periodo_ids=self.ids)
+        return super().unlink()
+
+    # ----------------- EXPORTACIÓN -----------------
+
+    def _get_export_spec(self, fmt):
+        """Contenido de la exportación ``fmt`` ('csv' o 'xlsx') de cada libro.
+
+        Cada libro la sobrescribe para los formatos que ofrece; cualquier
+        otro formato termina aquí con un error para el usuario.
+
+        :return: dict con ``kind`` (tipo para la caché), ``domain``,
+            ``filename`` y ``rows`` (iterador de filas); en 'xlsx' además
+            ``sheet_title`` y ``headers``.
+        """
+        raise UserError(f"El libro no se puede exportar en formato {fmt}.")
+
+    def _export_cache_key(self, kind, domain):
+        """Huella de una exportación: tipo de archivo, libro, líneas incluidas
+        (con su write_date) y sus proveedores/clientes.
+
+        Dos exportaciones con la misma huella producen el mismo archivo.
+        """
+        self.ensure_one()
+        if self._has_snapshot():
+            fingerprint = hashlib.sha1('|'.join([
+                get_manifest('libros_fiscales')['version'], self.snapshot_checksum, repr(domain),
+            ]).encode()).hexdigest()
+            return f'libro_export:{kind}:{fingerprint}'
+
+        Line = self.env[self._libro_line_model]
+        ids = Line.search(domain).ids
+        Line.flush_model()
+        self.env['res.partner'].flush_model(['write_date'])
+        self.env.cr.execute("""
+            SELECT md5(string_agg(l.id || '@' || l.write_date || '@' || COALESCE(p.write_date::text, ''),
+                                  ',' ORDER BY l.id))
+              FROM "%s" l
+              LEFT JOIN res_partner p ON p.id = l.partner_id
+             WHERE l.id = ANY(%%s)
+        """ % Line._table, [ids])
+        lines_digest = self.env.cr.fetchone()[0] or ''
+        company = self._get_report_company()
+        fingerprint = hashlib.sha1('|'.join([
+            get_manifest('libros_fiscales')['version'],
+            str(self.write_date), str(company.write_date), str(company.partner_id.write_date),
+            str(len(ids)), lines_digest,
+        ]).encode()).hexdigest()
+        return f'libro_export:{kind}:{fingerprint}'
+
+    def _export_cache_lookup(self, kind, domain):
+        """Buscar una exportación idéntica ya generada.
+
+        :return: (cache_key, acción de descarga o None)
+        """
+        cache_key = self._export_cache_key(kind, domain)
+        attachment = self.env['ir.attachment'].search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('description', '=', cache_key),
+        ], limit=1)
+        return cache_key, (self._export_download_action(attachment) if attachment else None)
+
+    def _export_evict_stale(self, attachment):
+        """Eliminar las exportaciones anteriores del mismo tipo para este libro."""
+        kind_prefix = attachment.description.rsplit(':', 1)[0]
+        self.env['ir.attachment'].search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('description', '=like', kind_prefix + ':%'),
+            ('id', '!=', attachment.id),
+        ]).unlink()
+
+    @api.model
+    def _get_int_param(self, key, default):
+        """Parámetro de sistema entero; ``default`` si no existe o no es un número."""
+        value = self.env['ir.config_parameter'].sudo().get_param(key)
+        try:
+            return int(value) if value else default
+        except ValueError:
+            _logger.warning("Parámetro de sistema %s inválido: %r", key, value)
+            return default
+
+    def _export_persist_copy(self):
+        """Guardar una copia de cada exportación como adjunto (auditoría).
+
+        Parámetro de sistema ``libros_fiscales.export_guardar_copia``; por
+        defecto los archivos solo se envían al navegador.
+        """
+        value = self.env['ir.config_parameter'].sudo().get_param('libros_fiscales.export_guardar_copia', 'False')
+        return value.strip().lower() in ('1', 'true', 'yes', 'si', 'sí')
+
+    def _export_action(self, fmt):
+        """Acción de descarga de la exportación ``fmt`` ('csv' o 'xlsx').
+
+        Si ya hay una exportación idéntica guardada (ver _export_cache_lookup)
+        se descarga esa al instante; si no, el archivo se genera mientras se
+        envía (ver controllers/main.py).
+        """
+        self.ensure_one()
+        spec = self._get_export_spec(fmt)
+        cache_key, cached = self._export_cache_lookup(spec['kind'], spec['domain'])
+        if cached:
+            return cached
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/libros_fiscales/export/{self._name}/{self.id}/{fmt}',
+            'target': 'self',
+        }
+
+    def _export_stream_info(self, fmt):
+        """Nombre y mimetype de la exportación; falla antes de empezar a enviar."""
+        self.ensure_one()
+        spec = self._get_export_spec(fmt)
+        if fmt == 'xlsx':
+            self._export_openpyxl()
+        return spec['filename'], self._export_mimetypes[fmt]
+
+    def _export_stream_chunks(self, fmt):
+        """Contenido de la exportación ``fmt`` en bloques de bytes.
+
+        El CSV se codifica a medida que se leen las líneas. El .xlsx es un zip
+        cuyo índice va al final, así que se arma en un archivo temporal y se
+        envía por bloques. Con copia de auditoría el archivo enviado queda
+        además como adjunto en caché.
+        """
+        self.ensure_one()
+        spec = self._get_export_spec(fmt)
+        persist = self._export_persist_copy()
+        operation = 'csv' if fmt == 'csv' else 'excel'
+        with self._profile_run(operation), \
+                tempfile.SpooledTemporaryFile(max_size=self._export_spool_size) as spool:
+            cache_key = persist and self._export_cache_key(spec['kind'], spec['domain'])
+            if fmt == 'csv':
+                for chunk in self._export_csv_chunks(spec['rows']):
+                    if persist:
+                        spool.write(chunk)
+                    yield chunk
+            else:
+                self._export_excel_write(spec['sheet_title'], spec['headers'], spec['rows'], spool)
+                spool.seek(0)
+                with self._profile_stage('write'):
+                    for chunk in iter(lambda: spool.read(self._export_chunk_size), b''):
+                        yield chunk
+            if persist:
+                self._export_store_file(spool, spec['filename'], self._export_mimetypes[fmt], cache_key)
+
+    def _export_csv_chunks(self, rows):
+        """Escribir ``rows`` como CSV de Hacienda (';', sin encabezados) en bloques de bytes."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=';')  # Separador punto y coma
+        count = 0
+        with self._profile_stage('write'):
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+                if buffer.tell() >= self._export_chunk_size:
+                    yield buffer.getvalue().encode()
+                    buffer.seek(0)
+                    buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode()
+        self._profile_count(rows_read=count, rows_written=count)
+
+    def _export_openpyxl(self):
+        try:
+            from openpyxl import Workbook
+            from openpyxl.cell import WriteOnlyCell
+            from openpyxl.styles import Font, Alignment, PatternFill
+        except ImportError:
+            raise UserError("La librería 'openpyxl' no está instalada. Instálela con: pip install openpyxl")
+        return Workbook, WriteOnlyCell, Font, Alignment, PatternFill
+
+    def _export_excel_write(self, sheet_title, headers, rows, file_obj):
+        """Escribir ``rows`` en un .xlsx en modo write-only dentro de ``file_obj``.
+
+        Los estilos del encabezado se crean una sola vez y se comparten. Si
+        una hoja llega al límite de filas, se continúa en una hoja nueva.
+        """
+        Workbook, WriteOnlyCell, Font, Alignment, PatternFill = self._export_openpyxl()
+
+        wb = Workbook(write_only=True)
+
+        # Estilos (compartidos por todas las hojas)
+        header_font = Font(bold=True, color="FFFFFF")
+        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+        header_alignment = Alignment(horizontal='center')
+
+        def new_sheet(number):
+            title = sheet_title if number == 1 else f"{sheet_title} ({number})"
+            ws = wb.create_sheet(title=title[:31])
+            header_row = []
+            for header in headers:
+                cell = WriteOnlyCell(ws, value=header)
+                cell.font = header_font
+                cell.fill = header_fill
+                cell.alignment = header_alignment
+                header_row.append(cell)
+            ws.append(header_row)
+            return ws
+
+        sheet_number = 1
+        count = 0
+        with self._profile_stage('write'):
+            ws = new_sheet(sheet_number)
+            sheet_rows = 1
+            for row in rows:
+                if sheet_rows >= self._excel_max_rows:
+                    sheet_number += 1
+                    ws = new_sheet(sheet_number)
+                    sheet_rows = 1
+                ws.append(row)
+                sheet_rows += 1
+                count += 1
+            wb.save(file_obj)
+        self._profile_count(rows_read=count, rows_written=count)
+
+    def _export_store_file(self, file_obj, filename, mimetype, cache_key=False):
+        """Crear el adjunto del libro copiando ``file_obj`` directo al filestore.
+
+        Evita el paso por base64 y las copias en memoria del contenido. Si el
+        almacenamiento de adjuntos no es en disco, se usa el camino normal.
+        Con ``cache_key`` el adjunto queda en caché (ver _export_cache_lookup)
+        y reemplaza a las exportaciones anteriores del mismo tipo.
+        """
+        self.ensure_one()
+        attachment = self._export_create_attachment(file_obj, {
+            'name': filename,
+            'type': 'binary',
+            'res_model': self._name,
+            'res_id': self.id,
+            'mimetype': mimetype,
+            'description': cache_key,
+        })
+        if cache_key:
+            self._export_evict_stale(attachment)
+        return attachment
+
+    def _export_create_attachment(self, file_obj, values):
+        """Crear el ir.attachment con el contenido de ``file_obj``."""
+        Attachment = self.env['ir.attachment']
+        if Attachment._storage() != 'file':
+            file_obj.seek(0)
+            return Attachment.create(dict(values, raw=file_obj.read()))
+
+        # Checksum y tamaño leyendo por bloques
+        sha = hashlib.sha1()
+        size = 0
+        file_obj.seek(0)
+        for block in iter(lambda: file_obj.read(1024 * 1024), b''):
+            sha.update(block)
+            size += len(block)
+        checksum = sha.hexdigest()
+
+        # Misma ubicación que usa ir.attachment (_get_path)
+        fname = checksum[:2] + '/' + checksum
+        full_path = Attachment._full_path(fname)
+        if not os.path.isfile(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            file_obj.seek(0)
+            with open(full_path, 'wb') as dest:
+                shutil.copyfileobj(file_obj, dest)
+        # Si la transacción se revierte, el GC del filestore lo limpia
+        Attachment._mark_for_gc(fname)
+
+        return Attachment.create(dict(values, store_fname=fname, checksum=checksum, file_size=size))
+
+    def _export_download_action(self, attachment):
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{attachment.id}?download=true',
+            'target': 'self',
+        }
+
+    # ----------------- REPORTE PDF -----------------
+
+    def _get_report_domain(self):
+        """Líneas que se imprimen en el PDF del libro."""
+        self.ensure_one()
+        return [('periodo_id', '=', self.id)]
+
+    def _get_report_page_ids(self):
+        """Ids de las líneas del PDF agrupados por página, en el orden del libro."""
+        self.ensure_one()
+        Line = self.env[self._libro_line_model]
+        ids = Line.search(self._get_report_domain(), order=Line._order).ids
+        per_page = self._report_lines_per_page
+        return ids, [ids[start:start + per_page] for start in range(0, len(ids), per_page)] or [[]]
+
+    def _get_report_page_count(self):
+        self.ensure_one()
+        domain = self._get_report_domain()
+        rows = self._snapshot_rows(domain)
+        count = len(rows) if rows is not None else self.env[self._libro_line_model].search_count(domain)
+        return max(1, math.ceil(count / self._report_lines_per_page))
+
+    def _get_report_pages(self, page_from=0, page_to=None):
+        """Páginas del PDF con sus líneas y los acarreos "vienen"/"van".
+
+        Los subtotales de todas las páginas salen de una sola consulta; solo
+        se leen las líneas de las páginas ``page_from`` a ``page_to`` (sin
+        incluir), así cada tramo del PDF arranca con el acarreo correcto.
+        Los libros validados se imprimen desde la copia congelada.
+
+        :return: dict con ``pages``, ``totals`` (sumas de las líneas impresas)
+            y ``book_totals`` (totales del libro)
+        """
+        self.ensure_one()
+        Line = self.env[self._libro_line_model]
+        amount_fields = self._report_amount_fields
+        per_page = self._report_lines_per_page
+        fnames = self._report_line_fields + amount_fields
+
+        snapshot_rows = self._snapshot_rows(self._get_report_domain())
+        if snapshot_rows is not None:
+            page_rows = [snapshot_rows[start:start + per_page]
+                         for start in range(0, len(snapshot_rows), per_page)] or [[]]
+            page_totals = [{name: sum(row[name] for row in rows) for name in amount_fields} for rows in page_rows]
+            book_totals = self._load_snapshot()['totals']
+
+            def read_page(index):
+                return page_rows[index]
+        else:
+            ids, page_ids = self._get_report_page_ids()
+            page_totals = Line._report_page_totals(ids, amount_fields, per_page)
+            book_totals = {name: self[name] for name in self._libro_total_fields}
+
+            def read_page(index):
+                return list(Line._export_read_rows_by_ids(page_ids[index], fnames, self._snapshot_partner_fields))
+
+        page_count = max(len(page_totals), 1)
+        if page_to is None:
+            page_to = page_count
+
+        running = dict.fromkeys(amount_fields, 0.0)
+        pages = []
+        for index in range(page_count):
+            vienen = dict(running)
+            for name, amount in (page_totals[index] if index < len(page_totals) else {}).items():
+                running[name] += amount
+            if not page_from <= index < page_to:
+                continue
+            pages.append({
+                'number': index + 1,
+                'count': page_count,
+                'is_first': index == 0,
+                'is_last': index == page_count - 1,
+                # Última página de un tramo (no del libro): sin salto final
+                'ends_chunk': index == page_to - 1 < page_count - 1,
+                'vienen': vienen,
+                'van': dict(running),
+                'lines': read_page(index),
+            })
+        return {'pages': pages, 'totals': running, 'book_totals': book_totals}
+
+    @libro_profiled('pdf')
+    def _print_book_report(self, report_ref):
+        """Imprimir el libro; si es largo, por tramos de páginas que se unen.
+
+        Por defecto los tramos se renderizan uno tras otro con el cursor
+        actual. Con el parámetro de sistema ``libros_fiscales.pdf_procesos``
+        mayor que 1, cada tramo va en su propio hilo y cursor (wkhtmltopdf
+        corre fuera de Python). Esos cursores solo ven lo confirmado: si la
+        transacción actual ya escribió algo (ej. el detalle se generó en la
+        misma llamada), se vuelve al modo secuencial, así el PDF siempre
+        refleja lo que ve el usuario. Si el libro no cambió desde la última
+        impresión se devuelve el mismo PDF.
+        """
+        self.ensure_one()
+        report = self.env.ref(report_ref)
+        cache_key, cached = self._export_cache_lookup('pdf', self._get_report_domain())
+        if cached:
+            return cached
+
+        page_count = self._get_report_page_count()
+        per_chunk = self._report_pages_per_chunk
+        with self._profile_stage('write'):
+            if page_count <= per_chunk:
+                content, _ = self.env['ir.actions.report']._render_qweb_pdf(report_ref, self.ids)
+            else:
+                chunks = [(start, min(start + per_chunk, page_count)) for start in range(0, page_count, per_chunk)]
+                workers = self._get_int_param('libros_fiscales.pdf_procesos', self._report_workers)
+                if workers <= 1 or self._has_pending_writes():
+                    contents = [
+                        self.env['ir.actions.report']._render_qweb_pdf(
+                            report_ref, self.ids, data={'page_from': page_from, 'page_to': page_to},
+                        )[0]
+                        for page_from, page_to in chunks
+                    ]
+                else:
+                    with ThreadPoolExecutor(max_workers=workers) as executor:
+                        contents = list(executor.map(
+                            lambda chunk: self._render_report_chunk(report_ref, *chunk), chunks,
+                        ))
+                _logger.info("%s %s: PDF de %s páginas en %s tramos", self._name, self.id, page_count, len(chunks))
+                content = pdf.merge_pdf(contents)
+
+        filename = safe_eval(report.print_report_name, {'object': self, 'time': time}) + '.pdf'
+        with tempfile.SpooledTemporaryFile(max_size=self._export_spool_size) as spool:
+            spool.write(content)
+            attachment = self._export_store_file(spool, filename, 'application/pdf', cache_key)
+        return self._export_download_action(attachment)
+
+    def _has_pending_writes(self):
+        """La transacción actual escribió en la base (cambios que otro cursor no ve)."""
+        self.env.flush_all()
+        self.env.cr.execute('SELECT txid_current_if_assigned()')
+        return self.env.cr.fetchone()[0] is not None
+
+    def _render_report_chunk(self, report_ref, page_from, page_to):
+        """Renderizar un tramo de páginas del PDF con un cursor propio (en un hilo)."""
+        threading.current_thread().dbname = self.env.cr.dbname
+        with self.env.registry.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            content, _ = env['ir.actions.report']._render_qweb_pdf(
+                report_ref, [self.id], data={'page_from': page_from, 'page_to': page_to},
+            )
+        return content
+
+    # ----------------- API DE LÍNEAS -----------------
+
+    @api.model
+    def _api_search_periodo_ids(self, company_ids, period_from=None, period_to=None, domain=()):
+        """Libros visibles para el usuario en las compañías y el rango de periodos.
+
+        La búsqueda pasa por el ORM (permisos y reglas multicompañía); las
+        líneas luego se leen por SQL solo de estos libros.
+
+        :param period_from: (año, mes) inicial incluido
+        :param period_to: (año, mes) final incluido
+        """
+        domain = [('company_id', 'in', list(company_ids))] + list(domain)
+        if period_from:
+            year, month = period_from
+            domain += ['|', ('year', '>', year), '&', ('year', '=', year), ('month', '>=', '%02d' % month)]
+        if period_to:
+            year, month = period_to
+            domain += ['|', ('year', '<', year), '&', ('year', '=', year), ('month', '<=', '%02d' % month)]
+        periodos = self.with_context(allowed_company_ids=list(company_ids)).search(domain, order='id')
+        return periodos.ids
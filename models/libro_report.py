@@ -0,0 +1,41 @@
+from odoo import models, api
+
+
+class ReportLibroCompras(models.AbstractModel):
+    _name = 'report.libros_fiscales.report_libro_compras_template'
+    _description = 'Reporte PDF del Libro de Compras'
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        """Totales y páginas calculados en el servidor (ver _get_report_pages)."""
+        docs = self.env['libro.compras.periodo'].browse(docids)
+        data = data or {}
+        return {
+            'doc_ids': docids,
+            'doc_model': 'libro.compras.periodo',
+            'docs': docs,
+            'reports': {
+                doc.id: doc._get_report_pages(data.get('page_from', 0), data.get('page_to'))
+                for doc in docs
+            },
+        }
+
+
+class ReportLibroVentas(models.AbstractModel):
+    _name = 'report.libros_fiscales.report_libro_ventas_template'
+    _description = 'Reporte PDF del Libro de Ventas'
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        """Totales y páginas calculados en el servidor (ver _get_report_pages)."""
+        docs = self.env['libro.ventas.periodo'].browse(docids)
+        data = data or {}
+        return {
+            'doc_ids': docids,
+            'doc_model': 'libro.ventas.periodo',
+            'docs': docs,
+            'reports': {
+                doc.id: doc._get_report_pages(data.get('page_from', 0), data.get('page_to'))
+                for doc in docs
+            },
+        }
@@ -0,0 +1,71 @@
+import re
+
+from odoo import models, fields, api
+
+# Separadores que se aceptan al escribir NIT/NRC/DUI
+_ID_SEPARATORS = re.compile(r'[\s\-/.]')
+
+
+def libro_id_digits(value):
+    """Documento de identidad sin separadores (guiones, espacios, barras)."""
+    return _ID_SEPARATORS.sub('', value or '')
+
+
+def libro_check_dui(value):
+    """DUI: 9 dígitos, el último verificador (módulo 10 con pesos 9..2)."""
+    digits = libro_id_digits(value)
+    if len(digits) != 9 or not digits.isdigit():
+        return False
+    total = sum(int(digit) * weight for digit, weight in zip(digits[:8], range(9, 1, -1)))
+    return (10 - total % 10) % 10 == int(digits[8])
+
+
+def libro_check_nit(value):
+    """NIT: 14 dígitos, o el DUI homologado como NIT (9 dígitos)."""
+    digits = libro_id_digits(value)
+    if not digits.isdigit():
+        return False
+    return len(digits) == 14 or (len(digits) == 9 and libro_check_dui(digits))
+
+
+def libro_check_nrc(value):
+    """NRC: de 2 a 8 dígitos (el último es verificador)."""
+    digits = libro_id_digits(value)
+    return digits.isdigit() and 2 <= len(digits) <= 8
+
+
+class LibroValidationFinding(models.Model):
+    _name = 'libro.validation.finding'
+    _description = 'Inconsistencia detectada en un Libro de IVA'
+    _order = 'severity, sequence, id'
+
+    res_model = fields.Char(string='Modelo del Libro', required=True, index=True, readonly=True)
+    res_id = fields.Many2oneReference(string='Libro', model_field='res_model', required=True, index=True, readonly=True)
+    line_id = fields.Integer(string='ID de Línea', readonly=True)
+    sequence = fields.Integer(string='No', readonly=True)
+    numero_documento = fields.Char(string='Documento', readonly=True)
+    rule = fields.Selection([
+        ('documento_identidad', 'NIT/NRC/DUI'),
+        ('credito_fiscal', 'Crédito Fiscal'),
+        ('debito_fiscal', 'Débito Fiscal'),
+        ('totales', 'Totales'),
+        ('no_emitida', 'DTE No Emitido'),
+        ('tipo_documento', 'Tipo/Clase de Documento'),
+    ], string='Regla', required=True, readonly=True)
+    severity = fields.Selection([
+        ('error', 'Error'),
+        ('warning', 'Advertencia'),
+    ], string='Severidad', required=True, default='error', readonly=True)
+    message = fields.Char(string='Detalle', readonly=True)
+
+    @api.model
+    def _replace_findings(self, periodo, vals_list):
+        """Sustituir las inconsistencias guardadas de un libro por ``vals_list``."""
+        self.flush_model()
+        self.env.cr.execute(
+            'DELETE FROM libro_validation_finding WHERE res_model = %s AND res_id = ANY(%s)',
+            [periodo._name, periodo.ids],
+        )
+        self.invalidate_model()
+        periodo.invalidate_recordset(['validation_finding_ids', 'validation_error_count', 'validation_warning_count'])
+        return self.create(vals_list)
@@ -1,11 +1,29 @@
 from odoo import models, fields, api
+from odoo.tools import float_is_zero
 
 
 class LibroVentasLine(models.Model):
     _name = 'libro.ventas.line'
+    _inherit = ['libro.line.mixin']
     _description = 'Línea de Libro de Ventas'
     _order = 'sequence, id'
 
+    # Ajustes manuales que se conservan al regenerar
+    _libro_user_fields = ['select', 'tipo_operacion_renta', 'tipo_ingreso_renta']
+    # Montos que solo traen las facturas válidas (las anuladas no los envían)
+    _libro_loader_optional_fields = [
+        'ventas_exentas_no_sujetas', 'ventas_no_sujetas', 'ventas_gravadas_locales',
+        'exportaciones_centroamerica', 'exportaciones_fuera_centroamerica',
+        'exportaciones_servicios', 'ventas_zonas_francas', 'ventas_cuenta_terceros',
+    ]
+
+    # Columnas O, P, Q y R: el cargador deja todo en "fuera de CA" y el
+    # usuario puede redistribuir el monto entre ellas.
+    _libro_export_fields = [
+        'exportaciones_centroamerica', 'exportaciones_fuera_centroamerica',
+        'exportaciones_servicios', 'ventas_zonas_francas',
+    ]
+
     periodo_id = fields.Many2one(
         'libro.ventas.periodo',
         string='Periodo',
@@ -15,15 +33,15 @@ class LibroVentasLine(models.Model):
     sequence = fields.Integer(string='No')
 
     # Campos de referencia
-    move_id = fields.Many2one('account.move', string='Factura')
+    move_id = fields.Many2one('account.move', string='Factura', index=True)
     partner_id = fields.Many2one('res.partner', string='Cliente')
 
     invoice_date = fields.Date(string='Fecha Emisión')
 
     # Campos específicos de ventas
     numero_documento = fields.Char(string='Número de Documento')
-    numero_control = fields.Char(string='Número de Control')
-    codigo_generacion = fields.Char(string='Código Generación')
+    numero_control = fields.Char(string='Número de Control', index='btree_not_null')
+    codigo_generacion = fields.Char(string='Código Generación', index='btree_not_null')
     sello_recepcion = fields.Char(string='Sello Recepción')
     tipo_documento = fields.Char(string='Tipo Documento')
     tipo_documento_nombre = fields.Char(string='Tipo Documento', compute='_compute_tipo_documento_nombre')
@@ -150,3 +168,66 @@ class LibroVentasLine(models.Model):
                 rec.no_emitida = True
             else:
                 rec.no_emitida = False
+
+    # El resumen diario del libro se mantiene al día con las ediciones: solo
+    # se recalculan los grupos (día, tipo, clase) de las líneas tocadas. La
+    # generación del libro (contexto libro_generation) lo reconstruye una vez
+    # al terminar.
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._refresh_resumen_diario(lines._resumen_keys())
+        return lines
+
+    def write(self, vals):
+        tracked = bool(set(vals) & set(self.env['libro.ventas.resumen.diario']._summary_source_fields))
+        keys = self._resumen_keys() if tracked else set()
+        res = super().write(vals)
+        if tracked:
+            self._refresh_resumen_diario(keys | self._resumen_keys())
+        return res
+
+    def unlink(self):
+        keys = self._resumen_keys()
+        res = super().unlink()
+        self._refresh_resumen_diario(keys)
+        return res
+
+    def _resumen_keys(self):
+        """Grupos del resumen diario de estas líneas: (periodo_id, fecha, tipo, clase)."""
+        if self.env.context.get('libro_generation'):
+            return set()
+        return {
+            (line.periodo_id.id, line.invoice_date, line.tipo_documento or '', '4' if line.codigo_generacion else '1')
+            for line in self
+            if line.periodo_id.tipo_libro == 'consumidor'
+        }
+
+    def _refresh_resumen_diario(self, keys):
+        self.env['libro.ventas.resumen.diario']._refresh_groups(keys)
+
+    @api.model
+    def _bulk_compute_values(self, vals):
+        """Calcular no_emitida en la misma pasada de la carga masiva."""
+        vals = super()._bulk_compute_values(vals)
+        vals['no_emitida'] = bool(
+            vals.get('codigo_generacion') and vals.get('numero_control')
+            and not vals.get('sello_recepcion')
+        )
+        return vals
+
+    @api.model
+    def _sync_changed_values(self, old, new, currency):
+        """Conservar la reclasificación de exportaciones hecha por el usuario.
+
+        Si el total exportado no cambió, la distribución entre columnas
+        O/P/Q/R es del usuario y no se toca.
+        """
+        changed = super()._sync_changed_values(old, new, currency)
+        if any(name in changed for name in self._libro_export_fields):
+            old_total = sum(float(old.get(name) or 0.0) for name in self._libro_export_fields)
+            new_total = sum(new.get(name) or 0.0 for name in self._libro_export_fields)
+            if float_is_zero(old_total - new_total, precision_rounding=currency.rounding):
+                for name in self._libro_export_fields:
+                    changed.pop(name, None)
+        return changed
@@ -1,16 +1,41 @@
+import re
+
 from odoo import models, fields, api
 from odoo.exceptions import UserError
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-import io
-import csv
-import base64
+
+from .libro_generation_profile import libro_profiled
+from .libro_validation_finding import libro_check_nit, libro_check_nrc
 
 
 class LibroVentasPeriodo(models.Model):
     _name = 'libro.ventas.periodo'
     _description = 'Periodo del Libro de Ventas'
     _rec_name = 'periodo'
+    _libro_line_model = 'libro.ventas.line'
+    _libro_generation_cron = 'libros_fiscales.ir_cron_libro_ventas_generation'
+    _libro_total_fields = ['total_ventas_exentas', 'total_ventas_gravadas', 'total_debito_fiscal']
+    _report_line_fields = ['sequence', 'invoice_date', 'numero_documento']
+    _report_amount_fields = ['ventas_exentas', 'ventas_gravadas', 'debito_fiscal', 'amount_total']
+    # Columnas de montos que deben sumar el total de la venta
+    _validation_amount_fields = [
+        'ventas_exentas', 'ventas_no_sujetas', 'ventas_gravadas', 'debito_fiscal',
+        'exportaciones_centroamerica', 'exportaciones_fuera_centroamerica',
+        'exportaciones_servicios', 'ventas_zonas_francas', 'ventas_cuenta_terceros',
+    ]
+    _validation_fields = ['tipo_documento', 'codigo_generacion', 'numero_control', 'no_emitida', 'amount_total'] \
+        + _validation_amount_fields
+    _validation_partner_fields = ('vat', 'l10n_sv_nrc')
+    # Montos del CSV de Consumidor Final (columnas K-S y total)
+    _consumidor_csv_amount_fields = [
+        'ventas_exentas', 'ventas_exentas_no_sujetas', 'ventas_no_sujetas',
+        'ventas_gravadas_locales', 'exportaciones_centroamerica',
+        'exportaciones_fuera_centroamerica', 'exportaciones_servicios',
+        'ventas_zonas_francas', 'ventas_cuenta_terceros', 'amount_total',
+    ]
+    # Prefijo y número final de un documento impreso, ej. "TIQ/2025/000123"
+    _printed_number_re = re.compile(r'^(.*?)(\d+)$')
 
     company_id = fields.Many2one(
         'res.company',
@@ -54,7 +79,14 @@ class LibroVentasPeriodo(models.Model):
         ('credito', 'Crédito Fiscal'),
     ], string='Tipo de Libro', required=True, readonly=True)
 
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    csv_rangos_impresos = fields.Boolean(
+        string='Agrupar Impresos en Rangos',
+        help='CSV de Consumidor Final: los documentos impresos consecutivos del mismo día '
+             'y tipo se informan en una sola fila (Del/Al) con los montos sumados. '
+             'Los DTE siempre van uno por fila.'
+    )
+
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'libro.periodo.mixin']
 
     state = fields.Selection([
         ('draft', 'Borrador'),
@@ -95,6 +127,14 @@ class LibroVentasPeriodo(models.Model):
         domain=[('move_id.state', '=', 'cancel')]
     )
 
+    # Totales por día, tipo y clase (Consumidor Final), ver _rebuild_resumen_diario
+    resumen_diario_ids = fields.One2many(
+        'libro.ventas.resumen.diario',
+        'periodo_id',
+        string='Resumen Diario',
+        readonly=True,
+    )
+
     company_currency_id = fields.Many2one(
         'res.currency',
         related='company_id.currency_id',
@@ -102,22 +142,25 @@ class LibroVentasPeriodo(models.Model):
         store=True,
     )
 
-    # Campos calculados
+    # Campos calculados (almacenados, ver _compute_totales)
     total_ventas_exentas = fields.Monetary(
         string="Total Ventas Exentas",
         compute="_compute_totales",
+        store=True,
         currency_field="company_currency_id",
     )
 
     total_ventas_gravadas = fields.Monetary(
         string="Total Ventas Gravadas",
         compute="_compute_totales",
+        store=True,
         currency_field="company_currency_id",
     )
 
     total_debito_fiscal = fields.Monetary(
         string="Total Débito Fiscal",
         compute="_compute_totales",
+        store=True,
         currency_field="company_currency_id",
     )
 
@@ -147,23 +190,50 @@ class LibroVentasPeriodo(models.Model):
 
     def action_select_all(self):
         """Seleccionar todas las líneas."""
+        self._check_generation_not_running()
         for rec in self:
             rec.invoice_line_ids.write({'select': True})
 
     def action_unselect_all(self):
         """Deseleccionar todas las líneas."""
+        self._check_generation_not_running()
         for rec in self:
             rec.invoice_line_ids.write({'select': False})
 
     @api.depends("invoice_line_ids.ventas_exentas",
                  "invoice_line_ids.ventas_gravadas",
-                 "invoice_line_ids.debito_fiscal")
+                 "invoice_line_ids.debito_fiscal",
+                 "invoice_line_ids.move_id.state")
     def _compute_totales(self):
+        """Totales con un solo SUM en la base de datos, sin cargar las líneas.
+
+        Solo suman las facturas válidas, igual que ``invoice_line_ids``.
+        """
+        totals = {
+            periodo.id: (exentas, gravadas, debito)
+            for periodo, exentas, gravadas, debito in self.env['libro.ventas.line']._read_group(
+                [('periodo_id', 'in', [pid for pid in self._origin.ids if pid]),
+                 ('move_id.state', '=', 'posted')],
+                ['periodo_id'],
+                ['ventas_exentas:sum', 'ventas_gravadas:sum', 'debito_fiscal:sum'],
+            )
+        }
         for rec in self:
-            rec.total_ventas_exentas = sum(rec.invoice_line_ids.mapped("ventas_exentas"))
+            exentas, gravadas, debito = totals.get(rec._origin.id, (0.0, 0.0, 0.0))
+            rec.total_ventas_exentas = exentas
             # Sumar ventas_gravadas (subtotal sin IVA) para mostrar en Odoo
-            rec.total_ventas_gravadas = sum(rec.invoice_line_ids.mapped("ventas_gravadas"))
-            rec.total_debito_fiscal = sum(rec.invoice_line_ids.mapped("debito_fiscal"))
+            rec.total_ventas_gravadas = gravadas
+            rec.total_debito_fiscal = debito
+
+    def _finish_book_generation(self, counters):
+        """El resumen diario se reconstruye una sola vez por generación."""
+        super()._finish_book_generation(counters)
+        self._rebuild_resumen_diario()
+
+    def _rebuild_resumen_diario(self):
+        """Reconstruir el resumen diario de los libros de Consumidor Final."""
+        self.env['libro.ventas.resumen.diario']._rebuild(
+            self.filtered(lambda p: p.tipo_libro == 'consumidor'))
 
     # ----------------- RESTRICCIONES -----------------
 
@@ -178,8 +248,8 @@ class LibroVentasPeriodo(models.Model):
 
     def action_mark_done(self):
         """Validar el libro."""
-        for rec in self:
-            rec.state = 'validated'
+        # Congelar lo que se valida (exportaciones y reimpresiones salen de aquí)
+        self._validate_with_snapshot()
 
     def action_reset_to_draft(self):
         """Volver a borrador."""
@@ -188,31 +258,30 @@ class LibroVentasPeriodo(models.Model):
 
     # ----------------- LÓGICA DE LIBRO -----------------
 
+    @libro_profiled('load')
     def action_load_invoices(self):
         """Generar Detalle: carga facturas del mes según tipo de libro."""
         self.ensure_one()
+        self._check_generation_not_running()
 
-        if not self.year or not self.month:
-            raise UserError("Debe especificar Año y Mes.")
-
-        # Calcular fechas
-        date_from = datetime(self.year, int(self.month), 1).date()
-        # Último día del mes
-        date_to = (date_from + relativedelta(months=1, days=-1))
+        with self._profile_stage('search'):
+            moves = self._get_book_moves()
+        counters = {}
+        with self._profile_stage('classification'):
+            lines_values = self._prepare_book_lines(moves, counters)
+        self._profile_count(rows_read=len(moves))
 
-        # Determinar las compañías a incluir
-        if self.incluir_sucursales:
-            # Incluir empresa actual + todas sus sucursales
-            company_ids = [self.company_id.id] + self.company_id.child_ids.ids
-        else:
-            # Solo la empresa actual
-            company_ids = [self.company_id.id]
+        # Regeneración diferencial por factura (válidas y anuladas juntas):
+        # inserta nuevas, actualiza las que cambiaron y elimina las que
+        # salieron del periodo. Conserva los ajustes manuales del usuario.
+        self.env['libro.ventas.line']._sync_period_lines(self, lines_values)
+        self._finish_book_generation(counters)
 
-        # Limpiar líneas anteriores (tanto normales como anuladas)
-        self.invoice_line_ids.unlink()
-        self.invoice_line_ids_cancelled.unlink()
+        # Forzar recálculo de totales (igual que en compras)
+        self.invalidate_recordset(['invoice_line_ids', 'invoice_line_ids_cancelled'])
 
-        # Definir tipos de documentos según el libro
+    def _get_book_doc_types(self):
+        """Tipos de documento y de movimiento válidos según el tipo de libro."""
         if self.tipo_libro == 'consumidor':
             # Consumidor Final: Solo 01, 02, 10, 11 según manual Hacienda
             # Las notas de crédito/débito NO son válidas en Anexo 2
@@ -223,324 +292,363 @@ class LibroVentasPeriodo(models.Model):
             # Crédito Fiscal (03) y Notas de Crédito/Débito relacionadas
             allowed_doc_types = ['03', '05', '06']
             move_types = ['out_invoice', 'out_refund']
+        return allowed_doc_types, move_types
 
-        # --- 1. CARGAR FACTURAS VALIDAS (POSTED) ---
-        invoices = self.env['account.move'].search([
-            ('move_type', 'in', move_types),
-            ('state', '=', 'posted'),
-            ('invoice_date', '>=', date_from),
-            ('invoice_date', '<=', date_to),
-            ('company_id', 'in', company_ids),
-        ], order='invoice_date asc, name asc, id asc')
-
-        lines_values = []
-        sequence = 1
-
-        for inv in invoices:
-            # Filtrar por tipo de documento DTE
-            doc_type_code = inv.l10n_latam_document_type_id.code
-            if doc_type_code not in allowed_doc_types:
-                continue
-
-            # Mapeo de campos DTE
-            numero_documento = inv.name
-            numero_control = inv.tgr_l10n_sv_edi_numero_control or ''
-            codigo_generacion = inv.tgr_l10n_sv_edi_codigo_generacion or ''
-            sello_recepcion = inv.tgr_l10n_sv_edi_sello_recibido or ''
-            tipo_documento = inv.l10n_latam_document_type_id.code or ''
+    def _get_book_moves(self, extra_domain=None):
+        """Documentos del periodo (válidos y anulados) en el orden del libro."""
+        self.ensure_one()
 
+        if not self.year or not self.month:
+            raise UserError("Debe especificar Año y Mes.")
 
+        # Calcular fechas
+        date_from = datetime(self.year, int(self.month), 1).date()
+        # Último día del mes
+        date_to = (date_from + relativedelta(months=1, days=-1))
 
-            # Montos: DIFERENCIA ENTRE CONSUMIDOR FINAL Y CRÉDITO FISCAL
-            # - Consumidor Final: IVA incluido en precio → reportar monto TOTAL
-            # - Crédito Fiscal: IVA separado → reportar solo SUBTOTAL sin IVA
-            ventas_exentas = 0.0
-            ventas_gravadas = 0.0
-            debito_fiscal = 0.0
-            
-            # Nuevos campos para CSV Hacienda
-            ventas_exentas_no_sujetas = 0.0
-            ventas_no_sujetas = 0.0
-            ventas_gravadas_locales = 0.0
-            exportaciones_centroamerica = 0.0
-            exportaciones_fuera_centroamerica = 0.0
-            exportaciones_servicios = 0.0
-            ventas_zonas_francas = 0.0
-            ventas_cuenta_terceros = 0.0
+        # Determinar las compañías a incluir (con sucursales de todos los niveles)
+        company_ids = self._get_book_company_ids()
 
+        allowed_doc_types, move_types = self._get_book_doc_types()
 
-            # Determinar si la factura tiene impuestos y si están incluidos en precio
-            has_taxes = any(line.tax_ids for line in inv.invoice_line_ids)
-            
-            if has_taxes:
-                # Verificar si ALGÚN impuesto tiene price_include=True (Consumidor Final)
-                tax_ids = inv.invoice_line_ids.mapped('tax_ids')
-                price_include = any(tax.price_include for tax in tax_ids)
-                
-                # Para TODOS los casos (consumidor y crédito):
-                # ventas_gravadas y ventas_gravadas_locales = SUBTOTAL sin IVA
-                ventas_gravadas = inv.amount_untaxed
-                ventas_gravadas_locales = inv.amount_untaxed
-                debito_fiscal = inv.amount_total - inv.amount_untaxed
-            else:
-                # Facturas sin impuesto son exentas
-                ventas_exentas = inv.amount_untaxed
-                ventas_gravadas = 0.0
-                ventas_gravadas_locales = 0.0
-                debito_fiscal = 0.0
-            
-            # Si es factura de exportación (11), mover a exportaciones
-            if tipo_documento == '11':
-                # Por defecto a fuera de CA, usuario puede cambiarlo
-                exportaciones_fuera_centroamerica = inv.amount_total if price_include else inv.amount_untaxed
-                ventas_gravadas_locales = 0.0
-                ventas_gravadas = 0.0
-                ventas_exentas = 0.0
-                debito_fiscal = 0.0  # Exportaciones no tienen débito fiscal
-
-            # Crear diccionario para la línea
-            lines_values.append({
-                'periodo_id': self.id,
-                'sequence': sequence,
-                'move_id': inv.id,
-                'partner_id': inv.partner_id.id,
-                'invoice_date': inv.invoice_date,
-                'numero_documento': numero_documento,
-                'numero_control': numero_control,
-                'codigo_generacion': codigo_generacion,
-                'sello_recepcion': sello_recepcion,
-                'tipo_documento': tipo_documento,
-                'ventas_exentas': ventas_exentas,
-                'ventas_gravadas': ventas_gravadas, # Mantener para compatibilidad
-                'debito_fiscal': debito_fiscal,
-                'amount_total': inv.amount_total,
-                # Nuevos campos
-                'ventas_exentas_no_sujetas': ventas_exentas_no_sujetas,
-                'ventas_no_sujetas': ventas_no_sujetas,
-                'ventas_gravadas_locales': ventas_gravadas_locales,
-                'exportaciones_centroamerica': exportaciones_centroamerica,
-                'exportaciones_fuera_centroamerica': exportaciones_fuera_centroamerica,
-                'exportaciones_servicios': exportaciones_servicios,
-                'ventas_zonas_francas': ventas_zonas_francas,
-                'ventas_cuenta_terceros': ventas_cuenta_terceros,
-                'select': True,  # Auto-seleccionar al cargar
-            })
-            sequence += 1
-
-        # Crear líneas de facturas válidas
-        self.env['libro.ventas.line'].create(lines_values)
-        
-        # Forzar recálculo de totales (igual que en compras)
-        self.invalidate_recordset(['invoice_line_ids'])
-
-        # --- 2. CARGAR FACTURAS ANULADAS (CANCEL) ---
-        cancelled_invoices = self.env['account.move'].search([
-            ('move_type', 'in', ['out_invoice', 'out_refund']),
-            ('state', '=', 'cancel'),
+        # --- LECTURA ÚNICA DEL PERIODO (VÁLIDAS Y ANULADAS) ---
+        # El filtro por tipo de documento va en la base de datos, así no se
+        # leen documentos que luego se descartan (ej. tiquetes de otro tipo).
+        doc_types = self.env['l10n_latam.document.type'].search([('code', 'in', allowed_doc_types)])
+        return self.env['account.move'].search([
             ('invoice_date', '>=', date_from),
             ('invoice_date', '<=', date_to),
             ('company_id', 'in', company_ids),
-        ])
-
-        cancelled_lines_values = []
-        # Reiniciar secuencia o continuar? Generalmente anuladas tienen su propia lista o se mezclan.
-        # Aquí las pondremos en su propia pestaña, así que secuencia propia.
-        seq_cancelled = 1
+            ('l10n_latam_document_type_id', 'in', doc_types.ids),
+            '|',
+            '&', ('state', '=', 'posted'), ('move_type', 'in', move_types),
+            '&', ('state', '=', 'cancel'), ('move_type', 'in', ['out_invoice', 'out_refund']),
+        ] + (extra_domain or []), order='invoice_date asc, name asc, id asc')
+
+    def _prepare_book_lines(self, moves, counters):
+        """Valores de línea para ``moves``, separando válidas de anuladas en una pasada.
+
+        ``counters`` lleva la numeración de cada pestaña ('posted' y
+        'cancel') y se actualiza en sitio, para poder continuar la
+        numeración entre lotes.
+        """
+        tax_ids_by_move = self._get_tax_ids_by_move(moves.filtered(lambda m: m.state == 'posted').ids)
+        lines_values = []
+        for move in moves:
+            if move.state == 'posted':
+                counters['posted'] = counters.get('posted', 0) + 1
+                lines_values.append(self._prepare_posted_line_values(
+                    move, counters['posted'], tax_ids_by_move.get(move.id, ())))
+            else:
+                # Las anuladas van en su propia pestaña, así que secuencia propia.
+                counters['cancel'] = counters.get('cancel', 0) + 1
+                lines_values.append(self._prepare_cancelled_line_values(move, counters['cancel']))
+        return lines_values
+
+    def _get_tax_ids_by_move(self, move_ids):
+        """Impuestos de las líneas de factura, agrupados por factura.
+
+        Mismo criterio que ``invoice_line_ids.tax_ids`` en el ORM (que se lee
+        con ``active_test=False``: incluye los impuestos archivados), en una
+        sola consulta para todo el lote.
+
+        :return: dict {move_id: lista de tax_ids}
+        """
+        if not move_ids:
+            return {}
+        self.env['account.move.line'].flush_model(['move_id', 'display_type', 'tax_ids'])
+        self.env.cr.execute("""
+            SELECT aml.move_id, array_agg(DISTINCT rel.account_tax_id)
+              FROM account_move_line aml
+              JOIN account_move_line_account_tax_rel rel ON rel.account_move_line_id = aml.id
+             WHERE aml.move_id = ANY(%s)
+               AND aml.display_type IN ('product', 'line_section', 'line_note')
+          GROUP BY aml.move_id
+        """, [list(move_ids)])
+        return dict(self.env.cr.fetchall())
+
+    def _prepare_posted_line_values(self, inv, sequence, tax_ids=None):
+        """Valores de línea para una factura válida (POSTED).
+
+        :param tax_ids: impuestos de la factura (ver ``_get_tax_ids_by_move``);
+            si no se indican se consultan para esta factura.
+        """
+        # Mapeo de campos DTE
+        numero_documento = inv.name
+        numero_control = inv.tgr_l10n_sv_edi_numero_control or ''
+        codigo_generacion = inv.tgr_l10n_sv_edi_codigo_generacion or ''
+        sello_recepcion = inv.tgr_l10n_sv_edi_sello_recibido or ''
+        tipo_documento = inv.l10n_latam_document_type_id.code or ''
+
+        # Montos: DIFERENCIA ENTRE CONSUMIDOR FINAL Y CRÉDITO FISCAL
+        # - Consumidor Final: IVA incluido en precio → reportar monto TOTAL
+        # - Crédito Fiscal: IVA separado → reportar solo SUBTOTAL sin IVA
+        ventas_exentas = 0.0
+        ventas_gravadas = 0.0
+        debito_fiscal = 0.0
+        price_include = False
+
+        # Nuevos campos para CSV Hacienda
+        ventas_exentas_no_sujetas = 0.0
+        ventas_no_sujetas = 0.0
+        ventas_gravadas_locales = 0.0
+        exportaciones_centroamerica = 0.0
+        exportaciones_fuera_centroamerica = 0.0
+        exportaciones_servicios = 0.0
+        ventas_zonas_francas = 0.0
+        ventas_cuenta_terceros = 0.0
+
+        # Clasificar la factura por sus impuestos (mapa en caché por compañía)
+        if tax_ids is None:
+            tax_ids = self._get_tax_ids_by_move([inv.id]).get(inv.id, ())
+        Tax = self.env['account.tax']
+        tax_classes = Tax._libro_tax_classification(inv.company_id.id)
+        classes = {tax_classes.get(tax_id) or Tax.browse(tax_id)._libro_classify() for tax_id in tax_ids}
+
+        if classes and classes <= {'exento'}:
+            # Impuestos marcados como exentos
+            ventas_exentas = inv.amount_untaxed
+        elif classes and classes <= {'no_sujeto'}:
+            ventas_no_sujetas = inv.amount_untaxed
+        elif classes:
+            # Verificar si ALGÚN impuesto tiene price_include=True (Consumidor Final)
+            price_include = 'incluido' in classes
+
+            # Para TODOS los casos (consumidor y crédito):
+            # ventas_gravadas y ventas_gravadas_locales = SUBTOTAL sin IVA
+            ventas_gravadas = inv.amount_untaxed
+            ventas_gravadas_locales = inv.amount_untaxed
+            debito_fiscal = inv.amount_total - inv.amount_untaxed
+        else:
+            # Facturas sin impuesto son exentas
+            ventas_exentas = inv.amount_untaxed
+            ventas_gravadas = 0.0
+            ventas_gravadas_locales = 0.0
+            debito_fiscal = 0.0
 
-        for inv in cancelled_invoices:
-            # Filtrar por tipo de documento DTE
-            doc_type_code = inv.l10n_latam_document_type_id.code
-            if doc_type_code not in allowed_doc_types:
-                continue
+        # Si es factura de exportación (11) o con impuestos de tasa cero, mover a exportaciones
+        if tipo_documento == '11' or (classes and classes <= {'exportacion'}):
+            # Por defecto a fuera de CA, usuario puede cambiarlo
+            exportaciones_fuera_centroamerica = inv.amount_total if price_include else inv.amount_untaxed
+            ventas_gravadas_locales = 0.0
+            ventas_gravadas = 0.0
+            ventas_exentas = 0.0
+            ventas_no_sujetas = 0.0
+            debito_fiscal = 0.0  # Exportaciones no tienen débito fiscal
 
-            # Mapeo de campos DTE
-            numero_documento = inv.name
-            numero_control = inv.tgr_l10n_sv_edi_numero_control or ''
-            codigo_generacion = inv.tgr_l10n_sv_edi_codigo_generacion or ''
-            sello_recepcion = inv.tgr_l10n_sv_edi_sello_recibido or ''
-            tipo_documento = inv.l10n_latam_document_type_id.code or ''
+        return {
+            'periodo_id': self.id,
+            'sequence': sequence,
+            'move_id': inv.id,
+            'partner_id': inv.partner_id.id,
+            'invoice_date': inv.invoice_date,
+            'numero_documento': numero_documento,
+            'numero_control': numero_control,
+            'codigo_generacion': codigo_generacion,
+            'sello_recepcion': sello_recepcion,
+            'tipo_documento': tipo_documento,
+            'ventas_exentas': ventas_exentas,
+            'ventas_gravadas': ventas_gravadas, # Mantener para compatibilidad
+            'debito_fiscal': debito_fiscal,
+            'amount_total': inv.amount_total,
+            # Nuevos campos
+            'ventas_exentas_no_sujetas': ventas_exentas_no_sujetas,
+            'ventas_no_sujetas': ventas_no_sujetas,
+            'ventas_gravadas_locales': ventas_gravadas_locales,
+            'exportaciones_centroamerica': exportaciones_centroamerica,
+            'exportaciones_fuera_centroamerica': exportaciones_fuera_centroamerica,
+            'exportaciones_servicios': exportaciones_servicios,
+            'ventas_zonas_francas': ventas_zonas_francas,
+            'ventas_cuenta_terceros': ventas_cuenta_terceros,
+            'select': True,  # Auto-seleccionar al cargar
+        }
 
-            # Para anuladas, los montos suelen ser 0 o se muestran informativamente.
-            # El usuario pidió "el mismo filtro", asumiremos que quiere ver los datos aunque estén anuladas.
-            # Pero contablemente no suman. En el reporte se verá.
-            
-            ventas_exentas = 0.0
-            ventas_gravadas = 0.0
-            debito_fiscal = 0.0
+    def _prepare_cancelled_line_values(self, inv, sequence):
+        """Valores de línea para una factura anulada (CANCEL)."""
+        # Mapeo de campos DTE
+        numero_documento = inv.name
+        numero_control = inv.tgr_l10n_sv_edi_numero_control or ''
+        codigo_generacion = inv.tgr_l10n_sv_edi_codigo_generacion or ''
+        sello_recepcion = inv.tgr_l10n_sv_edi_sello_recibido or ''
+        tipo_documento = inv.l10n_latam_document_type_id.code or ''
+
+        # Para anuladas, los montos suelen ser 0 o se muestran informativamente.
+        # El usuario pidió "el mismo filtro", asumiremos que quiere ver los datos aunque estén anuladas.
+        # Pero contablemente no suman. En el reporte se verá.
+
+        ventas_exentas = 0.0
+        ventas_gravadas = 0.0
+        debito_fiscal = 0.0
+
+        for line in inv.invoice_line_ids:
+            amount_line = line.price_subtotal
+            if line.tax_ids:
+                ventas_gravadas += amount_line
+                debito_fiscal += line.price_total - amount_line
+            else:
+                ventas_exentas += amount_line
 
-            for line in inv.invoice_line_ids:
-                amount_line = line.price_subtotal
-                if line.tax_ids:
-                    ventas_gravadas += amount_line
-                    debito_fiscal += line.price_total - amount_line
-                else:
-                    ventas_exentas += amount_line
-
-            cancelled_lines_values.append({
-                'periodo_id': self.id,
-                'sequence': seq_cancelled,
-                'move_id': inv.id,
-                'partner_id': inv.partner_id.id,
-                'invoice_date': inv.invoice_date,
-                'numero_documento': numero_documento,
-                'numero_control': numero_control,
-                'codigo_generacion': codigo_generacion,
-                'sello_recepcion': sello_recepcion,
-                'tipo_documento': tipo_documento,
-                'ventas_exentas': ventas_exentas,
-                'ventas_gravadas': ventas_gravadas,
-                'debito_fiscal': debito_fiscal,
-                'amount_total': inv.amount_total,
-            })
-            seq_cancelled += 1
-
-        # Crear líneas de facturas anuladas
-        self.env['libro.ventas.line'].create(cancelled_lines_values)
+        return {
+            'periodo_id': self.id,
+            'sequence': sequence,
+            'move_id': inv.id,
+            'partner_id': inv.partner_id.id,
+            'invoice_date': inv.invoice_date,
+            'numero_documento': numero_documento,
+            'numero_control': numero_control,
+            'codigo_generacion': codigo_generacion,
+            'sello_recepcion': sello_recepcion,
+            'tipo_documento': tipo_documento,
+            'ventas_exentas': ventas_exentas,
+            'ventas_gravadas': ventas_gravadas,
+            'debito_fiscal': debito_fiscal,
+            'amount_total': inv.amount_total,
+        }
 
     def action_generate_excel(self):
         """Generar archivo Excel (.xlsx) con las facturas seleccionadas."""
-        selected = self.invoice_line_ids.filtered(lambda l: l.select)
-        if not selected:
-            raise UserError("Debe seleccionar al menos una factura.")
+        return self._export_action('xlsx')
 
-        try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, Alignment, PatternFill
-        except ImportError:
-            raise UserError("La librería 'openpyxl' no está instalada. Instálela con: pip install openpyxl")
-
-        # Crear workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Libro de Ventas"
-
-        # Estilos
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        
-        # Encabezados
-        headers = [
-            'No', 'Fecha Emisión', 'Número de Documento', 'Número de Control',
-            'Código Generación', 'Sello Recepción', 'Cliente', 'Ventas Exentas',
-            'Ventas Gravadas', 'Débito Fiscal', 'Total'
+    def _iter_excel_rows(self, domain):
+        """Filas del Excel de control interno, leyendo las líneas por lotes."""
+        fnames = [
+            'sequence', 'invoice_date', 'numero_documento', 'numero_control', 'codigo_generacion',
+            'sello_recepcion', 'ventas_exentas', 'ventas_gravadas', 'debito_fiscal', 'amount_total',
         ]
-        
-        for col, header in enumerate(headers, start=1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal='center')
-
-        # Datos
-        for row, line in enumerate(selected, start=2):
-            ws.cell(row=row, column=1, value=line.sequence or '')
-            ws.cell(row=row, column=2, value=str(line.invoice_date) if line.invoice_date else '')
-            ws.cell(row=row, column=3, value=line.numero_documento or '')
-            ws.cell(row=row, column=4, value=line.numero_control or '')
-            ws.cell(row=row, column=5, value=line.codigo_generacion or '')
-            ws.cell(row=row, column=6, value=line.sello_recepcion or '')
-            ws.cell(row=row, column=7, value=line.partner_id.name or '')
-            ws.cell(row=row, column=8, value=line.ventas_exentas or 0)
-            ws.cell(row=row, column=9, value=line.ventas_gravadas or 0)
-            ws.cell(row=row, column=10, value=line.debito_fiscal or 0)
-            ws.cell(row=row, column=11, value=line.amount_total or 0)
-
-        # Guardar en memoria
-        output = io.BytesIO()
-        wb.save(output)
-        excel_data = base64.b64encode(output.getvalue())
-        output.close()
+        for line in self._read_book_rows(domain, fnames):
+            yield [
+                line['sequence'] or '',
+                str(line['invoice_date']) if line['invoice_date'] else '',
+                line['numero_documento'] or '',
+                line['numero_control'] or '',
+                line['codigo_generacion'] or '',
+                line['sello_recepcion'] or '',
+                line['partner_name'] or '',
+                line['ventas_exentas'] or 0,
+                line['ventas_gravadas'] or 0,
+                line['debito_fiscal'] or 0,
+                line['amount_total'] or 0,
+            ]
 
+    def action_generate_csv(self):
+        """Generar CSV con las facturas seleccionadas.
+
+        Crédito Fiscal: formato Hacienda Anexo 1 (20 columnas A-T).
+        Consumidor Final: formato Hacienda Anexo 2.
+        """
+        action = self._export_action('csv')
+        # Dejar a la vista las inconsistencias de lo que se va a presentar
+        self._run_book_validation()
+        return action
+
+    def _get_export_spec(self, fmt):
+        if fmt not in self._export_mimetypes:
+            return super()._get_export_spec(fmt)
+        if fmt == 'csv' and self.tipo_libro == 'consumidor':
+            return self._get_export_spec_consumidor()
+        domain = self._get_export_domain()
+        if not self._book_has_rows(domain):
+            raise UserError("Debe seleccionar al menos una factura.")
+        if fmt == 'csv':
+            # SIN encabezados según manual oficial
+            return {
+                'kind': 'csv',
+                'domain': domain,
+                'filename': f'Libro_Ventas_Credito_Fiscal_Hacienda_{self.periodo or ""}.csv',
+                'rows': self._iter_csv_rows(domain),
+            }
         tipo_nombre = 'Consumidor_Final' if self.tipo_libro == 'consumidor' else 'Credito_Fiscal'
-        attachment = self.env['ir.attachment'].create({
-            'name': f'Libro_Ventas_{tipo_nombre}_{self.periodo or ""}.xlsx',
-            'type': 'binary',
-            'datas': excel_data,
-            'res_model': self._name,
-            'res_id': self.id,
-            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        })
         return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
+            'kind': 'xlsx',
+            'domain': domain,
+            'filename': f'Libro_Ventas_{tipo_nombre}_{self.periodo or ""}.xlsx',
+            'sheet_title': "Libro de Ventas",
+            'headers': [
+                'No', 'Fecha Emisión', 'Número de Documento', 'Número de Control',
+                'Código Generación', 'Sello Recepción', 'Cliente', 'Ventas Exentas',
+                'Ventas Gravadas', 'Débito Fiscal', 'Total'
+            ],
+            'rows': self._iter_excel_rows(domain),
         }
 
-    def action_generate_csv(self):
-        """Generar CSV con las facturas seleccionadas."""
-        # Si es Consumidor Final, usar formato Hacienda (Anexo 2)
-        if self.tipo_libro == 'consumidor':
-            return self.action_generate_csv_consumidor()
-            
-        # CRÉDITO FISCAL: Formato Hacienda Anexo 1 (20 columnas A-T)
-        selected = self.invoice_line_ids.filtered(lambda l: l.select)
-        if not selected:
-            raise UserError("Debe seleccionar al menos una factura.")
-
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=';')  # Separador punto y coma
-
-        # SIN encabezados según manual oficial
-        
+    def _get_export_domain(self, selected_only=True):
+        """Líneas válidas (posted) del libro, por defecto solo las seleccionadas."""
+        self.ensure_one()
+        domain = [('periodo_id', '=', self.id), ('move_id.state', '=', 'posted')]
+        if selected_only:
+            domain.append(('select', '=', True))
+        return domain
+
+    def _get_report_domain(self):
+        """El PDF imprime todas las líneas válidas, seleccionadas o no."""
+        return self._get_export_domain(selected_only=False)
+
+    def _iter_csv_rows(self, domain):
+        """Filas del CSV de Crédito Fiscal (Anexo 1, 20 columnas), leyendo por lotes."""
+        fnames = [
+            'partner_id', 'invoice_date', 'tipo_documento', 'codigo_generacion', 'numero_control',
+            'sello_recepcion', 'numero_documento', 'ventas_exentas', 'ventas_gravadas',
+            'debito_fiscal', 'amount_total', 'tipo_operacion_renta', 'tipo_ingreso_renta',
+        ]
         # Generar filas de datos (20 columnas: A-T)
-        for line in selected:
+        for line in self._read_book_rows(domain, fnames):
             # A. Fecha Emisión (DD/MM/YYYY)
-            fecha_str = line.invoice_date.strftime('%d/%m/%Y') if line.invoice_date else ''
+            fecha_str = line['invoice_date'].strftime('%d/%m/%Y') if line['invoice_date'] else ''
             
             # B. Clase de Documento (1=Impreso, 4=DTE)
-            clase_doc = '4' if line.codigo_generacion else '1'
+            clase_doc = '4' if line['codigo_generacion'] else '1'
             
             # C. Tipo de Documento (03=CCF, 05=NC, 06=ND)
-            tipo_doc = line.tipo_documento or '03'
+            tipo_doc = line['tipo_documento'] or '03'
             
             # D. Número de Resolución (para DTE: número de control sin guiones)
-            if line.codigo_generacion:
+            if line['codigo_generacion']:
                 # DTE: número de control sin guiones
-                numero_resolucion = (line.numero_control or '').replace('-', '')
+                numero_resolucion = (line['numero_control'] or '').replace('-', '')
             else:
                 # Impreso: número de resolución real
                 numero_resolucion = 'N/A'  # Ajustar según tu sistema
             
             # E. Número de Serie (para DTE: sello de recepción)
-            if line.codigo_generacion:
-                numero_serie = line.sello_recepcion or ''
+            if line['codigo_generacion']:
+                numero_serie = line['sello_recepcion'] or ''
             else:
                 numero_serie = 'SERIE'  # Ajustar según tu sistema
             
             # F. Número de Documento (para DTE: código de generación sin guiones)
-            if line.codigo_generacion:
-                numero_documento = line.codigo_generacion.replace('-', '')
+            if line['codigo_generacion']:
+                numero_documento = line['codigo_generacion'].replace('-', '')
             else:
-                numero_documento = line.numero_documento or ''
+                numero_documento = line['numero_documento'] or ''
             
             # G. Número de Control Interno (para DTE: dejar en blanco)
-            if line.codigo_generacion:
+            if line['codigo_generacion']:
                 control_interno = ''
             else:
-                control_interno = line.numero_control or line.numero_documento or ''
+                control_interno = line['numero_control'] or line['numero_documento'] or ''
             
             # H. NIT o NRC del Cliente (sin guiones)
             # Obtener NIT o NRC del partner
             nit_nrc = ''
-            if line.partner_id:
+            if line['partner_id']:
                 # Buscar VAT (NIT) del partner
-                if line.partner_id.vat:
-                    nit_nrc = line.partner_id.vat.replace('-', '').replace('/', '')
+                if line['partner_vat']:
+                    nit_nrc = line['partner_vat'].replace('-', '').replace('/', '')
             
             # I. Nombre del Cliente
-            nombre_cliente = line.partner_id.name or ''
+            nombre_cliente = line['partner_name'] or ''
             
             # J. Ventas Exentas
-            ventas_exentas = f"{line.ventas_exentas:.2f}"
+            ventas_exentas = f"{line['ventas_exentas']:.2f}"
             
             # K. Ventas No Sujetas
             ventas_no_sujetas = "0.00"  # Ajustar si tienes este campo
             
             # L. Ventas Gravadas Locales
-            ventas_gravadas = f"{line.ventas_gravadas:.2f}"
+            ventas_gravadas = f"{line['ventas_gravadas']:.2f}"
             
             # M. Débito Fiscal
-            debito_fiscal = f"{line.debito_fiscal:.2f}"
+            debito_fiscal = f"{line['debito_fiscal']:.2f}"
             
             # N. Ventas a Cuenta de Terceros
             ventas_terceros = "0.00"  # Ajustar si tienes este campo
@@ -549,21 +657,21 @@ class LibroVentasPeriodo(models.Model):
             debito_terceros = "0.00"  # Ajustar si tienes este campo
             
             # P. Total Ventas
-            total_ventas = f"{line.amount_total:.2f}"
+            total_ventas = f"{line['amount_total']:.2f}"
             
             # Q. DUI del Cliente (9 dígitos, opcional)
             dui_cliente = ''  # Ajustar si tienes este campo en partner
             
             # R. Tipo de Operación (Renta) - desde Enero 2025
-            tipo_operacion = line.tipo_operacion_renta or '1'
+            tipo_operacion = line['tipo_operacion_renta'] or '1'
             
             # S. Tipo de Ingreso (Renta) - desde Enero 2025
-            tipo_ingreso = line.tipo_ingreso_renta or '3'
+            tipo_ingreso = line['tipo_ingreso_renta'] or '3'
             
             # T. Número de Anexo (siempre 1 para crédito fiscal)
             numero_anexo = '1'
             
-            writer.writerow([
+            yield [
                 fecha_str,          # A
                 clase_doc,          # B
                 tipo_doc,           # C
@@ -584,52 +692,47 @@ class LibroVentasPeriodo(models.Model):
                 tipo_operacion,     # R
                 tipo_ingreso,       # S
                 numero_anexo,       # T
-            ])
-
-        data = base64.b64encode(output.getvalue().encode('utf-8'))
-        output.close()
-
-        attachment = self.env['ir.attachment'].create({
-            'name': f'Libro_Ventas_Credito_Fiscal_Hacienda_{self.periodo or ""}.csv',
-            'type': 'binary',
-            'datas': data,
-            'res_model': self._name,
-            'res_id': self.id,
-            'mimetype': 'text/csv'
-        })
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
-        }
+            ]
 
     def action_generate_csv_consumidor(self):
         """Generar CSV formato oficial Hacienda (Anexo 2 - Consumidor Final)."""
+        return self.action_generate_csv()
+
+    def _get_export_spec_consumidor(self):
         # Para Consumidor Final, incluir TODAS las líneas del periodo
         # (no depender del campo 'select' que solo afecta las líneas visibles en la vista)
-        selected = self.invoice_line_ids
-        if not selected:
+        domain = self._get_export_domain(selected_only=False)
+        if not self._book_has_rows(domain):
             raise UserError("No hay facturas para exportar. Genere el detalle primero.")
-
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=';')  # Separador punto y coma
-        
         # SIN ENCABEZADOS según requerimiento (el ejemplo los muestra pero dice "no deben contener encabezados")
         # El usuario dijo "ejemplo csv" y mostró datos sin encabezados.
-        
+        return {
+            'kind': 'csv_consumidor_rangos' if self.csv_rangos_impresos else 'csv_consumidor',
+            'domain': domain,
+            'filename': f'Libro_Ventas_Consumidor_Hacienda_{self.periodo or ""}.csv',
+            'rows': self._iter_csv_consumidor_rows(domain),
+        }
+
+    def _iter_csv_consumidor_rows(self, domain):
+        """Filas del CSV de Consumidor Final (Anexo 2, 23 columnas), leyendo por lotes."""
+        fnames = [
+            'invoice_date', 'tipo_documento', 'codigo_generacion', 'numero_documento',
+            'numero_control', 'tipo_operacion_renta', 'tipo_ingreso_renta',
+        ] + self._consumidor_csv_amount_fields
         # Procesar filas - CADA FACTURA ES UNA LÍNEA INDIVIDUAL
         # No agrupar por fecha, cada DTE tiene su código de generación único
-        rows = []
-        
-        # Procesar todas las líneas individualmente
-        for line in selected:
+        lines = self._read_book_rows(domain, fnames)
+        if self.csv_rangos_impresos:
+            # Salvo los impresos consecutivos, que se informan por rango
+            lines = self._compress_printed_ranges(lines, self._consumidor_csv_amount_fields)
+        for line in lines:
             # Si es DTE (tiene código de generación)
-            if line.codigo_generacion:
+            if line['codigo_generacion']:
                 # Clase 4 = DTE
                 clase = '4'
                 # Para DTEs: columnas H e I son el código de generación (Del y Al son iguales para una factura individual)
-                doc_del = line.codigo_generacion
-                doc_al = line.codigo_generacion
+                doc_del = line['codigo_generacion']
+                doc_al = line['codigo_generacion']
                 # Columnas D-G son N/A para DTEs
                 resolucion = 'N/A'
                 serie = 'N/A'
@@ -639,25 +742,25 @@ class LibroVentasPeriodo(models.Model):
                 # Clase 1 = Impreso (puede ser 2 = Formulario según tipo)
                 clase = '1'
                 # Para documentos impresos: columnas H e I son el número de documento
-                doc_del = line.numero_documento or ''
-                doc_al = line.numero_documento or ''
+                doc_del = line['numero_documento'] or ''
+                doc_al = line.get('numero_documento_al', line['numero_documento']) or ''
                 # Columnas D-G son la resolución, serie y número de control
                 resolucion = 'RESOLUCION'  # TODO: agregar campo en el modelo si es necesario
                 serie = 'SERIE'            # TODO: agregar campo en el modelo si es necesario
-                control_del = line.numero_control or ''
-                control_al = line.numero_control or ''
+                control_del = line['numero_control'] or ''
+                control_al = line.get('numero_control_al', line['numero_control']) or ''
             
             # Calcular total como suma de columnas
-            total_calculado = (line.ventas_exentas + line.ventas_exentas_no_sujetas + 
-                             line.ventas_no_sujetas + line.ventas_gravadas_locales + 
-                             line.exportaciones_centroamerica + line.exportaciones_fuera_centroamerica + 
-                             line.exportaciones_servicios + line.ventas_zonas_francas + 
-                             line.ventas_cuenta_terceros)
+            total_calculado = (line['ventas_exentas'] + line['ventas_exentas_no_sujetas'] + 
+                             line['ventas_no_sujetas'] + line['ventas_gravadas_locales'] + 
+                             line['exportaciones_centroamerica'] + line['exportaciones_fuera_centroamerica'] + 
+                             line['exportaciones_servicios'] + line['ventas_zonas_francas'] + 
+                             line['ventas_cuenta_terceros'])
             
-            row = [
-                line.invoice_date.strftime('%d/%m/%Y'), # A. Fecha
+            yield [
+                line['invoice_date'].strftime('%d/%m/%Y'), # A. Fecha
                 clase,                                  # B. Clase (4=DTE, 1=Impreso)
-                line.tipo_documento or '01',            # C. Tipo de Documento
+                line['tipo_documento'] or '01',            # C. Tipo de Documento
                 resolucion,                             # D. Resolución
                 serie,                                  # E. Serie
                 control_del,                            # F. Control Del
@@ -665,43 +768,112 @@ class LibroVentasPeriodo(models.Model):
                 doc_del,                                # H. Doc Del (Código Gen o Num Doc)
                 doc_al,                                 # I. Doc Al (Código Gen o Num Doc)
                 '',                                     # J. Máquina (vacío)
-                f"{line.ventas_exentas:.2f}",           # K
-                f"{line.ventas_exentas_no_sujetas:.2f}",# L
-                f"{line.ventas_no_sujetas:.2f}",        # M
-                f"{line.amount_total:.2f}",             # N (Total con IVA para consumidor)
-                f"{line.exportaciones_centroamerica:.2f}", # O
-                f"{line.exportaciones_fuera_centroamerica:.2f}", # P
-                f"{line.exportaciones_servicios:.2f}",  # Q
-                f"{line.ventas_zonas_francas:.2f}",     # R
-                f"{line.ventas_cuenta_terceros:.2f}",   # S
+                f"{line['ventas_exentas']:.2f}",           # K
+                f"{line['ventas_exentas_no_sujetas']:.2f}",# L
+                f"{line['ventas_no_sujetas']:.2f}",        # M
+                f"{line['amount_total']:.2f}",             # N (Total con IVA para consumidor)
+                f"{line['exportaciones_centroamerica']:.2f}", # O
+                f"{line['exportaciones_fuera_centroamerica']:.2f}", # P
+                f"{line['exportaciones_servicios']:.2f}",  # Q
+                f"{line['ventas_zonas_francas']:.2f}",     # R
+                f"{line['ventas_cuenta_terceros']:.2f}",   # S
                 f"{total_calculado:.2f}",               # T (calculado, no amount_total)
-                line.tipo_operacion_renta or '1',       # U
-                line.tipo_ingreso_renta or '3',         # V
+                line['tipo_operacion_renta'] or '1',       # U
+                line['tipo_ingreso_renta'] or '3',         # V
                 '2'                                     # W. Anexo (2)
             ]
-            rows.append(row)
-
-        # Escribir filas
-        for row in rows:
-            writer.writerow(row)
-
-        data = base64.b64encode(output.getvalue().encode('utf-8'))
-        output.close()
-
-        attachment = self.env['ir.attachment'].create({
-            'name': f'Libro_Ventas_Consumidor_Hacienda_{self.periodo or ""}.csv',
-            'type': 'binary',
-            'datas': data,
-            'res_model': self._name,
-            'res_id': self.id,
-            'mimetype': 'text/csv'
-        })
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
-        }
+
+    def _compress_printed_ranges(self, lines, amount_fields):
+        """Unir documentos impresos consecutivos en filas de rango, en una pasada.
+
+        ``lines`` llega en el orden del libro (fecha y número), así que los
+        impresos del mismo día, tipo y serie (prefijo del número) con número
+        correlativo quedan seguidos: se acumulan en una fila con
+        ``numero_documento_al``/``numero_control_al`` y los montos sumados.
+        Los DTE pasan sin cambios.
+        """
+        current = current_key = current_number = None
+        for line in lines:
+            if line['codigo_generacion']:
+                yield line
+                continue
+            match = self._printed_number_re.match(line['numero_documento'] or '')
+            if not match:
+                if current is not None:
+                    yield current
+                current = None
+                yield line
+                continue
+            key = (line['invoice_date'], line['tipo_documento'], line['tipo_operacion_renta'],
+                   line['tipo_ingreso_renta'], match.group(1))
+            number = int(match.group(2))
+            if current is not None and key == current_key and number == current_number + 1:
+                for name in amount_fields:
+                    current[name] += line[name]
+                current['numero_documento_al'] = line['numero_documento']
+                current['numero_control_al'] = line['numero_control']
+                current_number = number
+                continue
+            if current is not None:
+                yield current
+            current, current_key, current_number = dict(line), key, number
+        if current is not None:
+            yield current
+
+    def _get_validation_domain(self):
+        """Consumidor Final presenta todas las válidas; Crédito Fiscal, las seleccionadas."""
+        return self._get_export_domain(selected_only=self.tipo_libro != 'consumidor')
+
+    def _check_book_columns(self, columns):
+        """Reglas de los Anexos de Ventas sobre las columnas del libro."""
+        issues = []
+        add = issues.append
+        differ = self._amounts_differ
+        allowed_doc_types = set(self._get_book_doc_types()[0])
+        credito = self.tipo_libro == 'credito'
+        # Sin la localización el partner no tiene NRC: no se exige
+        check_nrc_present = credito and 'l10n_sv_nrc' in self.env['res.partner']._fields
+
+        sumas = [sum(amounts) for amounts in zip(*(columns[name] for name in self._validation_amount_fields))]
+
+        for index, (vat, nrc, tipo, codigo, control, no_emitida, gravada, debito, total, suma) in enumerate(zip(
+                columns['partner_vat'], columns['partner_l10n_sv_nrc'], columns['tipo_documento'],
+                columns['codigo_generacion'], columns['numero_control'], columns['no_emitida'],
+                columns['ventas_gravadas'], columns['debito_fiscal'], columns['amount_total'], sumas)):
+            # NIT/NRC del cliente: obligatorio en Crédito Fiscal
+            if credito and not vat:
+                add((index, 'documento_identidad', 'error', "Cliente sin NIT/NRC"))
+            elif vat and not (libro_check_nit(vat) or libro_check_nrc(vat)):
+                add((index, 'documento_identidad', 'error' if credito else 'warning',
+                     f"NIT/NRC del cliente mal formado: {vat}"))
+            if check_nrc_present:
+                if not nrc:
+                    add((index, 'documento_identidad', 'warning', "Cliente de crédito fiscal sin NRC"))
+                elif not libro_check_nrc(nrc):
+                    add((index, 'documento_identidad', 'error', f"NRC del cliente mal formado: {nrc}"))
+
+            # DTE sin sello de recepción de Hacienda
+            if no_emitida:
+                add((index, 'no_emitida', 'error', "DTE sin sello de recepción (no emitido a Hacienda)"))
+
+            # Débito fiscal = 13% de las ventas gravadas
+            if differ(debito, round(gravada * 0.13, 2)):
+                add((index, 'debito_fiscal', 'error',
+                     f"Débito fiscal {debito:.2f} distinto del 13% de las gravadas ({gravada * 0.13:.2f})"))
+
+            # Total = suma de columnas de venta más el débito fiscal
+            if differ(total, suma):
+                add((index, 'totales', 'warning',
+                     f"Total {total:.2f} no cuadra con la suma de columnas ({suma:.2f})"))
+
+            # Tipo de documento del anexo y datos del DTE
+            if tipo not in allowed_doc_types:
+                add((index, 'tipo_documento', 'error',
+                     f"Tipo de documento {tipo or '-'} no válido para este libro"))
+            if codigo and not control:
+                add((index, 'tipo_documento', 'error', "DTE sin número de control"))
+        return issues
 
     def action_print_report(self):
         """Imprimir: genera el PDF del libro."""
-        return self.env.ref('libros_fiscales.report_libro_ventas').report_action(self)
+        return self._print_book_report('libros_fiscales.report_libro_ventas')
@@ -0,0 +1,141 @@
+from odoo import models, fields, api
+
+
+class LibroVentasResumenDiario(models.Model):
+    _name = 'libro.ventas.resumen.diario'
+    _description = 'Resumen Diario del Libro de Ventas a Consumidor Final'
+    _order = 'date, tipo_documento, clase'
+
+    # Montos que se suman de las líneas (mismo nombre en libro.ventas.line)
+    _summary_amount_fields = [
+        'ventas_exentas', 'ventas_exentas_no_sujetas', 'ventas_no_sujetas',
+        'ventas_gravadas_locales', 'exportaciones_centroamerica',
+        'exportaciones_fuera_centroamerica', 'exportaciones_servicios',
+        'ventas_zonas_francas', 'ventas_cuenta_terceros', 'debito_fiscal', 'amount_total',
+    ]
+    # Campos de la línea que cambian el resumen al editarse
+    _summary_source_fields = _summary_amount_fields + [
+        'periodo_id', 'move_id', 'invoice_date', 'tipo_documento', 'codigo_generacion', 'numero_documento',
+    ]
+
+    periodo_id = fields.Many2one('libro.ventas.periodo', string='Periodo', required=True,
+                                 ondelete='cascade', index=True, readonly=True)
+    currency_id = fields.Many2one(related='periodo_id.company_currency_id')
+    date = fields.Date(string='Fecha', readonly=True)
+    tipo_documento = fields.Char(string='Tipo Documento', readonly=True)
+    clase = fields.Selection([
+        ('1', 'Impreso'),
+        ('4', 'DTE'),
+    ], string='Clase', readonly=True)
+    documentos = fields.Integer(string='Documentos', readonly=True)
+    documento_del = fields.Char(string='Del', readonly=True)
+    documento_al = fields.Char(string='Al', readonly=True)
+
+    ventas_exentas = fields.Monetary(string='Ventas Exentas', readonly=True)
+    ventas_exentas_no_sujetas = fields.Monetary(string='Ventas Exentas No Sujetas', readonly=True)
+    ventas_no_sujetas = fields.Monetary(string='Ventas No Sujetas', readonly=True)
+    ventas_gravadas_locales = fields.Monetary(string='Ventas Gravadas Locales', readonly=True)
+    exportaciones_centroamerica = fields.Monetary(string='Exp. Centroamérica', readonly=True)
+    exportaciones_fuera_centroamerica = fields.Monetary(string='Exp. Fuera Centroamérica', readonly=True)
+    exportaciones_servicios = fields.Monetary(string='Exp. Servicios', readonly=True)
+    ventas_zonas_francas = fields.Monetary(string='Ventas Zonas Francas', readonly=True)
+    ventas_cuenta_terceros = fields.Monetary(string='Ventas Cuenta Terceros', readonly=True)
+    debito_fiscal = fields.Monetary(string='Débito Fiscal', readonly=True)
+    amount_total = fields.Monetary(string='Total', readonly=True)
+
+    @api.model
+    def _rebuild(self, periodos):
+        """Reconstruir el resumen de ``periodos`` con un solo INSERT ... GROUP BY.
+
+        Se usa al terminar una generación completa del libro; las ediciones
+        de líneas usan ``_refresh_groups``.
+        """
+        if not periodos:
+            return
+        self._flush_sources()
+        self.env.cr.execute('DELETE FROM libro_ventas_resumen_diario WHERE periodo_id = ANY(%s)', [periodos.ids])
+        self._insert_groups('', 'l.periodo_id = ANY(%(periodo_ids)s)', {'periodo_ids': periodos.ids})
+        self.invalidate_model()
+        periodos.invalidate_recordset(['resumen_diario_ids'])
+
+    @api.model
+    def _refresh_groups(self, keys):
+        """Recalcular solo los grupos ``keys`` del resumen.
+
+        :param keys: conjunto de (periodo_id, fecha, tipo_documento, clase),
+            ver ``libro.ventas.line._resumen_keys``
+
+        Cada grupo se vuelve a sumar con las líneas de ese día, tipo y clase,
+        así editar una línea no recorre todo el periodo. Se resume el grupo en
+        lugar de sumar una diferencia porque Del/Al son mínimo y máximo.
+        """
+        if not keys:
+            return
+        self._flush_sources()
+        keys = sorted(keys, key=repr)
+        params = {
+            'k_periodo': [key[0] for key in keys],
+            'k_date': [key[1] or None for key in keys],
+            'k_tipo': [key[2] or '' for key in keys],
+            'k_clase': [key[3] for key in keys],
+        }
+        groups_sql = """
+            unnest(%(k_periodo)s::int4[], %(k_date)s::date[], %(k_tipo)s::varchar[], %(k_clase)s::varchar[])
+                AS k(periodo_id, date, tipo_documento, clase)
+        """
+        self.env.cr.execute("""
+            DELETE FROM libro_ventas_resumen_diario r
+             USING %s
+             WHERE r.periodo_id = k.periodo_id
+               AND r.date IS NOT DISTINCT FROM k.date
+               AND COALESCE(r.tipo_documento, '') = k.tipo_documento
+               AND r.clase = k.clase
+        """ % groups_sql, params)
+        self._insert_groups(
+            'JOIN %s ON k.periodo_id = l.periodo_id' % groups_sql,
+            """l.invoice_date IS NOT DISTINCT FROM k.date
+               AND COALESCE(l.tipo_documento, '') = k.tipo_documento
+               AND (CASE WHEN COALESCE(l.codigo_generacion, '') <> '' THEN '4' ELSE '1' END) = k.clase""",
+            params,
+        )
+        self.invalidate_model()
+        self.env['libro.ventas.periodo'].browse(set(params['k_periodo'])).invalidate_recordset(['resumen_diario_ids'])
+
+    @api.model
+    def _flush_sources(self):
+        self.env['libro.ventas.line'].flush_model(self._summary_source_fields)
+        self.env['account.move'].flush_model(['state'])
+        self.flush_model()
+
+    @api.model
+    def _insert_groups(self, join_sql, where_sql, params):
+        """Insertar los grupos (día, tipo, clase) de las líneas que cumplen ``where_sql``.
+
+        Solo entran las facturas válidas (igual que ``invoice_line_ids``).
+        """
+        cr = self.env.cr
+        amounts = self._summary_amount_fields
+        cr.execute("""
+            INSERT INTO libro_ventas_resumen_diario (
+                periodo_id, date, tipo_documento, clase, documentos, documento_del, documento_al,
+                %s, create_uid, create_date, write_uid, write_date)
+            SELECT l.periodo_id,
+                   l.invoice_date,
+                   l.tipo_documento,
+                   CASE WHEN COALESCE(l.codigo_generacion, '') <> '' THEN '4' ELSE '1' END,
+                   COUNT(*),
+                   MIN(l.numero_documento),
+                   MAX(l.numero_documento),
+                   %s,
+                   %%(uid)s, %%(now)s, %%(uid)s, %%(now)s
+              FROM libro_ventas_line l
+              JOIN account_move am ON am.id = l.move_id AND am.state = 'posted'
+              %s
+             WHERE %s
+          GROUP BY 1, 2, 3, 4
+        """ % (
+            ', '.join('"%s"' % name for name in amounts),
+            ', '.join('COALESCE(SUM(l."%s"), 0)' % name for name in amounts),
+            join_sql,
+            where_sql,
+        ), dict(params, uid=self.env.uid, now=cr.now()))
@@ -0,0 +1,36 @@
+from odoo import models, api, tools
+
+
+class ResCompany(models.Model):
+    _inherit = 'res.company'
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _libro_get_branch_ids(self, company_id):
+        """Compañía y todas sus sucursales, a cualquier nivel (vía parent_path).
+
+        Se calcula una vez por compañía; se invalida cuando cambia la jerarquía.
+        """
+        return tuple(self.sudo().with_context(active_test=False).search([('id', 'child_of', company_id)]).ids)
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _libro_get_root_id(self, company_id):
+        """Compañía raíz (casa matriz) de ``company_id``."""
+        company = self.sudo().browse(company_id)
+        return int(company.parent_path.split('/')[0]) if company.parent_path else company_id
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        companies = super().create(vals_list)
+        if any(vals.get('parent_id') for vals in vals_list):
+            self.env.registry.clear_cache()
+        return companies
+
+    def write(self, vals):
+        res = super().write(vals)
+        # price_include de los impuestos depende de account_price_include;
+        # las sucursales de cada compañía, de parent_id
+        if 'account_price_include' in vals or 'parent_id' in vals:
+            self.env.registry.clear_cache()
+        return res
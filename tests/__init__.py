@@ -0,0 +1,22 @@
+from . import test_libro_snapshot
+from . import test_libro_resumen_diario
+from . import test_libro_api
+from . import test_libro_duplicados
+from . import test_libro_ventas_classification
+from . import test_libro_bulk_insert
+from . import test_libro_compras_amounts
+from . import test_libro_ventas_scan
+from . import test_libro_regeneration
+from . import test_libro_background
+from . import test_libro_exports
+from . import test_libro_totals
+from . import test_libro_report
+from . import test_libro_dte_pattern
+from . import test_libro_indexes
+from . import test_libro_batch
+from . import test_libro_sucursales
+from . import test_libro_export_cache
+from . import test_libro_validation
+from . import test_libro_profile
+from . import test_libro_classification_rules
+from . import test_libro_rangos
@@ -0,0 +1,69 @@
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroApi(LibroTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.moves = cls._create_purchase([100.0], cls.tax_purchase) \
+            | cls._create_purchase([200.0], cls.tax_purchase) \
+            | cls._create_purchase([300.0], cls.tax_purchase)
+
+    def _removed(self, **kwargs):
+        rows, _key = self.env['libro.line.tombstone']._api_read_page(
+            'libro.compras.line', [self.env.company.id], **kwargs)
+        return rows
+
+    def test_keyset_survives_renumbering(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        Line = self.env['libro.compras.line']
+
+        first, key = Line._api_read_page(periodo.ids, ['move_id'], limit=2)
+        # La regeneración renumera; la llave (periodo_id, id) no depende del número
+        for line, sequence in zip(periodo.invoice_line_ids, (30, 20, 10)):
+            line.sequence = sequence
+        rest, _key = Line._api_read_page(periodo.ids, ['move_id'], after=key, limit=2)
+
+        move_ids = [row['move_id'] for row in first + rest]
+        self.assertEqual(sorted(move_ids), sorted(self.moves.ids))
+
+    def test_regeneration_reports_removed_lines(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        move = self.moves[0]
+        line = periodo.invoice_line_ids.filtered(lambda l: l.move_id == move)
+
+        move.button_draft()
+        periodo.action_load_invoices()
+
+        self.assertNotIn(move, periodo.invoice_line_ids.move_id)
+        removed = self._removed()
+        self.assertEqual([row['id'] for row in removed], line.ids)
+        self.assertEqual(removed[0]['move_id'], move.id)
+        self.assertEqual(removed[0]['periodo_id'], periodo.id)
+
+    def test_book_unlink_reports_its_lines(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        line_ids = periodo.invoice_line_ids.ids
+
+        periodo.unlink()
+
+        self.assertEqual(sorted(row['id'] for row in self._removed()), sorted(line_ids))
+
+    def test_removed_pagination(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        line_ids = periodo.invoice_line_ids.ids
+        periodo.invoice_line_ids.unlink()
+
+        Tombstone = self.env['libro.line.tombstone']
+        first, key = Tombstone._api_read_page('libro.compras.line', [self.env.company.id], limit=2)
+        rest, _key = Tombstone._api_read_page('libro.compras.line', [self.env.company.id], after=key, limit=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(sorted(row['id'] for row in first + rest), sorted(line_ids))
@@ -0,0 +1,63 @@
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroBackground(LibroTestCommon):
+    """Generación por lotes en segundo plano y bloqueo del libro mientras corre."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.moves = cls._create_purchase([100.0], cls.tax_purchase) \
+            | cls._create_purchase([200.0], cls.tax_purchase) \
+            | cls._create_purchase([300.0], cls.env['account.tax'])
+
+    def _run_cron(self, periodo):
+        with patch.object(type(periodo), '_generation_chunk_size', 1):
+            periodo._cron_process_generation()
+
+    def test_background_matches_synchronous_load(self):
+        sync = self._new_compras()
+        sync.action_load_invoices()
+        periodo = self._new_compras()
+
+        periodo.action_load_invoices_background()
+        self.assertEqual(periodo.generation_state, 'queued')
+        self.assertEqual(periodo.generation_total, 3)
+        self._run_cron(periodo)
+
+        self.assertEqual(periodo.generation_state, 'done')
+        self.assertEqual(periodo.generation_progress, 100.0)
+        self.assertEqual(self._stored_values(periodo.invoice_line_ids), self._stored_values(sync.invoice_line_ids))
+        self.assertAlmostEqual(periodo.total_internas_gravadas, sync.total_internas_gravadas)
+
+    def test_queued_book_is_locked(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        line = periodo.invoice_line_ids[0]
+        periodo.action_load_invoices_background()
+
+        with self.assertRaises(UserError):
+            periodo.write({'comentarios': "cambio"})
+        with self.assertRaises(UserError):
+            periodo.action_load_invoices()
+        with self.assertRaises(UserError):
+            line.write({'select': False})
+        with self.assertRaises(UserError):
+            line.unlink()
+        with self.assertRaises(UserError):
+            self.env['libro.compras.line'].create({'periodo_id': periodo.id, 'move_id': self.moves[0].id})
+        with self.assertRaises(UserError):
+            periodo.action_unselect_all()
+        with self.assertRaises(UserError):
+            periodo.action_apply_classification_rules()
+
+        # Al terminar se puede volver a editar
+        self._run_cron(periodo)
+        line.write({'select': False})
+        self.assertFalse(line.select)
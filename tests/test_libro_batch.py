@@ -0,0 +1,62 @@
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroBatch(LibroTestCommon):
+    """Asistente por lotes: cola de libros y avance, duración y error de cada uno."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._create_purchase([100.0], cls.tax_purchase)
+        cls._create_purchase([200.0], cls.tax_purchase)
+
+    def _generate(self):
+        wizard = self.env['libro.batch.wizard'].create({
+            'year': self.year,
+            'month_from': self.month,
+            'month_to': self.month,
+            'libro_compras': True,
+            'libro_consumidor': False,
+            'libro_credito': False,
+        })
+        wizard.action_generate()
+        return wizard.result_ids
+
+    def test_results_report_duration_and_error(self):
+        result = self._generate()
+        self.assertEqual(result.status, 'queued')
+        self.assertEqual(result.generation_state, 'queued')
+        periodo = self.env[result.res_model].browse(result.res_id)
+
+        with patch.object(type(periodo), '_generation_chunk_size', 1):
+            periodo._cron_process_generation()
+
+        result.invalidate_recordset()
+        self.assertEqual(result.generation_state, 'done')
+        self.assertEqual(result.generation_progress, 100.0)
+        profiles = self.env['libro.generation.profile'].search([
+            ('res_model', '=', periodo._name), ('res_id', '=', periodo.id), ('operation', '=', 'load_chunk'),
+        ])
+        self.assertTrue(profiles)
+        self.assertAlmostEqual(result.generation_duration, sum(profiles.mapped('duration')))
+
+        # El error del libro se muestra en su resultado
+        periodo.write({'generation_state': 'failed', 'generation_error': "Factura inválida"})
+        result.invalidate_recordset()
+        self.assertEqual(result.generation_error, "Factura inválida")
+
+    def test_sequential_without_workers(self):
+        result = self._generate()
+        periodo = self.env[result.res_model].browse(result.res_id)
+        self.env['ir.config_parameter'].sudo().set_param('libros_fiscales.generacion_procesos', '0')
+
+        # Uno tras otro con el cursor del cron: no se abren hilos ni cursores
+        with patch.object(type(periodo), '_run_generation_worker') as worker:
+            periodo._cron_process_generation()
+        worker.assert_not_called()
+        self.assertEqual(periodo.generation_state, 'done')
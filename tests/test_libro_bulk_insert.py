@@ -0,0 +1,55 @@
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroBulkInsert(LibroTestCommon):
+    """La inserción masiva deja las mismas filas que ``create()`` del ORM."""
+
+    def test_compras_lines_match_orm_create(self):
+        self._create_purchase([100.0, 50.0], self.tax_purchase)
+        self._create_purchase([80.0], self.env['account.tax'],
+                              tgr_l10n_sv_edi_codigo_generacion='A1B2C3D4-0000-0000-0000-000000000001')
+        periodo = self._new_compras()
+        other = self._new_compras(month='04')
+        lines_values = periodo._prepare_book_lines(periodo._get_book_moves(), {})
+        Line = self.env['libro.compras.line']
+
+        bulk = Line._bulk_insert(lines_values)
+        orm = Line.create([dict(vals, periodo_id=other.id) for vals in lines_values])
+
+        self.assertEqual(len(bulk), 2)
+        self.assertEqual(self._stored_values(bulk), self._stored_values(orm))
+        # Related y calculados almacenados llenados en la misma pasada
+        self.assertEqual(bulk.currency_id, periodo.company_currency_id)
+        self.assertEqual(sorted(bulk.mapped('dte_key')), sorted(orm.mapped('dte_key')))
+
+    def test_ventas_lines_match_orm_create(self):
+        moves = self._create_sale([100.0, 50.0], self.tax_sale) \
+            | self._create_sale([80.0], self.env['account.tax'],
+                                tgr_l10n_sv_edi_codigo_generacion='A1B2C3D4-0000-0000-0000-000000000002',
+                                tgr_l10n_sv_edi_numero_control='DTE-01-00000001-000000000000001')
+        periodo = self._new_ventas()
+        other = self._new_ventas(month='04')
+        lines_values = periodo._prepare_book_lines(moves, {})
+        Line = self.env['libro.ventas.line']
+
+        bulk = Line._bulk_insert(lines_values)
+        orm = Line.create([dict(vals, periodo_id=other.id) for vals in lines_values])
+
+        self.assertEqual(self._stored_values(bulk), self._stored_values(orm))
+        self.assertEqual(bulk.currency_id, periodo.company_currency_id)
+        # DTE con número de control y sin sello: no emitida
+        self.assertEqual(sorted(bulk.mapped('no_emitida')), [False, True])
+
+    def test_bulk_insert_returns_lines_in_order(self):
+        self._create_purchase([10.0], self.tax_purchase)
+        self._create_purchase([20.0], self.tax_purchase)
+        periodo = self._new_compras()
+        lines_values = periodo._prepare_book_lines(periodo._get_book_moves(), {})
+
+        lines = self.env['libro.compras.line']._bulk_insert(lines_values)
+
+        self.assertEqual(lines.mapped('move_id').ids, [vals['move_id'] for vals in lines_values])
+        self.assertEqual(periodo.invoice_line_ids, lines)
@@ -0,0 +1,48 @@
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroClassificationRules(LibroTestCommon):
+    """Reglas de clasificación de compras por compañía de la factura, con respaldo en la compañía padre."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Company = cls.env['res.company']
+        Rule = cls.env['libro.classification.rule']
+        cls.root = cls.env.company
+        cls.branch = Company.create({'name': "Sucursal", 'parent_id': cls.root.id})
+        cls.other = Company.create({'name': "Otra Casa Matriz"})
+        Rule.create([
+            {'name': "Todas", 'company_id': False, 'sequence': 1, 'sector': '1', 'tipo_operacion': '2'},
+            {'name': "Casa matriz", 'company_id': cls.root.id, 'sequence': 5, 'sector': '2', 'clasificacion': '2'},
+            {'name': "Sucursal", 'company_id': cls.branch.id, 'sequence': 10, 'sector': '3'},
+            {'name': "Otra", 'company_id': cls.other.id, 'sector': '4'},
+        ])
+
+    def _classify(self, company):
+        Rule = self.env['libro.classification.rule']
+        criteria = {1: (company.id, self.partner_a.commercial_partner_id.id, set(), set(), set())}
+        with patch.object(type(Rule), '_get_move_criteria', return_value=criteria):
+            return Rule._classify_moves([1])[1]
+
+    def test_branch_rules_fall_back_to_parent(self):
+        # Las reglas propias ganan aunque tengan mayor secuencia; lo que no
+        # definen sale de la compañía padre y luego de las generales
+        self.assertEqual(self._classify(self.branch), {'sector': '3', 'clasificacion': '2', 'tipo_operacion': '2'})
+        self.assertEqual(self._classify(self.root), {'sector': '2', 'clasificacion': '2', 'tipo_operacion': '2'})
+        self.assertEqual(self._classify(self.other), {'sector': '4', 'tipo_operacion': '2'})
+
+    def test_moves_classified_by_their_company(self):
+        move = self._create_purchase([100.0], self.tax_purchase)
+        classification = self.env['libro.classification.rule']._classify_moves(move.ids)
+        self.assertEqual(classification[move.id]['sector'], '2')
+
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        line = periodo.invoice_line_ids.filtered(lambda l: l.move_id == move)
+        self.assertEqual((line.sector, line.clasificacion, line.tipo_operacion), ('2', '2', '2'))
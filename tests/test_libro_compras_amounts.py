@@ -0,0 +1,47 @@
+from odoo import Command
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroComprasAmounts(LibroTestCommon):
+    """Montos exentos/gravados agregados por SQL contra el recorrido por ORM."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Impuesto que se archiva después de contabilizar la factura
+        cls.tax_archived = cls.tax_purchase.copy({'name': "IVA Compras (archivado)"})
+        cls.move_taxed = cls._create_purchase([100.0, 50.0], cls.tax_purchase)
+        cls.move_exempt = cls._create_purchase([80.0], cls.env['account.tax'])
+        cls.move_mixed = cls._create_purchase([40.0], cls.tax_purchase, post=False)
+        cls.move_mixed.write({'invoice_line_ids': [Command.create({
+            'name': "Exento", 'price_unit': 25.0, 'quantity': 1, 'tax_ids': [Command.clear()],
+        })]})
+        cls.move_mixed.action_post()
+        cls.move_refund = cls._create_purchase([30.0], cls.tax_purchase, move_type='in_refund')
+        cls.move_archived = cls._create_purchase([200.0], cls.tax_archived)
+        cls.tax_archived.active = False
+        cls.moves = cls.move_taxed | cls.move_exempt | cls.move_mixed | cls.move_refund | cls.move_archived
+
+    def test_amounts_match_orm(self):
+        amounts = self.env['libro.compras.periodo']._get_amounts_by_move(self.moves.ids)
+        for move in self.moves:
+            expected = self._expected_compras_amounts(move)
+            exentas, gravadas = amounts[move.id]
+            self.assertAlmostEqual(exentas, expected['compras_internas_exentas'], msg=move.name)
+            self.assertAlmostEqual(gravadas, expected['compras_internas_gravadas'], msg=move.name)
+        # Línea mixta repartida; nota de crédito en positivo
+        self.assertEqual(amounts[self.move_mixed.id], (25.0, 40.0))
+        self.assertEqual(amounts[self.move_refund.id], (0.0, 30.0))
+
+    def test_lines_match_invoices(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+
+        self.assertEqual(periodo.invoice_line_ids.move_id, self.moves)
+        for move in self.moves:
+            line = periodo.invoice_line_ids.filtered(lambda l: l.move_id == move)
+            for name, expected in self._expected_compras_amounts(move).items():
+                self.assertAlmostEqual(line[name], expected, msg="%s de %s" % (name, move.name))
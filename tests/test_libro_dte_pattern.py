@@ -0,0 +1,50 @@
+from odoo import fields
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroDtePattern(LibroTestCommon):
+    """Tipo de documento de las facturas de proveedor calculado por SQL desde los patrones."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        no_tax = cls.env['account.tax']
+        cls.move_ccf = cls._create_purchase([10.0], no_tax, ref='CCF-0001')
+        cls.move_excluded = cls._create_purchase([10.0], no_tax, ref='DTE-14-0001')
+        cls.move_march = cls._create_purchase([10.0], no_tax, ref='ZZQ-0001')
+        cls.move_april = cls._create_purchase(
+            [10.0], no_tax, ref='ZZQ-0002', invoice_date=fields.Date.from_string('2024-04-15'))
+        cls.moves = cls.move_ccf | cls.move_excluded | cls.move_march | cls.move_april
+
+    def _detected(self, moves):
+        Pattern = self.env['libro.dte.pattern']
+        return {move.id: Pattern._detect_tipo_documento(move.ref, move.name) for move in moves}
+
+    def _stored(self, moves):
+        return {move.id: move.libro_tipo_documento for move in moves}
+
+    def test_backfill_matches_detection(self):
+        self.env.cr.execute(
+            'UPDATE account_move SET libro_tipo_documento = NULL WHERE id = ANY(%s)', [self.moves.ids])
+        self.env['account.move'].invalidate_model(['libro_tipo_documento'])
+
+        self.env['libro.dte.pattern']._backfill_tipo_documento()
+
+        self.assertEqual(self._stored(self.moves), self._detected(self.moves))
+        self.assertEqual(self.move_excluded.libro_tipo_documento, '14')
+        self.assertEqual(self.move_march.libro_tipo_documento, '03')
+        # Una segunda pasada no reescribe facturas sin cambios
+        self.assertEqual(self.env['libro.dte.pattern']._backfill_tipo_documento(), 0)
+
+    def test_new_pattern_skips_validated_books(self):
+        self._new_compras().write({'state': 'validated'})
+
+        self.env['libro.dte.pattern'].create({'patron': 'ZZQ', 'tipo_documento': '12', 'sequence': 1})
+
+        # Marzo tiene un libro validado: su factura conserva el tipo presentado
+        self.assertEqual(self.move_march.libro_tipo_documento, '03')
+        self.assertEqual(self.move_april.libro_tipo_documento, '12')
+        self.assertEqual(self.move_ccf.libro_tipo_documento, '03')
@@ -0,0 +1,45 @@
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroDuplicados(LibroTestCommon):
+    """DTE duplicados (mismo código de generación) dentro del libro."""
+
+    codigo = 'A1B2C3D4-0000-0000-0000-000000000001'
+
+    def _load_duplicates(self):
+        moves = self._create_purchase([10.0], self.tax_purchase, tgr_l10n_sv_edi_codigo_generacion=self.codigo) \
+            | self._create_purchase([10.0], self.tax_purchase, tgr_l10n_sv_edi_codigo_generacion=self.codigo.lower())
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        return periodo, periodo.invoice_line_ids.filtered(lambda l: l.move_id in moves)
+
+    def test_duplicate_dte_is_not_selected(self):
+        periodo, lines = self._load_duplicates()
+
+        # El primero en el orden del libro queda; el otro se marca sin seleccionar
+        duplicated = lines.filtered('dte_duplicado')
+        self.assertEqual(len(duplicated), 1)
+        self.assertFalse(duplicated.select)
+        self.assertTrue((lines - duplicated).select)
+
+        # Aunque el usuario la seleccione, al regenerar vuelve a quedar fuera
+        duplicated.select = True
+        periodo.action_load_invoices()
+        self.assertTrue(duplicated.dte_duplicado)
+        self.assertFalse(duplicated.select)
+
+    def test_selection_restored_when_no_longer_duplicate(self):
+        periodo, lines = self._load_duplicates()
+        duplicated = lines.filtered('dte_duplicado')
+
+        # Se anula la otra factura: el DTE ya no está repetido
+        original = (lines - duplicated).move_id
+        original.button_draft()
+        original.button_cancel()
+        periodo.action_load_invoices()
+
+        self.assertFalse(duplicated.dte_duplicado)
+        self.assertTrue(duplicated.select)
@@ -0,0 +1,57 @@
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroExportCache(LibroTestCommon):
+    """Exportaciones guardadas por la huella de las líneas incluidas."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.move_taxed = cls._create_purchase([100.0], cls.tax_purchase)
+        cls.move_exempt = cls._create_purchase([80.0], cls.env['account.tax'])
+        cls.periodo = cls._new_compras()
+        cls.periodo.action_load_invoices()
+
+    def setUp(self):
+        super().setUp()
+        self.env['ir.config_parameter'].sudo().set_param('libros_fiscales.export_guardar_copia', 'True')
+
+    def _key(self):
+        return self.periodo._export_cache_key('csv', self.periodo._get_export_domain())
+
+    def _attachments(self):
+        return self.env['ir.attachment'].search([
+            ('res_model', '=', self.periodo._name), ('res_id', '=', self.periodo.id),
+        ])
+
+    def test_unchanged_export_reuses_attachment(self):
+        self.assertEqual(self._key(), self._key())
+        content = self._stream(self.periodo, 'csv')
+        attachment = self._attachments()
+        self.assertEqual(attachment.description, self._key())
+        self.assertEqual(attachment.raw, content)
+
+        # Misma huella: se descarga el archivo guardado sin volver a generarlo
+        action = self.periodo._export_action('csv')
+        self.assertEqual(action['url'], f'/web/content/{attachment.id}?download=true')
+
+    def test_changed_lines_evict_stale_export(self):
+        self._stream(self.periodo, 'csv')
+        old_key = self._key()
+
+        self.periodo.invoice_line_ids.filtered(lambda l: l.move_id == self.move_exempt).select = False
+        self.assertNotEqual(self._key(), old_key)
+        self.assertFalse(self.periodo._export_action('csv')['url'].startswith('/web/content/'))
+
+        # La nueva exportación reemplaza a la anterior del mismo tipo
+        self._stream(self.periodo, 'csv')
+        self.assertEqual(self._attachments().mapped('description'), [self._key()])
+
+    def test_formats_are_cached_separately(self):
+        self._stream(self.periodo, 'csv')
+        xlsx_key = self.periodo._export_cache_key('xlsx', self.periodo._get_export_domain())
+        self.assertNotEqual(xlsx_key, self._key())
+        self.assertFalse(self.periodo._export_cache_lookup('xlsx', self.periodo._get_export_domain())[1])
@@ -0,0 +1,112 @@
+import csv
+import io
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroExports(LibroTestCommon):
+    """Archivos exportados contra las líneas del libro leídas por el ORM."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.move_taxed = cls._create_purchase([100.0, 50.0], cls.tax_purchase)
+        cls.move_exempt = cls._create_purchase([80.0], cls.env['account.tax'])
+        cls.move_other = cls._create_purchase([30.0], cls.tax_purchase)
+        cls.periodo = cls._new_compras()
+        cls.periodo.action_load_invoices()
+
+    def _csv_rows(self, content):
+        return list(csv.reader(io.StringIO(content.decode()), delimiter=';'))
+
+    def test_csv_matches_lines(self):
+        self.periodo.invoice_line_ids.filtered(lambda l: l.move_id == self.move_exempt).select = False
+
+        rows = self._csv_rows(self._stream(self.periodo, 'csv'))
+
+        lines = self.periodo.invoice_line_ids.filtered('select').sorted(lambda l: (l.sequence, l.id))
+        self.assertEqual(len(rows), len(lines))
+        for row, line in zip(rows, lines):
+            self.assertEqual(len(row), 21)
+            self.assertEqual(row[0], line.invoice_date.strftime('%d/%m/%Y'))
+            self.assertEqual(row[5], line.partner_id.name)
+            self.assertEqual(row[6], "%.2f" % line.compras_internas_exentas)
+            self.assertEqual(row[9], "%.2f" % line.compras_internas_gravadas)
+            self.assertEqual(row[13], "%.2f" % line.credito_fiscal)
+            self.assertEqual(row[14], "%.2f" % line.amount_total)
+            self.assertEqual(row[20], '3')
+
+    def test_csv_is_sent_in_chunks(self):
+        whole = self._stream(self.periodo, 'csv')
+        with patch.object(type(self.periodo), '_export_chunk_size', 10):
+            chunks = list(self.periodo._export_stream_chunks('csv'))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(chunks), whole)
+
+    def test_csv_copy_only_when_requested(self):
+        Attachment = self.env['ir.attachment']
+        domain = [('res_model', '=', self.periodo._name), ('res_id', '=', self.periodo.id)]
+        self._stream(self.periodo, 'csv')
+        self.assertFalse(Attachment.search(domain))
+
+        self.env['ir.config_parameter'].sudo().set_param('libros_fiscales.export_guardar_copia', 'True')
+        content = self._stream(self.periodo, 'csv')
+        attachment = Attachment.search(domain)
+        self.assertEqual(len(attachment), 1)
+        self.assertEqual(attachment.raw, content)
+
+    def test_action_streams_or_reuses_saved_copy(self):
+        # Sin copia guardada, la descarga va al controlador que genera mientras envía
+        action = self.periodo._export_action('csv')
+        self.assertEqual(action['url'], f'/libros_fiscales/export/{self.periodo._name}/{self.periodo.id}/csv')
+
+        self.env['ir.config_parameter'].sudo().set_param('libros_fiscales.export_guardar_copia', 'True')
+        self._stream(self.periodo, 'csv')
+        attachment = self.env['ir.attachment'].search([
+            ('res_model', '=', self.periodo._name), ('res_id', '=', self.periodo.id),
+        ])
+
+        # La copia se reutiliza aunque luego se desactive el parámetro
+        self.env['ir.config_parameter'].sudo().set_param('libros_fiscales.export_guardar_copia', 'False')
+        action = self.periodo._export_action('csv')
+        self.assertEqual(action['url'], f'/web/content/{attachment.id}?download=true')
+
+    def test_errors_before_streaming(self):
+        with self.assertRaises(UserError):
+            self.periodo._export_stream_info('pdf')
+        self.periodo.action_unselect_all()
+        with self.assertRaises(UserError):
+            self.periodo._export_stream_info('csv')
+
+    def _workbook(self):
+        try:
+            import openpyxl
+        except ImportError:
+            self.skipTest("openpyxl no está instalado")
+        return openpyxl.load_workbook(io.BytesIO(self._stream(self.periodo, 'xlsx')), read_only=True)
+
+    def test_excel_matches_lines(self):
+        header, *rows = self._workbook().active.iter_rows(values_only=True)
+
+        self.assertEqual(header[0], 'No')
+        lines = self.periodo.invoice_line_ids.sorted(lambda l: (l.sequence, l.id))
+        self.assertEqual(len(rows), len(lines))
+        for row, line in zip(rows, lines):
+            self.assertEqual(row[0], line.sequence)
+            self.assertEqual(row[9], line.partner_id.name)
+            self.assertAlmostEqual(row[10], line.compras_internas_exentas)
+            self.assertAlmostEqual(row[11], line.compras_internas_gravadas)
+            self.assertAlmostEqual(row[13], line.amount_total)
+
+    def test_excel_continues_on_new_sheet(self):
+        # Tres líneas con hojas de tres filas: encabezado + 2 y encabezado + 1
+        with patch.object(type(self.periodo), '_excel_max_rows', 3):
+            workbook = self._workbook()
+        self.assertEqual(workbook.sheetnames, ["Libro de Compras", "Libro de Compras (2)"])
+        sizes = [len(list(sheet.iter_rows(values_only=True))) for sheet in workbook.worksheets]
+        self.assertEqual(sizes, [3, 2])
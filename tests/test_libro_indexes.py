@@ -0,0 +1,35 @@
+from odoo.tests import TransactionCase, tagged
+from odoo.tools.sql import index_exists
+
+
+@tagged('post_install', '-at_install')
+class TestLibroIndexes(TransactionCase):
+    """Índices que crea el módulo para la carga, las exportaciones y las auditorías."""
+
+    def assertIndexes(self, names):
+        missing = [name for name in names if not index_exists(self.env.cr, name)]
+        self.assertFalse(missing, "Faltan índices: %s" % ', '.join(missing))
+
+    def test_line_indexes(self):
+        for table in ('libro_compras_line', 'libro_ventas_line'):
+            self.assertIndexes([
+                f'{table}_periodo_select_sequence_index',
+                f'{table}_move_id_index',
+                f'{table}_codigo_generacion_index',
+                f'{table}_numero_control_index',
+            ])
+
+    def test_loader_indexes(self):
+        self.assertIndexes([
+            'account_move_libro_company_type_state_date_index',
+            'account_move_libro_tipo_documento_index',
+        ])
+
+    def test_one_line_per_move_and_book(self):
+        self.env.cr.execute("""
+            SELECT conrelid::regclass::text
+              FROM pg_constraint
+             WHERE contype = 'u' AND conname = ANY(%s)
+        """, [['libro_compras_line_periodo_move_uniq', 'libro_ventas_line_periodo_move_uniq']])
+        self.assertEqual(sorted(table for table, in self.env.cr.fetchall()),
+                         ['libro_compras_line', 'libro_ventas_line'])
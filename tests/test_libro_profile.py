@@ -0,0 +1,57 @@
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroProfile(LibroTestCommon):
+    """Perfil de ejecución que deja cada generación y exportación del libro."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._create_purchase([100.0], cls.tax_purchase)
+        cls._create_purchase([200.0], cls.tax_purchase)
+        # Sujeto Excluido: se omite del libro
+        cls._create_purchase([50.0], cls.env['account.tax'], ref='DTE-14-0001')
+        cls.periodo = cls._new_compras()
+
+    def _profiles(self, operation):
+        return self.env['libro.generation.profile'].search([
+            ('res_model', '=', self.periodo._name),
+            ('res_id', '=', self.periodo.id),
+            ('operation', '=', operation),
+        ])
+
+    def test_load_records_profile(self):
+        self.periodo.action_load_invoices()
+
+        profile = self._profiles('load')
+        self.assertEqual(len(profile), 1)
+        self.assertEqual(profile.periodo, self.periodo.display_name)
+        self.assertEqual(profile.rows_read, 2)
+        self.assertEqual(profile.rows_written, 2)
+        self.assertEqual(profile.skipped, {'tipo_documento': 1})
+        self.assertEqual(profile.skipped_total, 1)
+        self.assertGreater(profile.query_count, 0)
+        self.assertTrue({'search', 'classification', 'insert', 'totals'} <= set(profile.stages))
+        self.assertAlmostEqual(profile.duration_search, profile.stages['search'], places=3)
+        self.assertGreaterEqual(profile.duration, profile.duration_insert)
+        self.assertGreater(profile.peak_memory_kb, 0)
+
+    def test_export_records_profile(self):
+        self.periodo.action_load_invoices()
+
+        self._stream(self.periodo, 'csv')
+
+        profile = self._profiles('csv')
+        self.assertEqual(len(profile), 1)
+        self.assertEqual(profile.rows_written, 2)
+        self.assertIn('write', profile.stages)
+        # La exportación no suma a la carga: cada ejecución tiene su perfil
+        self.assertEqual(len(self._profiles('load')), 1)
+
+    def test_profiles_action(self):
+        self.periodo.action_load_invoices()
+        action = self.periodo.action_view_profiles()
+        self.assertEqual(self.env['libro.generation.profile'].search(action['domain']), self._profiles('load'))
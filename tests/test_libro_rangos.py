@@ -0,0 +1,65 @@
+from datetime import date
+
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroRangos(LibroTestCommon):
+    """Documentos impresos consecutivos del CSV de Consumidor Final informados por rango."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.periodo = cls._new_ventas(tipo_libro='consumidor', csv_rangos_impresos=True)
+        cls.amount_fields = cls.periodo._consumidor_csv_amount_fields
+
+    def _row(self, numero, day=15, codigo=False, amount=10.0, tipo='01'):
+        row = dict.fromkeys(self.amount_fields, 0.0)
+        row.update({
+            'invoice_date': date(2024, 3, day),
+            'tipo_documento': tipo,
+            'tipo_operacion_renta': '1',
+            'tipo_ingreso_renta': '3',
+            'codigo_generacion': codigo,
+            'numero_documento': numero,
+            'numero_control': numero and 'CTRL-%s' % numero,
+            'ventas_gravadas_locales': amount,
+            'amount_total': amount,
+        })
+        return row
+
+    def _compress(self, rows):
+        return list(self.periodo._compress_printed_ranges(iter(rows), self.amount_fields))
+
+    def test_consecutive_printed_documents_become_one_range(self):
+        rows = self._compress([self._row('A-0001'), self._row('A-0002', amount=5.0), self._row('A-0003')])
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['numero_documento'], 'A-0001')
+        self.assertEqual(rows[0]['numero_documento_al'], 'A-0003')
+        self.assertEqual(rows[0]['numero_control_al'], 'CTRL-A-0003')
+        self.assertAlmostEqual(rows[0]['ventas_gravadas_locales'], 25.0)
+
+    def test_ranges_break_on_gap_day_series_and_type(self):
+        rows = self._compress([
+            self._row('A-0001'),
+            self._row('A-0003'),              # salto en la numeración
+            self._row('A-0004', day=16),      # otro día
+            self._row('B-0005', day=16),      # otra serie
+            self._row('B-0006', day=16, tipo='02'),  # otro tipo de documento
+        ])
+        self.assertEqual([row['numero_documento'] for row in rows], ['A-0001', 'A-0003', 'A-0004', 'B-0005', 'B-0006'])
+        self.assertFalse(any('numero_documento_al' in row for row in rows))
+
+    def test_dte_stay_individual(self):
+        dte = [self._row('DTE-1', codigo='CODIGO-1'), self._row('DTE-2', codigo='CODIGO-2')]
+        rows = self._compress([self._row('A-0001'), dte[0], self._row('A-0002'), dte[1], self._row('SIN-NUMERO')])
+
+        # Los DTE salen tal cual sin cortar el rango de los impresos, que se
+        # emite al cerrarse
+        self.assertEqual(rows[:2], dte)
+        self.assertEqual(rows[2]['numero_documento_al'], 'A-0002')
+        self.assertEqual(rows[3]['numero_documento'], 'SIN-NUMERO')
+        self.assertEqual(len(rows), 4)
@@ -0,0 +1,87 @@
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroRegeneration(LibroTestCommon):
+    """Regenerar un libro en borrador solo toca las líneas de facturas que cambiaron."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.move_a = cls._create_purchase([100.0, 50.0], cls.tax_purchase)
+        cls.move_b = cls._create_purchase([80.0], cls.env['account.tax'])
+        cls.move_c = cls._create_purchase([30.0], cls.tax_purchase)
+
+    def _line(self, periodo, move):
+        return periodo.invoice_line_ids.filtered(lambda l: l.move_id == move)
+
+    def test_unchanged_book_is_not_rewritten(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        before = self._stored_values(periodo.invoice_line_ids)
+        lines_values = periodo._prepare_book_lines(periodo._get_book_moves(), {})
+
+        stats = self.env['libro.compras.line']._sync_period_lines(periodo, lines_values)
+
+        self.assertEqual(stats, {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 3})
+        self.assertEqual(self._stored_values(periodo.invoice_line_ids), before)
+
+    def test_regeneration_keeps_user_columns(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        line = self._line(periodo, self.move_a)
+        line.write({
+            'clasificacion': '2',
+            'sector': '2',
+            'dui_proveedor': '012345678',
+            'internaciones_exentas': 10.0,
+        })
+        before = self._stored_values(periodo.invoice_line_ids - line)
+
+        self.move_a.button_draft()
+        self.move_a.invoice_line_ids[0].price_unit = 300.0
+        self.move_a.action_post()
+        periodo.action_load_invoices()
+
+        # Misma línea, montos nuevos y ajustes del usuario intactos
+        self.assertEqual(self._line(periodo, self.move_a), line)
+        for name, expected in self._expected_compras_amounts(self.move_a).items():
+            self.assertAlmostEqual(line[name], expected)
+        self.assertEqual(line.clasificacion, '2')
+        self.assertEqual(line.sector, '2')
+        self.assertEqual(line.dui_proveedor, '012345678')
+        # Columna completada a mano que el cargador no escribe
+        self.assertAlmostEqual(line.internaciones_exentas, 10.0)
+        # Las líneas sin cambios no se reescriben
+        self.assertEqual(self._stored_values(periodo.invoice_line_ids - line), before)
+
+    def test_moves_leaving_the_period_are_removed(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        kept = periodo.invoice_line_ids - self._line(periodo, self.move_b)
+
+        self.move_b.button_draft()
+        new_move = self._create_purchase([60.0], self.tax_purchase)
+        periodo.action_load_invoices()
+
+        self.assertEqual(periodo.invoice_line_ids.move_id, self.move_a | self.move_c | new_move)
+        self.assertTrue(kept <= periodo.invoice_line_ids)
+
+    def test_loader_optional_columns_reset(self):
+        # Venta válida que luego se anula: sus columnas de montos válidos vuelven a 0
+        move = self._create_sale([100.0], self.tax_sale)
+        periodo = self._new_ventas()
+        Line = self.env['libro.ventas.line']
+        Line._sync_period_lines(periodo, periodo._prepare_book_lines(move, {}))
+        line = Line.search([('periodo_id', '=', periodo.id)])
+        self.assertAlmostEqual(line.ventas_gravadas_locales, 100.0)
+
+        move.button_draft()
+        move.button_cancel()
+        Line._sync_period_lines(periodo, periodo._prepare_book_lines(move, {}))
+
+        self.assertEqual(Line.search([('periodo_id', '=', periodo.id)]), line)
+        self.assertAlmostEqual(line.ventas_gravadas_locales, 0.0)
+        self.assertAlmostEqual(line.ventas_gravadas, 100.0)
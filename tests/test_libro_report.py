@@ -0,0 +1,63 @@
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroReport(LibroTestCommon):
+    """Datos paginados del PDF y renderizado por tramos."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._create_purchase([100.0, 50.0], cls.tax_purchase)
+        cls._create_purchase([80.0], cls.env['account.tax'])
+        cls._create_purchase([30.0], cls.tax_purchase)
+        cls.periodo = cls._new_compras()
+        cls.periodo.action_load_invoices()
+
+    def test_pages_carry_forward(self):
+        periodo = self.periodo
+        amount_fields = periodo._report_amount_fields
+        with patch.object(type(periodo), '_report_lines_per_page', 1):
+            data = periodo._get_report_pages()
+            tail = periodo._get_report_pages(page_from=1, page_to=3)
+
+        pages = data['pages']
+        self.assertEqual([page['number'] for page in pages], [1, 2, 3])
+        self.assertEqual(pages[0]['vienen'], dict.fromkeys(amount_fields, 0.0))
+        for previous, page in zip(pages, pages[1:]):
+            self.assertEqual(page['vienen'], previous['van'])
+        for page in pages:
+            line = page['lines'][0]
+            for name in amount_fields:
+                self.assertAlmostEqual(page['van'][name] - page['vienen'][name], line[name])
+        for name in periodo._libro_total_fields:
+            self.assertAlmostEqual(data['book_totals'][name], periodo[name])
+        self.assertAlmostEqual(data['totals']['amount_total'], sum(periodo.invoice_line_ids.mapped('amount_total')))
+
+        # Un tramo intermedio arranca con el acarreo de las páginas anteriores
+        self.assertEqual(tail['pages'], pages[1:])
+        self.assertFalse(pages[1]['ends_chunk'])
+        self.assertTrue(pages[2]['is_last'])
+
+    def test_chunks_render_sequentially_by_default(self):
+        periodo = self.periodo
+        Report = type(self.env['ir.actions.report'])
+        with patch.object(type(periodo), '_report_lines_per_page', 1), \
+                patch.object(type(periodo), '_report_pages_per_chunk', 1), \
+                patch.object(Report, '_render_qweb_pdf', autospec=True, return_value=(b'%PDF', 'pdf')) as render, \
+                patch.object(type(periodo), '_render_report_chunk') as render_chunk, \
+                patch('odoo.addons.libros_fiscales.models.libro_periodo_mixin.pdf.merge_pdf',
+                      return_value=b'%PDF merged') as merge:
+            periodo.action_print_report()
+
+        # Sin ``libros_fiscales.pdf_procesos`` no se abren hilos ni cursores
+        render_chunk.assert_not_called()
+        self.assertEqual(
+            [call.kwargs['data'] for call in render.call_args_list],
+            [{'page_from': 0, 'page_to': 1}, {'page_from': 1, 'page_to': 2}, {'page_from': 2, 'page_to': 3}],
+        )
+        merge.assert_called_once_with([b'%PDF'] * 3)
@@ -0,0 +1,72 @@
+from datetime import date
+
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroResumenDiario(LibroTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.move = cls.init_invoice('out_invoice', partner=cls.partner_a, invoice_date=cls.invoice_date,
+                                    amounts=[100.0], post=True)
+        cls.periodo = cls.env['libro.ventas.periodo'].create({
+            'company_id': cls.env.company.id,
+            'year': cls.year,
+            'month': cls.month,
+            'tipo_libro': 'consumidor',
+        })
+
+    def _line(self, day, numero, amount, codigo_generacion=False):
+        return self.env['libro.ventas.line'].create({
+            'periodo_id': self.periodo.id,
+            'move_id': self.move.id,
+            'invoice_date': date(2024, 3, day),
+            'tipo_documento': '01',
+            'numero_documento': numero,
+            'codigo_generacion': codigo_generacion,
+            'ventas_gravadas_locales': amount,
+            'amount_total': amount,
+        })
+
+    def _resumen(self):
+        return {
+            (row.date.day, row.clase): (row.documentos, row.documento_del, row.documento_al, row.amount_total)
+            for row in self.periodo.resumen_diario_ids
+        }
+
+    def test_edits_update_only_their_group(self):
+        first = self._line(1, '0001', 10.0)
+        self._line(1, '0002', 20.0)
+        self._line(2, '0003', 5.0)
+        self._line(2, 'DTE-1', 7.0, codigo_generacion='ABC')
+        self.assertEqual(self._resumen(), {
+            (1, '1'): (2, '0001', '0002', 30.0),
+            (2, '1'): (1, '0003', '0003', 5.0),
+            (2, '4'): (1, 'DTE-1', 'DTE-1', 7.0),
+        })
+        untouched = self.periodo.resumen_diario_ids.filtered(lambda row: row.date.day == 2)
+
+        first.amount_total = 15.0
+        self.assertEqual(self._resumen()[(1, '1')], (2, '0001', '0002', 35.0))
+
+        # Mover la línea a otro día actualiza ambos grupos
+        first.invoice_date = date(2024, 3, 2)
+        self.assertEqual(self._resumen()[(1, '1')], (1, '0002', '0002', 20.0))
+        self.assertEqual(self._resumen()[(2, '1')], (2, '0001', '0003', 20.0))
+
+        first.unlink()
+        self.assertEqual(self._resumen()[(2, '1')], (1, '0003', '0003', 5.0))
+        # El grupo DTE del día 2 no se recalculó
+        self.assertIn(untouched.filtered(lambda row: row.clase == '4'), self.periodo.resumen_diario_ids)
+
+    def test_matches_full_rebuild(self):
+        self._line(1, '0001', 10.0)
+        line = self._line(3, '0002', 20.0)
+        line.write({'amount_total': 25.0, 'invoice_date': date(2024, 3, 4)})
+        incremental = self._resumen()
+        self.periodo._rebuild_resumen_diario()
+        self.assertEqual(self._resumen(), incremental)
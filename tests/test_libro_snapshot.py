@@ -0,0 +1,58 @@
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroSnapshot(LibroTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.moves = cls._create_purchase([100.0, 50.0], cls.tax_purchase) \
+            | cls._create_purchase([80.0], cls.env['account.tax'])
+
+    def test_mark_done_validates_and_freezes(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        self.assertEqual(len(periodo.invoice_line_ids), 2)
+
+        periodo.action_mark_done()
+
+        self.assertEqual(periodo.state, 'validated')
+        self.assertTrue(periodo.snapshot_checksum)
+        self.assertTrue(periodo._has_snapshot())
+        snapshot = periodo._load_snapshot()
+        self.assertEqual(snapshot['count'], 2)
+        self.assertEqual(sorted(snapshot['columns']['move_id']), sorted(self.moves.ids))
+        self.assertAlmostEqual(snapshot['totals']['total_credito_fiscal'], periodo.total_credito_fiscal)
+
+    def test_validated_book_is_locked(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        periodo.action_mark_done()
+        with self.assertRaises(UserError):
+            periodo.write({'comentarios': "cambio"})
+
+    def test_exports_come_from_snapshot(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        before = self._stream(periodo, 'csv')
+        periodo.action_mark_done()
+
+        # Cambios posteriores al contacto no alteran lo presentado
+        self.partner_a.name = "Proveedor Renombrado"
+        self.assertEqual(self._stream(periodo, 'csv'), before)
+        rows = list(periodo._read_book_rows(periodo._get_export_domain(), ['sequence']))
+        self.assertNotIn("Proveedor Renombrado", {row['partner_name'] for row in rows})
+
+    def test_reset_to_draft_reads_tables_again(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        periodo.action_mark_done()
+        periodo.action_reset_to_draft()
+        self.assertEqual(periodo.state, 'draft')
+        self.assertFalse(periodo._has_snapshot())
+        self.partner_a.name = "Proveedor Renombrado"
+        self.assertIn("Proveedor Renombrado".encode(), self._stream(periodo, 'csv'))
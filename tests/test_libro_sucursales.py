@@ -0,0 +1,45 @@
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroSucursales(LibroTestCommon):
+    """Jerarquía de sucursales a cualquier nivel para los libros consolidados."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Company = cls.env['res.company']
+        cls.root = cls.env.company
+        cls.branch = Company.create({'name': "Sucursal", 'parent_id': cls.root.id})
+        cls.sub_branch = Company.create({'name': "Sub-sucursal", 'parent_id': cls.branch.id})
+        cls.other = Company.create({'name': "Otra Casa Matriz"})
+
+    def test_branch_ids_include_all_levels(self):
+        Company = self.env['res.company']
+        self.assertEqual(set(Company._libro_get_branch_ids(self.root.id)),
+                         {self.root.id, self.branch.id, self.sub_branch.id})
+        self.assertEqual(set(Company._libro_get_branch_ids(self.branch.id)), {self.branch.id, self.sub_branch.id})
+        self.assertEqual(Company._libro_get_root_id(self.sub_branch.id), self.root.id)
+        self.assertEqual(Company._libro_get_root_id(self.other.id), self.other.id)
+
+    def test_consolidated_book_companies(self):
+        periodo = self._new_compras(incluir_sucursales=True)
+        self.assertEqual(set(periodo._get_book_company_ids()), {self.root.id, self.branch.id, self.sub_branch.id})
+        self.assertEqual(periodo._get_report_company(), self.root)
+
+        periodo_branch = self._new_compras(company_id=self.sub_branch.id, incluir_sucursales=True)
+        self.assertEqual(periodo_branch._get_book_company_ids(), [self.sub_branch.id])
+        self.assertEqual(periodo_branch._get_report_company(), self.root)
+
+        periodo_single = self._new_compras(company_id=self.branch.id)
+        self.assertEqual(periodo_single._get_book_company_ids(), [self.branch.id])
+        self.assertEqual(periodo_single._get_report_company(), self.branch)
+
+    def test_new_branch_invalidates_cache(self):
+        Company = self.env['res.company']
+        self.assertNotIn(self.other.id, Company._libro_get_branch_ids(self.root.id))
+        new_branch = Company.create({'name': "Sucursal Nueva", 'parent_id': self.sub_branch.id})
+        self.assertIn(new_branch.id, Company._libro_get_branch_ids(self.root.id))
+        self.assertEqual(Company._libro_get_root_id(new_branch.id), self.root.id)
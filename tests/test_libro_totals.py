@@ -0,0 +1,53 @@
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroTotals(LibroTestCommon):
+    """Totales almacenados del libro contra la suma de sus líneas."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.move_taxed = cls._create_purchase([100.0, 50.0], cls.tax_purchase)
+        cls.move_exempt = cls._create_purchase([80.0], cls.env['account.tax'])
+        cls.sale_taxed = cls._create_sale([100.0, 50.0], cls.tax_sale)
+        cls.sale_exempt = cls._create_sale([80.0], cls.env['account.tax'])
+
+    def _assert_compras_totals(self, periodo):
+        # Leer los totales desde la base de datos, no desde la caché
+        periodo.invalidate_recordset(periodo._libro_total_fields)
+        lines = periodo.invoice_line_ids
+        self.assertAlmostEqual(periodo.total_internas_exentas, sum(lines.mapped('compras_internas_exentas')))
+        self.assertAlmostEqual(periodo.total_internas_gravadas, sum(lines.mapped('compras_internas_gravadas')))
+        self.assertAlmostEqual(periodo.total_credito_fiscal, sum(lines.mapped('credito_fiscal')))
+
+    def test_compras_totals_match_lines(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        self.assertTrue(periodo.invoice_line_ids)
+        self._assert_compras_totals(periodo)
+
+    def test_compras_totals_follow_line_edits(self):
+        periodo = self._new_compras()
+        periodo.action_load_invoices()
+        line = periodo.invoice_line_ids.filtered(lambda l: l.move_id == self.move_exempt)
+
+        line.compras_internas_exentas = 90.0
+        self._assert_compras_totals(periodo)
+
+        line.unlink()
+        self._assert_compras_totals(periodo)
+
+    def test_ventas_totals_match_lines(self):
+        periodo = self._new_ventas()
+        moves = self.sale_taxed | self.sale_exempt
+        self.env['libro.ventas.line']._sync_period_lines(periodo, periodo._prepare_book_lines(moves, {}))
+        periodo.invalidate_recordset(periodo._libro_total_fields)
+
+        lines = periodo.invoice_line_ids
+        self.assertEqual(lines.move_id, moves)
+        self.assertAlmostEqual(periodo.total_ventas_exentas, sum(lines.mapped('ventas_exentas')))
+        self.assertAlmostEqual(periodo.total_ventas_gravadas, sum(lines.mapped('ventas_gravadas')))
+        self.assertAlmostEqual(periodo.total_debito_fiscal, sum(lines.mapped('debito_fiscal')))
@@ -0,0 +1,64 @@
+from odoo.tests import tagged
+
+from odoo.addons.libros_fiscales.models.libro_validation_finding import (
+    libro_check_dui, libro_check_nit, libro_check_nrc,
+)
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroValidation(LibroTestCommon):
+    """Revisión previa a la exportación sobre las columnas del libro."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        partner_vals = {'vat': '0614-010190-101-1'}
+        if 'l10n_sv_nrc' in cls.env['res.partner']._fields:
+            partner_vals['l10n_sv_nrc'] = '123456-7'
+        cls.partner_a.write(partner_vals)
+        cls.partner_b.write({'vat': False})
+        cls.move_ok = cls._create_purchase([100.0], cls.tax_purchase)
+        cls.move_credito = cls._create_purchase([200.0], cls.tax_purchase)
+        cls.move_no_vat = cls._create_purchase([50.0], cls.tax_purchase, partner_id=cls.partner_b.id)
+        cls.periodo = cls._new_compras()
+        cls.periodo.action_load_invoices()
+
+    def _rules_by_move(self, findings):
+        move_by_line = {line.id: line.move_id for line in self.periodo.invoice_line_ids}
+        rules = {}
+        for finding in findings:
+            rules.setdefault(move_by_line[finding.line_id], set()).add(finding.rule)
+        return rules
+
+    def test_identity_checks(self):
+        self.assertTrue(libro_check_dui('12345678-4'))
+        self.assertFalse(libro_check_dui('12345678-5'))
+        self.assertTrue(libro_check_nit('0614-010190-101-1'))
+        self.assertTrue(libro_check_nit('123456784'))
+        self.assertFalse(libro_check_nit('0614-0101'))
+        self.assertTrue(libro_check_nrc('123456-7'))
+        self.assertFalse(libro_check_nrc('1'))
+
+    def test_findings_per_line(self):
+        line = self.periodo.invoice_line_ids.filtered(lambda l: l.move_id == self.move_credito)
+        line.credito_fiscal = line.credito_fiscal + 5.0
+
+        findings = self.periodo._run_book_validation()
+        rules = self._rules_by_move(findings)
+
+        self.assertIn('credito_fiscal', rules[self.move_credito])
+        self.assertIn('totales', rules[self.move_credito])
+        self.assertIn('documento_identidad', rules[self.move_no_vat])
+        self.assertFalse(rules.get(self.move_ok, set()) & {'credito_fiscal', 'totales', 'documento_identidad'})
+        self.assertTrue(all(finding.res_id == self.periodo.id for finding in findings))
+
+    def test_validation_replaces_previous_findings(self):
+        first = self.periodo._run_book_validation()
+        self.periodo.invoice_line_ids.filtered(lambda l: l.move_id == self.move_no_vat).select = False
+
+        second = self.periodo._run_book_validation()
+
+        self.assertFalse(first.exists())
+        self.assertNotIn(self.move_no_vat, self._rules_by_move(second))
+        self.assertEqual(self.periodo.validation_error_count, len(second.filtered(lambda f: f.severity == 'error')))
@@ -0,0 +1,55 @@
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroVentasClassification(LibroTestCommon):
+    """Clasificación de las facturas de venta con el mapa de impuestos en caché."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Impuesto que se archiva después de contabilizar la factura
+        cls.tax_archived = cls.tax_sale.copy({'name': "IVA Ventas (archivado)"})
+        cls.move_taxed = cls._create_sale([100.0, 50.0], cls.tax_sale)
+        cls.move_exempt = cls._create_sale([80.0], cls.env['account.tax'])
+        cls.move_archived = cls._create_sale([200.0], cls.tax_archived)
+        cls.tax_archived.active = False
+        cls.moves = cls.move_taxed | cls.move_exempt | cls.move_archived
+        cls.periodo = cls._new_ventas()
+
+    def _lines_values(self):
+        return self.periodo._prepare_book_lines(self.moves, {})
+
+    def test_amounts_match_invoices(self):
+        values = {vals['move_id']: vals for vals in self._lines_values()}
+        for move in self.moves:
+            vals = values[move.id]
+            taxed = bool(move.invoice_line_ids.tax_ids)
+            self.assertAlmostEqual(vals['ventas_gravadas'], move.amount_untaxed if taxed else 0.0)
+            self.assertAlmostEqual(vals['ventas_exentas'], 0.0 if taxed else move.amount_untaxed)
+            self.assertAlmostEqual(vals['debito_fiscal'], move.amount_total - move.amount_untaxed)
+            self.assertAlmostEqual(vals['amount_total'], move.amount_total)
+        self.assertEqual(sorted(vals['sequence'] for vals in values.values()), [1, 2, 3])
+
+    def test_batch_classification_matches_single_invoice(self):
+        # El mapa de impuestos por lote clasifica igual que la consulta por factura
+        for vals in self._lines_values():
+            move = self.env['account.move'].browse(vals['move_id'])
+            self.assertEqual(self.periodo._prepare_posted_line_values(move, vals['sequence']), vals)
+
+    def test_cache_cleared_only_by_relevant_changes(self):
+        Tax = self.env['account.tax']
+        company_id = self.tax_sale.company_id.id
+        with patch.object(type(self.env.registry), 'clear_cache', autospec=True) as clear_cache:
+            self.tax_sale.description = "IVA 13%"
+            clear_cache.assert_not_called()
+            self.tax_sale.libro_clasificacion = 'exento'
+            clear_cache.assert_called_once()
+
+        # Tras invalidar, el mapa refleja la nueva clasificación
+        self.env.registry.clear_cache()
+        self.assertEqual(Tax._libro_tax_classification(company_id)[self.tax_sale.id], 'exento')
@@ -0,0 +1,49 @@
+from odoo.tests import tagged
+
+from .common import LibroTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestLibroVentasScan(LibroTestCommon):
+    """Válidas y anuladas del periodo se leen y separan en una sola pasada."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.doc_type = cls.env['l10n_latam.document.type'].search([('code', '=', '03')], limit=1)
+        values = {'l10n_latam_document_type_id': cls.doc_type.id} if cls.doc_type else {}
+        cls.posted = cls._create_sale([100.0], cls.tax_sale, **values)
+        cls.cancelled = cls._create_sale([50.0], cls.tax_sale, **values)
+        cls.cancelled.button_draft()
+        cls.cancelled.button_cancel()
+        cls.draft = cls._create_sale([70.0], cls.tax_sale, post=False, **values)
+        cls.periodo = cls._new_ventas()
+
+    def test_search_reads_posted_and_cancelled(self):
+        if not self.doc_type or self.posted.l10n_latam_document_type_id != self.doc_type:
+            self.skipTest("Sin tipo de documento 03 en la localización")
+        moves = self.periodo._get_book_moves()
+        self.assertEqual(moves, self.posted | self.cancelled)
+
+    def test_split_numbers_each_tab(self):
+        counters = {}
+        values = self.periodo._prepare_book_lines(self.posted | self.cancelled, counters)
+
+        self.assertEqual(counters, {'posted': 1, 'cancel': 1})
+        by_move = {vals['move_id']: vals for vals in values}
+        self.assertEqual(by_move[self.posted.id]['sequence'], 1)
+        self.assertEqual(by_move[self.cancelled.id]['sequence'], 1)
+        self.assertAlmostEqual(by_move[self.cancelled.id]['ventas_gravadas'], 50.0)
+
+        self.env['libro.ventas.line']._sync_period_lines(self.periodo, values)
+        self.assertEqual(self.periodo.invoice_line_ids.move_id, self.posted)
+        self.assertEqual(self.periodo.invoice_line_ids_cancelled.move_id, self.cancelled)
+        # Las anuladas no suman a los totales
+        self.assertAlmostEqual(self.periodo.total_ventas_gravadas, self.posted.amount_untaxed)
+
+    def test_numbering_continues_between_chunks(self):
+        counters = {}
+        self.periodo._prepare_book_lines(self.posted, counters)
+        values = self.periodo._prepare_book_lines(self.cancelled | self._create_sale([10.0], self.tax_sale), counters)
+        self.assertEqual(counters, {'posted': 2, 'cancel': 1})
+        self.assertEqual(sorted(vals['sequence'] for vals in values), [1, 2])
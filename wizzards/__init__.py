@@ -1,3 +1,4 @@
 from . import libro_compras_wizard
 from . import libro_ventas_wizard
-from . import libro_rectify_wizard
\ No newline at end of file
+from . import libro_rectify_wizard
+from . import libro_batch_wizard
\ No newline at end of file
@@ -0,0 +1,194 @@
+import logging
+
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+MONTHS = [
+    ('01', 'Enero'), ('02', 'Febrero'), ('03', 'Marzo'), ('04', 'Abril'),
+    ('05', 'Mayo'), ('06', 'Junio'), ('07', 'Julio'), ('08', 'Agosto'),
+    ('09', 'Septiembre'), ('10', 'Octubre'), ('11', 'Noviembre'), ('12', 'Diciembre')
+]
+
+
+class LibroBatchWizard(models.TransientModel):
+    _name = 'libro.batch.wizard'
+    _description = 'Asistente para generar Libros de IVA por lotes'
+
+    company_ids = fields.Many2many('res.company', string='Empresas', required=True,
+                                   default=lambda self: self.env.company)
+    year = fields.Integer(string='Año', required=True, default=lambda self: fields.Date.context_today(self).year)
+    month_from = fields.Selection(MONTHS, string='Desde el Mes', required=True)
+    month_to = fields.Selection(MONTHS, string='Hasta el Mes', required=True)
+
+    libro_compras = fields.Boolean(string='Libro de Compras', default=True)
+    libro_consumidor = fields.Boolean(string='Ventas a Consumidor Final', default=True)
+    libro_credito = fields.Boolean(string='Ventas a Contribuyentes (Crédito Fiscal)', default=True)
+
+    incluir_sucursales = fields.Boolean(string='Incluir Todas las Sucursales', default=False)
+    contador_name = fields.Char(string='Nombre del Contador')
+
+    state = fields.Selection([('draft', 'Borrador'), ('done', 'En Cola')], default='draft')
+    result_ids = fields.One2many('libro.batch.wizard.result', 'wizard_id', string='Resultados', readonly=True)
+
+    def _get_months(self):
+        self.ensure_one()
+        if self.month_from > self.month_to:
+            raise UserError("El mes inicial debe ser anterior o igual al mes final.")
+        return [code for code, _name in MONTHS if self.month_from <= code <= self.month_to]
+
+    def _get_or_create_periodos(self):
+        """Libros del lote, creando los que falten.
+
+        :return: lista de (libro, tipo) en el orden de proceso
+        """
+        self.ensure_one()
+        Compras = self.env['libro.compras.periodo']
+        Ventas = self.env['libro.ventas.periodo']
+        tipos_ventas = [tipo for tipo, enabled in (('consumidor', self.libro_consumidor),
+                                                   ('credito', self.libro_credito)) if enabled]
+        books = []
+        for company in self.company_ids:
+            for month in self._get_months():
+                base_vals = {
+                    'company_id': company.id,
+                    'year': self.year,
+                    'month': month,
+                }
+                create_vals = dict(base_vals, incluir_sucursales=self.incluir_sucursales,
+                                   contador_name=self.contador_name)
+                if self.libro_compras:
+                    periodo = Compras.search([(k, '=', v) for k, v in base_vals.items()], limit=1)
+                    books.append((periodo or Compras.create(create_vals), 'compras'))
+                for tipo in tipos_ventas:
+                    domain = [(k, '=', v) for k, v in base_vals.items()] + [('tipo_libro', '=', tipo)]
+                    periodo = Ventas.search(domain, limit=1)
+                    books.append((periodo or Ventas.create(dict(create_vals, tipo_libro=tipo)), tipo))
+        return books
+
+    def action_generate(self):
+        """Encolar Generar Detalle de todos los libros del lote.
+
+        Cada libro se procesa en segundo plano por el cron de generación (por
+        lotes, con su propia transacción y progreso), así el lote no depende
+        del tiempo máximo de la petición. El avance se ve en los resultados.
+        """
+        self.ensure_one()
+        if not (self.libro_compras or self.libro_consumidor or self.libro_credito):
+            raise UserError("Seleccione al menos un tipo de libro.")
+
+        books = self._get_or_create_periodos()
+        results = []
+        for periodo, tipo in books:
+            if periodo.state != 'draft':
+                results.append(self._batch_result(periodo, tipo, 'skipped', message="Libro validado"))
+            elif periodo.generation_state in ('queued', 'running'):
+                results.append(self._batch_result(periodo, tipo, 'skipped',
+                                                  message="Generación en segundo plano en curso"))
+            else:
+                try:
+                    with self.env.cr.savepoint():
+                        periodo.action_load_invoices_background()
+                except UserError as e:
+                    results.append(self._batch_result(periodo, tipo, 'error', message=str(e)))
+                else:
+                    results.append(self._batch_result(periodo, tipo, 'queued'))
+
+        _logger.info("Generación por lotes: %s libros, %s en cola", len(books),
+                     sum(1 for vals in results if vals['status'] == 'queued'))
+        self.write({
+            'state': 'done',
+            'result_ids': [(5, 0, 0)] + [(0, 0, vals) for vals in results],
+        })
+        return self.action_refresh()
+
+    def action_refresh(self):
+        """Volver a mostrar el asistente con el avance actual de cada libro."""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    @api.model
+    def _batch_result(self, periodo, tipo, status, message=False):
+        return {
+            'company_id': periodo.company_id.id,
+            'periodo': periodo.periodo,
+            'tipo': tipo,
+            'res_model': periodo._name,
+            'res_id': periodo.id,
+            'status': status,
+            'message': message,
+        }
+
+
+class LibroBatchWizardResult(models.TransientModel):
+    _name = 'libro.batch.wizard.result'
+    _description = 'Resultado de la generación por lotes'
+    _order = 'status, company_id, periodo'
+
+    wizard_id = fields.Many2one('libro.batch.wizard', required=True, ondelete='cascade')
+    company_id = fields.Many2one('res.company', string='Empresa')
+    periodo = fields.Char(string='Periodo')
+    tipo = fields.Selection([
+        ('compras', 'Compras'),
+        ('consumidor', 'Ventas Consumidor Final'),
+        ('credito', 'Ventas Crédito Fiscal'),
+    ], string='Libro')
+    res_model = fields.Char(string='Modelo')
+    res_id = fields.Integer(string='ID')
+    status = fields.Selection([
+        ('error', 'Error'),
+        ('queued', 'En Cola'),
+        ('skipped', 'Omitido'),
+    ], string='Estado')
+    message = fields.Char(string='Detalle')
+
+    # Avance de la generación en segundo plano, leído del libro
+    generation_state = fields.Selection([
+        ('none', 'Sin generación'),
+        ('queued', 'En cola'),
+        ('running', 'Generando'),
+        ('done', 'Terminada'),
+        ('failed', 'Con error'),
+    ], string='Generación', compute='_compute_generation')
+    generation_progress = fields.Float(string='Progreso', compute='_compute_generation')
+    generation_error = fields.Text(string='Error de Generación', compute='_compute_generation')
+    generation_duration = fields.Float(string='Duración (s)', digits=(16, 1), compute='_compute_generation',
+                                       help='Tiempo de proceso de los lotes del libro desde que se lanzó el asistente.')
+
+    def _compute_generation(self):
+        # Suma de los perfiles de cada lote (ver libro.generation.profile)
+        since = [date for date in self.mapped('create_date') if date]
+        domain = [
+            ('operation', '=', 'load_chunk'),
+            ('res_model', 'in', list(set(filter(None, self.mapped('res_model'))))),
+            ('res_id', 'in', self.mapped('res_id')),
+        ]
+        if since:
+            domain.append(('date', '>=', min(since)))
+        durations = {
+            (res_model, res_id): duration
+            for res_model, res_id, duration in self.env['libro.generation.profile'].sudo()._read_group(
+                domain, ['res_model', 'res_id'], ['duration:sum'])
+        }
+        for rec in self:
+            periodo = self.env[rec.res_model].browse(rec.res_id).exists() if rec.res_model else None
+            rec.generation_state = periodo.generation_state if periodo else False
+            rec.generation_progress = periodo.generation_progress if periodo else 0.0
+            rec.generation_error = periodo.generation_error if periodo else False
+            rec.generation_duration = durations.get((rec.res_model, rec.res_id), 0.0)
+
+    def action_open_book(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self.res_model,
+            'res_id': self.res_id,
+            'view_mode': 'form',
+        }